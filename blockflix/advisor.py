@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Index advisor, runs ``EXPLAIN`` against the registered hot-path queries."""
+from collections import OrderedDict, namedtuple
+
+from blockflix.extensions import db
+
+#: Registered hot-path queries, name -> function returning a ``Query``.
+HOT_QUERIES = OrderedDict()
+
+Finding = namedtuple('Finding', ['query', 'table', 'problem', 'rows'])
+
+
+def hot_query(name):
+    """Register a query builder so ``flask db advise`` will explain it.
+
+    Usage: ::
+
+        @hot_query('films.top')
+        def top_films(limit=100):
+            return Film.query.order_by(Film.popularity.desc()).limit(limit)
+    """
+    def decorator(func):
+        HOT_QUERIES[name] = func
+        return func
+    return decorator
+
+
+def explain(query):
+    """Run ``EXPLAIN`` for a query and return the plan rows as dicts."""
+    connection = db.session.connection()
+    compiled = query.statement.compile(dialect=connection.dialect)
+    params = [compiled.params[key] for key in compiled.positiontup or []]
+    result = connection.execute('EXPLAIN ' + str(compiled), *params)
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def analyze_plan(name, plan, min_rows=0):
+    """Flag full scans, filesorts and temporary tables in an ``EXPLAIN`` plan.
+
+    :param name: The name of the hot query the plan belongs to.
+    :param plan: The plan rows, as returned by :func:`explain`.
+    :param min_rows: Ignore scans the optimizer estimates below this many rows.
+    """
+    findings = []
+    for row in plan:
+        rows = row.get('rows') or 0
+        if rows < min_rows:
+            continue
+        table = row.get('table')
+        extra = row.get('Extra') or ''
+        if row.get('type') == 'ALL':
+            findings.append(Finding(name, table, 'full table scan', rows))
+        elif row.get('type') == 'index' and not row.get('possible_keys'):
+            findings.append(Finding(name, table, 'full index scan', rows))
+        if 'Using filesort' in extra:
+            findings.append(Finding(name, table, 'filesort', rows))
+        if 'Using temporary' in extra:
+            findings.append(Finding(name, table, 'temporary table', rows))
+    return findings
+
+
+def advise(names=None, min_rows=0):
+    """Explain every registered hot query, yielding ``(name, plan, findings)``."""
+    for name, builder in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        plan = explain(builder())
+        yield name, plan, analyze_plan(name, plan, min_rows=min_rows)
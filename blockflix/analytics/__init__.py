@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Analytics over the store's history.
+
+These modules use pandas and NumPy, which web workers must not import as they
+boot (see ``tests/test_startup.py``). Each module imports them inside the
+functions that compute, so the app can route to its reports, and serve them
+from the cache, without loading either.
+"""
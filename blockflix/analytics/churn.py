@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Nightly churn-risk scoring of every user.
+
+A user's features, as of a day, are their tenure, how often they rent, how
+many rentals they made in the last ``CHURN_RECENT_DAYS`` days, days since
+their last rental, open rentals, days since their last payment and the months
+they missed paying for. They come from one set-based query per range of
+``CHURN_CHUNK_SIZE`` user ids, aggregating rentals and payments (archived
+ones included) for the whole range at once.
+
+The model is a logistic regression trained on users' features as of
+``CHURN_HORIZON_DAYS`` ago, labelled by whether they paid since, over a
+sample of up to ``CHURN_TRAINING_USERS`` users. It is kept at
+``CHURN_MODEL_PATH`` and retrained when asked to, or when there is none.
+
+Scoring then extracts, scores and upserts into ``user_scores`` one id range
+per task, across ``CHURN_PROCESSES`` processes forked from the command's,
+each with database connections of its own. Every stage is timed.
+"""
+import datetime as dt
+import os
+import pickle
+import random
+import time
+from collections import OrderedDict, namedtuple
+from multiprocessing import Pool
+
+from flask import current_app
+from sqlalchemy import func, text
+from sqlalchemy.dialects.mysql import insert
+
+from blockflix.extensions import db
+from blockflix.store.models import User, UserScore
+
+#: The columns of a feature matrix, in order
+FEATURES = ('tenure_days', 'rentals_per_month', 'recent_rentals', 'days_since_rental', 'open_rentals',
+            'days_since_payment', 'missed_payments')
+
+#: Raw features of the users in an id range, as of a day; users who signed up later are left out
+FEATURE_QUERY = """
+SELECT users.id,
+       DATEDIFF(:as_of, users.created_at) AS tenure_days,
+       COALESCE(rented.total, 0) AS rentals,
+       COALESCE(rented.recent, 0) AS recent_rentals,
+       DATEDIFF(:as_of, COALESCE(rented.last_rented, users.created_at)) AS days_since_rental,
+       COALESCE(rented.open, 0) AS open_rentals,
+       DATEDIFF(:as_of, COALESCE(paid.last_paid, users.created_at)) AS days_since_payment,
+       COALESCE(paid.months, 0) AS months_paid
+FROM users
+LEFT JOIN (SELECT user_id, COUNT(*) AS total, SUM(rental_date >= :recent_since) AS recent,
+                  MAX(rental_date) AS last_rented, SUM(return_date IS NULL OR return_date >= :as_of) AS open
+           FROM (SELECT user_id, rental_date, return_date FROM rentals
+                 WHERE user_id >= :first_id AND user_id < :end_id AND rental_date < :as_of
+                 UNION ALL
+                 SELECT user_id, rental_date, return_date FROM rentals_archive
+                 WHERE user_id >= :first_id AND user_id < :end_id AND rental_date < :as_of) AS history
+           GROUP BY user_id) AS rented ON rented.user_id = users.id
+LEFT JOIN (SELECT user_id, MAX(payment_date) AS last_paid,
+                  COUNT(DISTINCT YEAR(payment_date) * 12 + MONTH(payment_date)) AS months
+           FROM (SELECT user_id, payment_date FROM payments
+                 WHERE user_id >= :first_id AND user_id < :end_id AND payment_date < :as_of
+                 UNION ALL
+                 SELECT user_id, payment_date FROM payments_archive
+                 WHERE user_id >= :first_id AND user_id < :end_id AND payment_date < :as_of) AS history
+           GROUP BY user_id) AS paid ON paid.user_id = users.id
+WHERE users.id >= :first_id AND users.id < :end_id AND users.created_at < :as_of
+ORDER BY users.id
+"""
+
+#: Users in an id range who paid between two days
+PAID_QUERY = """
+SELECT DISTINCT user_id FROM payments
+WHERE user_id >= :first_id AND user_id < :end_id AND payment_date >= :since AND payment_date < :until
+UNION
+SELECT DISTINCT user_id FROM payments_archive
+WHERE user_id >= :first_id AND user_id < :end_id AND payment_date >= :since AND payment_date < :until
+"""
+
+Chunk = namedtuple('Chunk', ['users', 'timings'])
+Report = namedtuple('Report', ['users', 'chunks', 'trained', 'timings'])
+
+
+def id_ranges(chunk_size):
+    """``(first_id, end_id)`` ranges of ``chunk_size`` user ids covering every user."""
+    first_id, last_id = db.session.query(func.min(User.id), func.max(User.id)).one()
+    if first_id is None:
+        return []
+    return [(start, start + chunk_size) for start in range(first_id, last_id + 1, chunk_size)]
+
+
+def extract(first_id, end_id, as_of):
+    """The ids of the users in a range, and their feature matrix as of a day, with columns :data:`FEATURES`."""
+    import numpy as np
+
+    rows = db.session.execute(text(FEATURE_QUERY), {
+        'first_id': first_id, 'end_id': end_id, 'as_of': as_of,
+        'recent_since': as_of - dt.timedelta(days=current_app.config['CHURN_RECENT_DAYS']),
+    }).fetchall()
+    raw = np.array(rows, dtype=np.float64).reshape(-1, 8)
+    user_ids, tenure_days, rentals, recent, since_rental, open_rentals, since_payment, months_paid = raw.T
+    tenure_months = np.maximum(tenure_days, 1) / 30.0
+    features = np.column_stack([
+        tenure_days,
+        rentals / tenure_months,
+        recent,
+        since_rental,
+        open_rentals,
+        since_payment,
+        np.maximum(np.floor(tenure_months) + 1 - months_paid, 0),
+    ])
+    return user_ids.astype(np.int64), features
+
+
+def paid_between(first_id, end_id, since, until):
+    """The ids of the users in a range who paid from ``since`` until ``until``."""
+    rows = db.session.execute(text(PAID_QUERY), {'first_id': first_id, 'end_id': end_id, 'since': since,
+                                                 'until': until})
+    return [row[0] for row in rows]
+
+
+def training_chunk(task):
+    """Features as of the start of the horizon, and whether each user churned by its end, for an id range."""
+    import numpy as np
+
+    first_id, end_id, cutoff, today = task
+    start = time.time()
+    user_ids, features = extract(first_id, end_id, cutoff)
+    churned = ~np.isin(user_ids, paid_between(first_id, end_id, cutoff, today))
+    db.session.remove()
+    return features, churned, time.time() - start
+
+
+def train(features, churned):
+    """A churn model fitted to features and churn labels."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    model = make_pipeline(StandardScaler(), LogisticRegression(class_weight='balanced', solver='lbfgs'))
+    return model.fit(features, churned)
+
+
+def save_model(model, path):
+    """Keep a model for later runs."""
+    with open(path, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_model(path):
+    """The model kept at ``path``, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def write_scores(user_ids, risks, scored_on):
+    """Upsert the churn risks of users, in one statement."""
+    if not len(user_ids):
+        return
+    statement = insert(UserScore.__table__)
+    db.session.execute(statement.on_duplicate_key_update(churn_risk=statement.inserted.churn_risk,
+                                                         scored_on=statement.inserted.scored_on),
+                       [{'user_id': int(user_id), 'churn_risk': float(risk), 'scored_on': scored_on}
+                        for user_id, risk in zip(user_ids, risks)])
+    db.session.commit()
+
+
+def score_chunk(task):
+    """Extract, score and write the users of an id range, timing each step."""
+    first_id, end_id, today, model = task
+    timings = OrderedDict()
+    start = time.time()
+    user_ids, features = extract(first_id, end_id, today)
+    timings['features'] = time.time() - start
+
+    start = time.time()
+    risks = model.predict_proba(features)[:, 1] if len(user_ids) else []
+    timings['predict'] = time.time() - start
+
+    start = time.time()
+    write_scores(user_ids, risks, today)
+    timings['write'] = time.time() - start
+    db.session.remove()
+    return Chunk(len(user_ids), timings)
+
+
+def _init_worker(app):
+    """Run tasks in the app's context, on connections of this process's own."""
+    app.app_context().push()
+    db.engine.dispose()
+
+
+def map_chunks(function, tasks, processes):
+    """Results of a function over tasks, as they finish, across ``processes`` forked processes."""
+    if processes <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+    app = current_app._get_current_object()
+    # Forked children must not share the connections already open in this process
+    db.session.remove()
+    db.engine.dispose()
+    pool = Pool(processes, initializer=_init_worker, initargs=(app,))
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run(today=None, retrain=False, processes=None, chunk_size=None):
+    """Score every user's churn risk, training a model first if asked to or there is none.
+
+    :returns: A :class:`Report` with seconds per stage; the features, predict
+        and write stages are summed over every chunk, across processes.
+    """
+    import numpy as np
+
+    config = current_app.config
+    today = today or dt.date.today()
+    processes = processes or config['CHURN_PROCESSES']
+    chunk_size = chunk_size or config['CHURN_CHUNK_SIZE']
+    timings = OrderedDict()
+    ranges = id_ranges(chunk_size)
+
+    model = None if retrain else load_model(config['CHURN_MODEL_PATH'])
+    trained = model is None
+    if trained:
+        start = time.time()
+        cutoff = today - dt.timedelta(days=config['CHURN_HORIZON_DAYS'])
+        sample = random.sample(ranges, min(len(ranges), max(1, config['CHURN_TRAINING_USERS'] // chunk_size)))
+        chunks = list(map_chunks(training_chunk, [(first_id, end_id, cutoff, today) for first_id, end_id in sample],
+                                 processes))
+        timings['training_features'] = sum(seconds for _, _, seconds in chunks)
+        features = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.empty((0, len(FEATURES)))
+        churned = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.empty(0, dtype=bool)
+        if len(np.unique(churned)) < 2:
+            raise ValueError('Training needs both users who churned and users who stayed, as of {0}'.format(cutoff))
+        fit_start = time.time()
+        model = train(features, churned)
+        save_model(model, config['CHURN_MODEL_PATH'])
+        timings['fit'] = time.time() - fit_start
+        timings['train'] = time.time() - start
+
+    start = time.time()
+    users = 0
+    for stage in ('features', 'predict', 'write'):
+        timings[stage] = 0.0
+    for chunk in map_chunks(score_chunk, [(first_id, end_id, today, model) for first_id, end_id in ranges],
+                            processes):
+        users += chunk.users
+        for stage, seconds in chunk.timings.items():
+            timings[stage] += seconds
+    timings['score'] = time.time() - start
+    return Report(users, len(ranges), trained, timings)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Signup cohort retention: the share of each month's new users still paying months later.
+
+Users fall in the cohort of the month they signed up (``users.created_at``),
+and are retained at age N if they paid, at least once, N months later.
+Archived payments count too.
+
+Months are computed in the database as integers, so users and payments come
+back as pairs of integers. They are streamed through a server-side cursor
+``ANALYTICS_CHUNK_SIZE`` rows at a time, each chunk turned into a NumPy array
+in one call and marked off in a table of which users paid at which age,
+one byte per user and month, before the next is read. Memory use grows with
+users and months, not payments. Each cohort's users are then summed in one
+vectorized group-by.
+
+:func:`report` caches the matrix for ``COHORT_CACHE_TIMEOUT`` seconds, as
+the plain dict the API returns, so serving it never needs pandas.
+"""
+from flask import current_app
+from sqlalchemy import func, select, union_all
+
+from blockflix.cache import get_or_compute
+from blockflix.extensions import cache, db
+from blockflix.store.models import Payment, PaymentArchive, User
+
+CACHE_KEY = 'analytics:cohort_retention'
+
+
+def month_index(column):
+    """Months since the start of year 0 of a date column, so months subtract as integers."""
+    return func.year(column) * 12 + func.month(column) - 1
+
+
+def month_label(index):
+    """The ``YYYY-MM`` a month index stands for."""
+    return '{0:04d}-{1:02d}'.format(index // 12, index % 12 + 1)
+
+
+def signups():
+    """(user id, signup month) of every user."""
+    return select([User.id, month_index(User.created_at)])
+
+
+def payment_months():
+    """(user id, payment month) of every payment, archived ones included."""
+    return union_all(
+        select([Payment.user_id, month_index(Payment.payment_date)]),
+        select([PaymentArchive.user_id, month_index(PaymentArchive.payment_date)]),
+    )
+
+
+def read_chunks(statement, chunk_size):
+    """Stream the rows of a statement selecting integers, as a two-dimensional NumPy array per chunk."""
+    import numpy as np
+
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield np.array(rows, dtype=np.int64)
+
+
+def cohort_matrix(users, payment_chunks):
+    """The retention matrix, and the size of each cohort.
+
+    :param users: An array of (user id, signup month) rows.
+    :param payment_chunks: Arrays of (user id, payment month) rows.
+    :returns: ``(matrix, sizes)``: the share of each cohort (by signup month)
+        retained at each age in months, NaN where the cohort is not that old
+        yet, and the number of users in each cohort.
+    """
+    import numpy as np
+    import pandas as pd
+
+    sizes = pd.Series(users[:, 1]).value_counts().sort_index()
+    if not len(users):
+        return pd.DataFrame(index=sizes.index, dtype=float), sizes
+    cohort_of = np.full(users[:, 0].max() + 1, -1, dtype=np.int64)
+    cohort_of[users[:, 0]] = users[:, 1]
+    first_month, last_month = sizes.index.min(), sizes.index.max()
+
+    # paid[user id, age]: whether the user paid that many months after signing up
+    paid = np.zeros((len(cohort_of), last_month - first_month + 1), dtype=bool)
+    for chunk in payment_chunks:
+        if not len(chunk):
+            continue
+        user_ids, months = chunk[:, 0], chunk[:, 1]
+        last_month = max(last_month, months.max())
+        known = user_ids < len(cohort_of)
+        user_ids, months = user_ids[known], months[known]
+        ages = months - cohort_of[user_ids]
+        paying = (cohort_of[user_ids] >= 0) & (ages >= 0)
+        user_ids, ages = user_ids[paying], ages[paying]
+        if len(ages) and ages.max() >= paid.shape[1]:
+            paid = np.hstack([paid, np.zeros((len(paid), ages.max() + 1 - paid.shape[1]), dtype=bool)])
+        paid[user_ids, ages] = True
+
+    # Sum the rows of each cohort's users, a cohort at a time rather than casting all of them to integers
+    by_cohort = users[np.argsort(users[:, 1], kind='mergesort')]
+    bounds = np.append(np.searchsorted(by_cohort[:, 1], sizes.index.values), len(users))
+    retained = [paid[by_cohort[start:end, 0]].sum(axis=0) for start, end in zip(bounds[:-1], bounds[1:])]
+    ages = np.arange(last_month - first_month + 1)
+    matrix = pd.DataFrame(retained, index=sizes.index).reindex(columns=ages, fill_value=0).div(sizes, axis=0)
+    too_young = ages[np.newaxis, :] > (last_month - sizes.index.values)[:, np.newaxis]
+    return matrix.mask(too_young), sizes
+
+
+def retention(chunk_size=None):
+    """The retention matrix and cohort sizes of the database's users and payments; see :func:`cohort_matrix`."""
+    import numpy as np
+
+    chunk_size = chunk_size or current_app.config['ANALYTICS_CHUNK_SIZE']
+    users = list(read_chunks(signups(), chunk_size))
+    users = np.concatenate(users) if users else np.empty((0, 2), dtype=np.int64)
+    return cohort_matrix(users, read_chunks(payment_months(), chunk_size))
+
+
+def as_dict(matrix, sizes):
+    """A retention matrix as the API returns it: a row of shares per cohort, to four places."""
+    return {
+        'ages': len(matrix.columns),
+        'cohorts': [{
+            'cohort': month_label(cohort),
+            'users': int(sizes[cohort]),
+            'retention': [round(float(share), 4) for share in row.dropna()],
+        } for cohort, row in matrix.iterrows()],
+    }
+
+
+def report(refresh=False, chunk_size=None):
+    """The cached retention matrix as a dict, computed on a miss, or recomputed with ``refresh``."""
+    timeout = current_app.config['COHORT_CACHE_TIMEOUT']
+
+    def compute():
+        return as_dict(*retention(chunk_size))
+
+    if refresh:
+        value = compute()
+        cache.set(CACHE_KEY, value, timeout=timeout)
+        return value
+    return get_or_compute(CACHE_KEY, compute, timeout=timeout)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Columnar exports of the store's tables for analysts, as Parquet or Arrow IPC files.
+
+Each table in :data:`EXPORTS` is streamed through a server-side cursor and
+written ``EXPORT_ROW_GROUP_SIZE`` rows at a time, one row group per batch,
+so memory use does not grow with the table. ``rentals`` and ``payments`` are
+read a month at a time, within one partition, into Hive-style
+``month=YYYY-MM`` directories.
+
+Tables with a ``last_update`` column are exported incrementally. Every run
+ships the rows updated since the previous run's watermark, which is kept in
+``_watermarks.json`` in the export directory, into new ``part-<run>`` files.
+A row changed since is shipped again, so readers keep each key's row from
+the latest part. Deleted rows are not tracked. The watermark is the
+database's clock ``EXPORT_WATERMARK_LAG`` seconds before the run started,
+so transactions that commit late are picked up by the next one. The other
+tables, the film catalogue's join tables, are small and are replaced by a
+fresh snapshot on every run.
+"""
+import datetime as dt
+import glob
+import json
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, LargeBinary, String, and_, func, select, true
+from sqlalchemy.sql.expression import type_coerce
+
+from blockflix.compat import replace_file
+from blockflix.extensions import db
+from blockflix.store.partitions import add_months
+
+#: How a table is exported: the column it is split into months by, and the watermark column, if any
+Export = namedtuple('Export', ['partition_by', 'watermark', 'exclude'])
+
+EXPORTS = OrderedDict([
+    ('rentals', Export('rental_date', 'last_update', ())),
+    ('payments', Export('payment_date', 'last_update', ())),
+    ('users', Export(None, 'last_update', ('password', 'picture'))),
+    ('films', Export(None, 'last_update', ())),
+    ('films_actors', Export(None, None, ())),
+    ('films_categories', Export(None, None, ())),
+    ('actors', Export(None, 'last_update', ())),
+    ('categories', Export(None, 'last_update', ())),
+    ('languages', Export(None, 'last_update', ())),
+])
+
+#: File format -> file name extension
+FORMATS = OrderedDict([('parquet', 'parquet'), ('arrow', 'arrow')])
+WATERMARKS = '_watermarks.json'
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+Exported = namedtuple('Exported', ['table', 'rows', 'files', 'seconds'])
+
+
+def arrow_type(column_type):
+    """The Arrow type of a column's values."""
+    import pyarrow as pa
+
+    for sql_type, arrow in ((Boolean, pa.bool_()), (Integer, pa.int64()), (Float, pa.float64()),
+                            (DateTime, pa.timestamp('us')), (Date, pa.date32()), (String, pa.string()),
+                            (LargeBinary, pa.binary())):
+        if isinstance(column_type, sql_type):
+            return arrow
+    raise TypeError('No Arrow type for {0!r}'.format(column_type))
+
+
+def exported_columns(table, spec):
+    """The columns of a table that are exported."""
+    return [column for column in table.columns if column.name not in spec.exclude]
+
+
+def schema_of(columns):
+    """The Arrow schema of a list of columns."""
+    import pyarrow as pa
+
+    return pa.schema([pa.field(column.name, arrow_type(column.type), nullable=column.nullable)
+                      for column in columns])
+
+
+def read_watermarks(directory):
+    """Table -> the ``last_update`` its last export reached, in an export directory."""
+    path = os.path.join(directory, WATERMARKS)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {table: dt.datetime.strptime(mark, WATERMARK_FORMAT) for table, mark in json.load(f).items()}
+
+
+def write_watermarks(directory, watermarks):
+    """Replace the watermarks of an export directory, atomically."""
+    path = os.path.join(directory, WATERMARKS)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({table: mark.strftime(WATERMARK_FORMAT) for table, mark in sorted(watermarks.items())}, f,
+                  indent=2)
+    replace_file(path + '.tmp', path)
+
+
+class BatchWriter(object):
+    """Writes tables of rows to a Parquet or Arrow IPC file, one row group per table.
+
+    The file is written under a temporary name, and only given its own once closed.
+    """
+
+    def __init__(self, path, schema, file_format, compression=None):
+        """Create instance."""
+        self.path = path
+        self.partial = path + '.partial'
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.partial, schema, compression=compression or 'snappy')
+        else:
+            import pyarrow as pa
+            self.writer = pa.ipc.new_file(self.partial, schema)
+        self.rows = 0
+
+    def write(self, table):
+        """Write a table of rows as one row group."""
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        """Finish the file and give it its name."""
+        self.writer.close()
+        replace_file(self.partial, self.path)
+
+    def abort(self):
+        """Drop the file."""
+        self.writer.close()
+        os.remove(self.partial)
+
+
+def stream(connection, statement, schema, row_group_size):
+    """The rows of a statement as Arrow tables of up to ``row_group_size`` rows, read through a server-side cursor."""
+    import pyarrow as pa
+
+    result = connection.execution_options(stream_results=True).execute(statement)
+    while True:
+        rows = result.fetchmany(row_group_size)
+        if not rows:
+            return
+        yield pa.Table.from_arrays([pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                                   schema=schema)
+
+
+def write_file(connection, statement, schema, path, file_format, row_group_size):
+    """Write a statement's rows to a file, if there are any; how many there were."""
+    writer = None
+    finished = False
+    try:
+        for rows in stream(connection, statement, schema, row_group_size):
+            if writer is None:
+                writer = BatchWriter(path, schema, file_format, current_app.config['EXPORT_COMPRESSION'])
+            writer.write(rows)
+        finished = True
+    finally:
+        if writer is not None and not finished:
+            writer.abort()
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.rows
+
+
+def months(connection, column, condition):
+    """The first day of every month from the earliest to the latest value of a column, among matching rows."""
+    first, last = connection.execute(select([func.min(column), func.max(column)]).where(condition)).first()
+    if first is None:
+        return []
+    month, last = dt.date(first.year, first.month, 1), dt.date(last.year, last.month, 1)
+    result = []
+    while month <= last:
+        result.append(month)
+        month = add_months(month, 1)
+    return result
+
+
+def export_table(connection, name, directory, file_format, run, since, until, row_group_size):
+    """Export a table's rows updated after ``since`` and up to ``until``, or all of them; an :class:`Exported`."""
+    start = time.time()
+    spec = EXPORTS[name]
+    table = db.metadata.tables[name]
+    columns = exported_columns(table, spec)
+    schema = schema_of(columns)
+    file_name = 'part-{0}.{1}'.format(run, FORMATS[file_format])
+    condition = true()
+    if spec.watermark:
+        condition = table.c[spec.watermark] <= until
+        if since:
+            condition = and_(table.c[spec.watermark] > since, condition)
+    # Read DOUBLE columns as floats rather than Decimals
+    query = select([type_coerce(column, Float()).label(column.name)
+                    if isinstance(column.type, Float) and column.type.asdecimal else column
+                    for column in columns]).where(condition)
+
+    rows = files = 0
+    if spec.partition_by:
+        column = table.c[spec.partition_by]
+        for month in months(connection, column, condition):
+            path = os.path.join(directory, name, 'month={0:%Y-%m}'.format(month), file_name)
+            written = write_file(connection, query.where(column >= month).where(column < add_months(month, 1)),
+                                 schema, path, file_format, row_group_size)
+            rows += written
+            files += 1 if written else 0
+    else:
+        path = os.path.join(directory, name, file_name)
+        rows = write_file(connection, query, schema, path, file_format, row_group_size)
+        files = 1 if rows else 0
+        if not spec.watermark:
+            # A snapshot replaces the previous one
+            for previous in glob.glob(os.path.join(directory, name, 'part-*')):
+                if previous != path:
+                    os.remove(previous)
+    return Exported(name, rows, files, time.time() - start)
+
+
+def export(directory, tables=None, file_format='parquet', full=False, row_group_size=None):
+    """Export tables into a directory, yielding an :class:`Exported` as each one is done.
+
+    :param tables: Names of the tables to export (default: all of :data:`EXPORTS`).
+    :param full: Export every row, rather than those updated since the last export.
+    """
+    tables = list(tables or EXPORTS)
+    unknown = [name for name in tables if name not in EXPORTS]
+    if unknown:
+        raise KeyError('No exported table named {0}'.format(', '.join(unknown)))
+    if file_format not in FORMATS:
+        raise ValueError('Unknown export format {0}'.format(file_format))
+    row_group_size = row_group_size or current_app.config['EXPORT_ROW_GROUP_SIZE']
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    watermarks = read_watermarks(directory)
+    with db.engine.connect() as connection:
+        now = connection.execute(select([func.now()])).scalar()
+        until = now - dt.timedelta(seconds=current_app.config['EXPORT_WATERMARK_LAG'])
+        run = now.strftime('%Y%m%dT%H%M%S')
+        for name in tables:
+            since = None if full else watermarks.get(name)
+            exported = export_table(connection, name, directory, file_format, run, since, until, row_group_size)
+            if EXPORTS[name].watermark:
+                watermarks[name] = until
+                write_watermarks(directory, watermarks)
+            yield exported
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 """The app module, containing the app factory function."""
 from flask import Flask, render_template
+from flask_migrate.cli import db as db_cli
 
 from blockflix import commands, public, store
+from blockflix.compression import compression
 from blockflix.extensions import bcrypt, cache, csrf_protect, db, debug_toolbar, login_manager, migrate, webpack
+from blockflix.metrics import metrics
+from blockflix.profiling import profiler
+from blockflix.querycache import query_cache
+from blockflix.resilience import serve_stale
 from blockflix.settings import ProdConfig
 
 
@@ -27,6 +33,11 @@ def register_extensions(app):
     bcrypt.init_app(app)
     cache.init_app(app)
     db.init_app(app)
+    query_cache.init_app(app)
+    serve_stale.init_app(app)
+    profiler.init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
     csrf_protect.init_app(app)
     login_manager.init_app(app)
     debug_toolbar.init_app(app)
@@ -42,6 +53,7 @@ def register_blueprints(app):
     app.register_blueprint(store.controllers.actor_blueprint)
     app.register_blueprint(store.controllers.category_blueprint)
     app.register_blueprint(store.controllers.payment_blueprint)
+    app.register_blueprint(store.controllers.api_blueprint)
     return None
 
 
@@ -52,7 +64,7 @@ def register_errorhandlers(app):
         # If a HTTPException, pull the `code` attribute; default to 500
         error_code = getattr(error, 'code', 500)
         return render_template('{0}.html'.format(error_code)), error_code
-    for errcode in [401, 404, 500]:
+    for errcode in [401, 404, 500, 503]:
         app.errorhandler(errcode)(render_error)
     return None
 
@@ -84,3 +96,13 @@ def register_commands(app):
     app.cli.add_command(commands.urls)
     # TODO: Add a seed command
     app.cli.add_command(commands.seed)
+    app.cli.add_command(commands.export)
+    app.cli.add_command(commands.partitions)
+    app.cli.add_command(commands.rentals)
+    app.cli.add_command(commands.films)
+    app.cli.add_command(commands.revenue)
+    app.cli.add_command(commands.analytics)
+    app.cli.add_command(commands.cache)
+    app.cli.add_command(commands.profile)
+    app.cli.add_command(commands.loadtest)
+    db_cli.add_command(commands.advise)
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""Two-tier cache backend with stampede protection.
+
+Enable with ``CACHE_TYPE = 'blockflix.cache.two_tier'``. Every worker keeps a
+bounded in-process LRU in front of a tier shared by all workers on the host
+(a directory under ``CACHE_DIR``, or Redis when ``CACHE_REDIS_URL`` is set).
+
+:meth:`TwoTierCache.get_or_compute` guards hot keys against stampedes:
+
+* values are recomputed a little *before* they expire, with a probability
+  that rises as expiry nears and with how long the value took to compute
+  (probabilistic early recomputation, "XFetch");
+* only one thread per process and one process per shared tier recomputes a
+  key at a time. Everyone else is served the previous value, which the shared
+  tier keeps for ``CACHE_STALE_GRACE`` seconds past expiry, or waits for the
+  recomputed one when there is none.
+
+The shared tier's ``add`` takes a key's lock, so it has to be atomic across
+workers: Redis' ``SET NX`` is, and :class:`SharedFileSystemCache` makes the
+directory tier's so too.
+"""
+import errno
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from blockflix.extensions import cache
+
+try:
+    from werkzeug.contrib.cache import BaseCache, FileSystemCache, RedisCache
+except ImportError:  # Werkzeug >= 1.0 moved its caches to cachelib
+    from cachelib import BaseCache, FileSystemCache, RedisCache
+
+#: What the tiers store: the value, when it expires and how long it took to compute.
+Entry = namedtuple('Entry', ['value', 'expires', 'delta'])
+
+
+class LRUCache(BaseCache):
+    """An in-process cache holding at most ``max_size`` entries, evicting the least recently used."""
+
+    def __init__(self, max_size=1024, default_timeout=300):
+        """Create instance."""
+        BaseCache.__init__(self, default_timeout)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Look up a key, marking it as recently used."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                return None
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value, evicting the least recently used entries past ``max_size``."""
+        timeout = self._normalize_timeout(timeout)
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return True
+
+    def add(self, key, value, timeout=None):
+        """Store a value unless the key is already cached."""
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key):
+        """Whether a key is cached."""
+        return self.get(key) is not None
+
+    def delete(self, key):
+        """Remove a key."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Remove every key."""
+        with self._lock:
+            self._entries.clear()
+        return True
+
+    def __len__(self):
+        """Number of entries held, expired or not."""
+        return len(self._entries)
+
+
+class SharedFileSystemCache(FileSystemCache):
+    """A directory cache whose :meth:`add` is atomic across the processes sharing it."""
+
+    def add(self, key, value, timeout=None):
+        """Store a value unless the key is already cached.
+
+        The value is written under a unique key, then hard linked to the key's
+        file, which fails if the file exists; an expired one is removed and the
+        link retried once.
+        """
+        staged = '{0}:add:{1}'.format(key, uuid.uuid4().hex)
+        if not self.set(staged, value, timeout):
+            return False
+        filename = self._get_filename(key)
+        try:
+            for _ in range(2):
+                try:
+                    os.link(self._get_filename(staged), filename)
+                    return True
+                except OSError as error:
+                    if error.errno != errno.EEXIST or self.has(key):
+                        return False
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            return False
+        finally:
+            self.delete(staged)
+
+
+class TwoTierCache(BaseCache):
+    """An in-process :class:`LRUCache` in front of a cache shared across workers."""
+
+    def __init__(self, local, shared, default_timeout=300, stale_grace=60, lock_timeout=30, beta=1.0):
+        """Create instance.
+
+        :param local: The in-process tier, usually an :class:`LRUCache`.
+        :param shared: The tier shared by every worker.
+        :param stale_grace: Seconds an expired value stays servable while it is recomputed.
+        :param lock_timeout: Seconds a recompute may hold a key before others recompute it too.
+        :param beta: Eagerness of early recomputation; 0 disables it.
+        """
+        BaseCache.__init__(self, default_timeout)
+        self.local = local
+        self.shared = shared
+        self.stale_grace = stale_grace
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self._stats = dict.fromkeys(
+            ('local_hits', 'shared_hits', 'misses', 'coalesced', 'stale_served', 'early_recomputes'), 0)
+        self._stats_lock = threading.Lock()
+        self._key_locks = {}  # Key -> [lock, threads holding or waiting on it]
+        self._key_locks_guard = threading.Lock()
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        """Hit, miss and coalescing counters for this process."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats['local_hits'] + stats['shared_hits']
+        lookups = hits + stats['misses']
+        stats['hits'] = hits
+        stats['hit_ratio'] = float(hits) / lookups if lookups else 0.0
+        stats['local_size'] = len(self.local) if hasattr(self.local, '__len__') else None
+        return stats
+
+    def _promote(self, key, entry):
+        """Copy an entry into the local tier, for no longer than the local tier's own timeout."""
+        remaining = entry.expires - time.time()
+        if remaining <= 0:
+            return
+        timeout = self.local.default_timeout
+        if remaining != float('inf'):
+            remaining = int(math.ceil(remaining))
+            timeout = min(remaining, timeout) if timeout else remaining
+        self.local.set(key, entry, timeout=timeout)
+
+    def _lookup(self, key):
+        """The entry for a key, expired or not, promoting shared entries to the local tier."""
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry, 'local_hits'
+        entry = self.shared.get(key)
+        if entry is not None:
+            self._promote(key, entry)
+        return entry, 'shared_hits'
+
+    def _store(self, key, value, timeout, delta):
+        timeout = self._normalize_timeout(timeout)
+        entry = Entry(value, time.time() + timeout if timeout else float('inf'), delta)
+        self._promote(key, entry)
+        return self.shared.set(key, entry, timeout=timeout + self.stale_grace if timeout else 0)
+
+    def get(self, key):
+        """Look up a key, ignoring values past their expiry."""
+        entry, tier = self._lookup(key)
+        if entry is None or entry.expires <= time.time():
+            self._count('misses')
+            return None
+        self._count(tier)
+        return entry.value
+
+    def set(self, key, value, timeout=None):
+        """Store a value in both tiers."""
+        return self._store(key, value, timeout, 0)
+
+    def add(self, key, value, timeout=None):
+        """Store a value unless the key is already cached."""
+        if self.get(key) is not None:
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key):
+        """Whether a key holds an unexpired value."""
+        entry, _ = self._lookup(key)
+        return entry is not None and entry.expires > time.time()
+
+    def delete(self, key):
+        """Remove a key from both tiers."""
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def clear(self):
+        """Remove every key from both tiers."""
+        self.local.clear()
+        return self.shared.clear()
+
+    def _hold_key_lock(self, key):
+        """The lock recomputing a key in this process, counting this thread among its users."""
+        with self._key_locks_guard:
+            held = self._key_locks.get(key)
+            if held is None:
+                held = self._key_locks[key] = [threading.Lock(), 0]
+            held[1] += 1
+            return held[0]
+
+    def _drop_key_lock(self, key):
+        """Stop counting this thread among a key lock's users, forgetting the lock once it has none."""
+        with self._key_locks_guard:
+            held = self._key_locks[key]
+            held[1] -= 1
+            if not held[1]:
+                del self._key_locks[key]
+
+    def _recompute_early(self, entry, now):
+        """XFetch: recompute before expiry with a probability growing as expiry nears."""
+        if not self.beta or not entry.delta:
+            return False
+        return now - entry.delta * self.beta * math.log(1.0 - random.random()) >= entry.expires
+
+    def get_or_compute(self, key, compute, timeout=None):
+        """The cached value for a key, calling ``compute()`` at most once across workers to refresh it.
+
+        ``compute`` must not return ``None``, which the tiers can't tell apart from a miss.
+        """
+        entry, tier = self._lookup(key)
+        now = time.time()
+        if entry is not None and entry.expires > now:
+            if not self._recompute_early(entry, now):
+                self._count(tier)
+                return entry.value
+            self._count('early_recomputes')
+        else:
+            self._count('misses')
+
+        lock = self._hold_key_lock(key)
+        try:
+            if not lock.acquire(False):
+                # Another thread of this worker is already recomputing the key
+                if entry is not None:
+                    self._count('stale_served')
+                    return entry.value
+                lock.acquire()
+            try:
+                return self._recompute(key, entry, compute, timeout)
+            finally:
+                lock.release()
+        finally:
+            self._drop_key_lock(key)
+
+    def _recompute(self, key, entry, compute, timeout):
+        """Recompute a key unless another thread or worker just did, holding its lock in this process."""
+        fresh, _ = self._lookup(key)
+        refreshed = fresh is not None and (entry is None or fresh.expires != entry.expires)
+        if refreshed and fresh.expires > time.time():
+            self._count('coalesced')
+            return fresh.value
+
+        lock_key = 'lock:' + key
+        owns_lock = self.shared.add(lock_key, 1, timeout=self.lock_timeout)
+        if not owns_lock:
+            # Another worker is recomputing the key
+            if entry is not None:
+                self._count('stale_served')
+                return entry.value
+            value = self._wait_for(key)
+            if value is not None:
+                self._count('coalesced')
+                return value
+        try:
+            start = time.time()
+            value = compute()
+            self._store(key, value, timeout, time.time() - start)
+            return value
+        finally:
+            if owns_lock:
+                self.shared.delete(lock_key)
+
+    def _wait_for(self, key, interval=0.05):
+        """Poll the shared tier for a key being recomputed by another worker."""
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            time.sleep(interval)
+            entry = self.shared.get(key)
+            if entry is not None and entry.expires > time.time():
+                self._promote(key, entry)
+                return entry.value
+            if not self.shared.has('lock:' + key):
+                return None
+        return None
+
+
+def two_tier(app, config, args, kwargs):
+    """Flask-Caching factory for :class:`TwoTierCache`."""
+    default_timeout = config['CACHE_DEFAULT_TIMEOUT']
+    local = LRUCache(max_size=config.get('CACHE_LOCAL_SIZE', 1024),
+                     default_timeout=config.get('CACHE_LOCAL_TIMEOUT', default_timeout))
+    if config.get('CACHE_REDIS_URL'):
+        from redis import from_url as redis_from_url
+        shared = RedisCache(host=redis_from_url(config['CACHE_REDIS_URL']),
+                            key_prefix=config.get('CACHE_KEY_PREFIX') or '',
+                            default_timeout=default_timeout)
+    else:
+        shared = SharedFileSystemCache(config['CACHE_DIR'], threshold=config['CACHE_THRESHOLD'],
+                                       default_timeout=default_timeout)
+    return TwoTierCache(local, shared, default_timeout=default_timeout,
+                        stale_grace=config.get('CACHE_STALE_GRACE', 60),
+                        lock_timeout=config.get('CACHE_LOCK_TIMEOUT', 30),
+                        beta=config.get('CACHE_EARLY_RECOMPUTE_BETA', 1.0))
+
+
+def get_or_compute(key, compute, timeout=None):
+    """The cached value for a key, computing and caching it on a miss.
+
+    Uses :meth:`TwoTierCache.get_or_compute` when the app is configured with
+    the two-tier backend, and a plain get/set on any other backend.
+    """
+    backend = cache.cache
+    if isinstance(backend, TwoTierCache):
+        return backend.get_or_compute(key, compute, timeout)
+    value = backend.get(key)
+    if value is None:
+        value = compute()
+        backend.set(key, value, timeout)
+    return value
+
+
+def stats():
+    """Hit, miss and coalescing counters for this process, empty unless the two-tier backend is in use."""
+    backend = cache.cache
+    return backend.stats() if isinstance(backend, TwoTierCache) else {}
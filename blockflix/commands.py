@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 """Click commands."""
+import csv
+import json
 import os
+import time
 from glob import glob
 from subprocess import call
 
@@ -8,8 +11,21 @@ import click
 from flask import current_app
 from flask.cli import with_appcontext
 from werkzeug.exceptions import MethodNotAllowed, NotFound
+from blockflix import loadtest as harness
+from blockflix import warmup
+from blockflix.advisor import advise as advise_queries
+from blockflix.analytics import churn as churn_analytics
+from blockflix.analytics import cohorts as cohort_analytics
+from blockflix.analytics import export as store_export
+from blockflix.profiling import merge as merge_profiles
+from blockflix.store import film_stats
+from blockflix.store import overdue as store_overdue
+from blockflix.store import partitions as store_partitions
+from blockflix.store import popularity as store_popularity
+from blockflix.store import returns as store_returns
+from blockflix.store import revenue as store_revenue
+from blockflix.store import serializers as store_serializers
 from blockflix.store.models import User
-from blockflix.seed import simulate
 
 
 HERE = os.path.abspath(os.path.dirname(__file__))
@@ -19,9 +35,13 @@ TEST_PATH = os.path.join(PROJECT_ROOT, 'tests')
 
 # TODO: Add seed command
 @click.command()
+@click.option('--scale', default=1.0,
+              help='Multiply the number of users seeded (below 1, also the films; default: 1)')
 @with_appcontext
-def seed():
-    simulate()
+def seed(scale):
+    # Seeding needs pandas, numpy and faker; import them only when seeding
+    from blockflix.seed import simulate
+    simulate(scale)
 
 @click.command()
 def test():
@@ -133,3 +153,374 @@ def urls(url, order):
 
     for row in rows:
         click.echo(str_template.format(*row[:column_length]))
+
+
+@click.command()
+@click.option('-q', '--query', 'names', multiple=True,
+              help='Only explain this hot query (may be repeated)')
+@click.option('--min-rows', default=1000,
+              help='Ignore scans estimated below this many rows (default: 1000)')
+@click.option('--fail/--no-fail', default=False,
+              help='Exit with a non-zero status when a query is flagged')
+@with_appcontext
+def advise(names, min_rows, fail):
+    """EXPLAIN the hot-path queries and flag full scans and filesorts."""
+    flagged = 0
+    for name, plan, findings in advise_queries(names, min_rows=min_rows):
+        click.echo('{0} [{1}]'.format(name, 'WARN' if findings else 'OK'))
+        for row in plan:
+            click.echo('    {table}: type={type} key={key} rows={rows} {Extra}'.format(
+                **dict((k, row.get(k) or '') for k in ('table', 'type', 'key', 'rows', 'Extra'))))
+        for finding in findings:
+            click.echo('    ! {0} on {1} (~{2} rows)'.format(finding.problem, finding.table, finding.rows))
+        flagged += bool(findings)
+
+    click.echo('-' * 40)
+    click.echo('{0} hot queries flagged'.format(flagged))
+    if fail and flagged:
+        exit(1)
+
+
+@click.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('-t', '--table', 'tables', multiple=True,
+              help='Only export this table (may be repeated; default: {0})'.format(', '.join(store_export.EXPORTS)))
+@click.option('--format', 'file_format', default='parquet', type=click.Choice(list(store_export.FORMATS)),
+              help='File format (default: parquet)')
+@click.option('--full', default=False, is_flag=True,
+              help='Export every row, rather than those updated since the last export to DIRECTORY')
+@click.option('--row-group-size', default=None, type=int,
+              help='Rows per row group (default: EXPORT_ROW_GROUP_SIZE)')
+@with_appcontext
+def export(directory, tables, file_format, full, row_group_size):
+    """Export tables to Parquet or Arrow files in DIRECTORY, for analysis away from the live database."""
+    start = time.time()
+    rows = 0
+    try:
+        for exported in store_export.export(directory, tables, file_format, full=full,
+                                            row_group_size=row_group_size):
+            rows += exported.rows
+            click.echo('{0}: {1} rows in {2} files, {3:.3f}s'.format(
+                exported.table, exported.rows, exported.files, exported.seconds))
+    except KeyError as error:
+        raise click.BadParameter(error.args[0], param_hint='--table')
+    click.echo('-' * 40)
+    click.echo('Exported {0} rows in {1:.3f}s'.format(rows, time.time() - start))
+
+
+@click.group()
+def partitions():
+    """Manage the monthly partitions of payments and rentals."""
+
+
+@partitions.command()
+@click.option('--retention-months', default=None, type=int,
+              help='Months of history to keep partitioned (default: PARTITION_RETENTION_MONTHS)')
+@click.option('--months-ahead', default=None, type=int,
+              help='Months of partitions to create ahead (default: PARTITION_MONTHS_AHEAD)')
+@click.option('--dry-run', default=False, is_flag=True,
+              help='Only report what would be done')
+@with_appcontext
+def maintain(retention_months, months_ahead, dry_run):
+    """Create upcoming partitions and archive expired ones."""
+    if retention_months is None:
+        retention_months = current_app.config['PARTITION_RETENTION_MONTHS']
+    if months_ahead is None:
+        months_ahead = current_app.config['PARTITION_MONTHS_AHEAD']
+    for table, action in store_partitions.maintain(retention_months, months_ahead, dry_run=dry_run):
+        click.echo('{0}: {1}'.format(table, action))
+
+
+@click.group()
+def rentals():
+    """Manage rentals."""
+
+
+@rentals.command('return')
+@click.argument('scans', type=click.File('r'))
+@click.option('--chunk-size', default=None, type=int,
+              help='Scans applied per UPDATE and commit (default: RETURNS_CHUNK_SIZE)')
+@click.option('-o', '--output', type=click.File('w'), default=None,
+              help='Write every scan\'s outcome to this CSV file')
+@with_appcontext
+def return_scans(scans, chunk_size, output):
+    """Return the rentals in a CSV file of scans.
+
+    Its columns are rental_id, or user_id and film_id, and return_date
+    (defaulting to now).
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config['RETURNS_CHUNK_SIZE']
+    parsed = []
+    for line, record in enumerate(csv.DictReader(scans), 2):
+        try:
+            parsed.append(store_returns.parse_scan(record))
+        except ValueError as error:
+            raise click.BadParameter('line {0}: {1}'.format(line, error), param_hint='SCANS')
+    start = time.time()
+    outcomes = list(store_returns.process(parsed, chunk_size))
+    seconds = time.time() - start
+    if output:
+        writer = csv.writer(output)
+        writer.writerow(['rental_id', 'user_id', 'film_id', 'return_date', 'status'])
+        for outcome in outcomes:
+            scan = outcome.scan
+            writer.writerow([outcome.rental_id, scan.user_id, scan.film_id, scan.return_date, outcome.status])
+    for status, count in sorted(store_returns.summarize(outcomes).items()):
+        click.echo('{0}: {1}'.format(status, count))
+    click.echo('-' * 40)
+    click.echo('{0} scans in {1:.3f}s ({2:.0f}/s)'.format(len(outcomes), seconds, len(outcomes) / max(seconds, 1e-6)))
+
+
+@rentals.command()
+@click.option('--date', 'day', default=None, type=click.DateTime(['%Y-%m-%d']),
+              help='Day to scan as (default: today)')
+@click.option('--chunk-size', default=None, type=int,
+              help='Open rentals per page and commit (default: OVERDUE_CHUNK_SIZE)')
+@click.option('--restart', default=False, is_flag=True,
+              help='Scan from the start, rather than after where the day\'s last scan stopped')
+@with_appcontext
+def overdue(day, chunk_size, restart):
+    """Write reminders and late fees for overdue rentals."""
+    start = time.time()
+    scanned = written = 0
+    for page in store_overdue.scan(day.date() if day else None, chunk_size=chunk_size, restart=restart):
+        scanned += page.scanned
+        written += page.written
+        click.echo('Up to rental {0}: {1} overdue, {2} notices written'.format(page.last_id, scanned, written))
+    click.echo('-' * 40)
+    click.echo('{0} overdue rentals, {1} notices written in {2:.3f}s'.format(scanned, written, time.time() - start))
+
+
+@rentals.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats():
+    """Recount every film's rentals into film_stats."""
+    start = time.time()
+    film_stats.rebuild()
+    click.echo('Rebuilt film_stats in {0:.3f}s'.format(time.time() - start))
+
+
+@click.group()
+def films():
+    """Manage the film catalogue."""
+
+
+@films.command()
+@click.option('--rebuild', default=False, is_flag=True,
+              help='Recompute demand from every rental, e.g. after changing POPULARITY_HALF_LIFE_DAYS')
+@with_appcontext
+def popularity(rebuild):
+    """Blend rentals since the last run into film popularity."""
+    start = time.time()
+    result = store_popularity.refresh(rebuild=rebuild)
+    click.echo('{0} films rented, up to rental {1}; popularity updated in {2:.3f}s'.format(
+        result.films_rented, result.last_id, time.time() - start))
+
+
+@click.group()
+def revenue():
+    """Manage the monthly revenue rollup."""
+
+
+@revenue.command()
+@click.option('--since', default=None, type=click.DateTime(['%Y-%m']),
+              help='Also recompute the months from this one (YYYY-MM) on, e.g. after correcting payments')
+@click.option('--rebuild', default=False, is_flag=True,
+              help='Recompute every month')
+@with_appcontext
+def refresh(since, rebuild):
+    """Roll up the months touched by payments since the last run."""
+    start = time.time()
+    result = store_revenue.refresh(since=since, rebuild=rebuild)
+    if result.first_month:
+        click.echo('Rolled up {0} months from {1:%Y-%m}, up to payment {2} in {3:.3f}s'.format(
+            result.months, result.first_month, result.last_id, time.time() - start))
+    elif result.months:
+        click.echo('Rolled up all {0} months, up to payment {1} in {2:.3f}s'.format(
+            result.months, result.last_id, time.time() - start))
+    else:
+        click.echo('No new payments up to payment {0}'.format(result.last_id))
+
+
+@revenue.command('report')
+@click.option('--from', 'first', default=None, type=click.DateTime(['%Y-%m']),
+              help='First month (YYYY-MM)')
+@click.option('--to', 'last', default=None, type=click.DateTime(['%Y-%m']),
+              help='Last month (YYYY-MM)')
+@with_appcontext
+def revenue_report(first, last):
+    """Print revenue, payers and ARPU by month, from the rollup."""
+    serializer = store_serializers.revenue
+    rows = serializer(serializer.query(store_revenue.months(first, last)))
+    row_template = '{0:<8}  {1:>12}  {2:>9}  {3:>9}  {4:>9}  {5:>9}  {6:>8}'
+    click.echo(row_template.format('Month', 'Revenue', 'Payments', 'Payers', 'New', 'Returning', 'ARPU'))
+    click.echo('-' * 76)
+    for row in rows:
+        click.echo(row_template.format(row['month'], '{0:.2f}'.format(row['amount']), row['payments'], row['payers'],
+                                       row['new_payers'], row['returning_payers'],
+                                       '{0:.2f}'.format(row['arpu']) if row['arpu'] is not None else '-'))
+
+
+@click.group()
+def analytics():
+    """Analyse the store's history."""
+
+
+@analytics.command()
+@click.option('--refresh', default=False, is_flag=True,
+              help='Recompute the matrix rather than print the cached one')
+@click.option('--chunk-size', default=None, type=int,
+              help='Rows read from the database at a time (default: ANALYTICS_CHUNK_SIZE)')
+@click.option('--ages', default=12, help='Months after signup to print (default: 12)')
+@click.option('-o', '--output', type=click.File('w'), default=None,
+              help='Write the whole matrix to this CSV file')
+@with_appcontext
+def cohorts(refresh, chunk_size, ages, output):
+    """Print the share of each signup cohort still paying, by month since signup."""
+    start = time.time()
+    report = cohort_analytics.report(refresh=refresh, chunk_size=chunk_size)
+    seconds = time.time() - start
+    if output:
+        writer = csv.writer(output)
+        writer.writerow(['cohort', 'users'] + list(range(report['ages'])))
+        for row in report['cohorts']:
+            writer.writerow([row['cohort'], row['users']] + row['retention'])
+    header = '  '.join('{0:>6}'.format(age) for age in range(ages))
+    click.echo('{0:<8}  {1:>8}  {2}'.format('Cohort', 'Users', header))
+    for row in report['cohorts']:
+        click.echo('{0:<8}  {1:>8}  {2}'.format(row['cohort'], row['users'], '  '.join(
+            '{0:>6.1%}'.format(share) for share in row['retention'][:ages])))
+    click.echo('-' * 40)
+    click.echo('{0} cohorts in {1:.3f}s'.format(len(report['cohorts']), seconds))
+
+
+@analytics.command()
+@click.option('--date', 'day', default=None, type=click.DateTime(['%Y-%m-%d']),
+              help='Day to score as of (default: today)')
+@click.option('--retrain', default=False, is_flag=True,
+              help='Train a new model rather than load CHURN_MODEL_PATH')
+@click.option('-j', '--processes', default=None, type=int,
+              help='Processes scoring at once (default: CHURN_PROCESSES)')
+@click.option('--chunk-size', default=None, type=int,
+              help='User ids per scoring task (default: CHURN_CHUNK_SIZE)')
+@with_appcontext
+def churn(day, retrain, processes, chunk_size):
+    """Score every user's risk of churning into user_scores."""
+    start = time.time()
+    try:
+        report = churn_analytics.run(day.date() if day else None, retrain=retrain, processes=processes,
+                                     chunk_size=chunk_size)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    for stage, seconds in report.timings.items():
+        click.echo('{0:<18} {1:10.3f}s'.format(stage, seconds))
+    click.echo('-' * 40)
+    click.echo('{0} users in {1} chunks scored in {2:.3f}s{3}'.format(
+        report.users, report.chunks, time.time() - start, ', with a newly trained model' if report.trained else ''))
+
+
+@click.group()
+def cache():
+    """Manage the application cache."""
+
+
+@cache.command()
+@click.option('-k', '--key', 'keys', multiple=True,
+              help='Only warm this cached listing (may be repeated)')
+@click.option('-j', '--concurrency', default=None, type=int,
+              help='Listings warmed at once (default: CACHE_WARM_CONCURRENCY)')
+@with_appcontext
+def warm(keys, concurrency):
+    """Precompute the cached listings, e.g. right after a deploy."""
+    if concurrency is None:
+        concurrency = current_app.config['CACHE_WARM_CONCURRENCY']
+    start = time.time()
+    failed = 0
+    try:
+        for result in warmup.warm(keys, concurrency=concurrency):
+            if result.error:
+                failed += 1
+                click.echo('{0}: failed after {1:.3f}s: {2}'.format(result.key, result.seconds, result.error))
+            else:
+                click.echo('{0}: warmed in {1:.3f}s'.format(result.key, result.seconds))
+    except KeyError as error:
+        raise click.BadParameter(error.args[0], param_hint='--key')
+    click.echo('-' * 40)
+    click.echo('Warmed in {0:.3f}s, {1} failed'.format(time.time() - start, failed))
+    if failed:
+        exit(1)
+
+
+@click.group()
+def profile():
+    """Inspect stacks sampled by the request profiler."""
+
+
+@profile.command()
+@click.option('-e', '--endpoint', 'endpoints', multiple=True,
+              help='Only report this endpoint (may be repeated)')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='Write the folded stacks to this file (default: stdout)')
+@click.option('--clear', default=False, is_flag=True,
+              help='Remove the sampled stacks once reported')
+@with_appcontext
+def report(endpoints, output, clear):
+    """Merge sampled stacks into folded format for flamegraph.pl or speedscope."""
+    directory = current_app.config['PROFILE_DIR']
+    stacks = merge_profiles(directory, endpoints)
+    for stack, count in stacks.most_common():
+        output.write('{0} {1}\n'.format(stack, count))
+    click.echo('{0} samples from {1}'.format(sum(stacks.values()), directory), err=True)
+    if clear:
+        for path in glob(os.path.join(directory, '*.folded')):
+            os.remove(path)
+
+
+@click.command()
+@click.option('-u', '--username', envvar='BLOCKFLIX_LOADTEST_USERNAME', required=True,
+              help='User the virtual users log in as (env: BLOCKFLIX_LOADTEST_USERNAME)')
+@click.option('-p', '--password', envvar='BLOCKFLIX_LOADTEST_PASSWORD', required=True,
+              help='Password of that user (env: BLOCKFLIX_LOADTEST_PASSWORD)')
+@click.option('-s', '--scenario', 'scenarios', multiple=True, type=click.Choice(list(harness.SCENARIOS)),
+              help='Only run this scenario (may be repeated; default: all)')
+@click.option('-c', '--concurrency', default=4,
+              help='Virtual users (default: 4)')
+@click.option('-d', '--duration', default=10.0,
+              help='Seconds to run for (default: 10)')
+@click.option('-n', '--iterations', default=None, type=int,
+              help='Run each user through the scenarios this many times instead')
+@click.option('--url', default=None,
+              help='Load a running server, e.g. http://127.0.0.1:5000, instead of the app in process')
+@click.option('-o', '--output', default=None, type=click.Path(dir_okay=False),
+              help='Write the results to this JSON file')
+@click.option('--compare', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Show the change against the results of an earlier run')
+@with_appcontext
+def loadtest(username, password, scenarios, concurrency, duration, iterations, url, output, compare):
+    """Load the app with scripted scenarios and report throughput and latency per endpoint."""
+    if url:
+        make_client = lambda: harness.HTTPClient(url)  # noqa: E731
+    else:
+        app = current_app._get_current_object()
+        make_client = lambda: harness.WSGIClient(app)  # noqa: E731
+    try:
+        results = harness.run(make_client, username, password, scenarios=scenarios, concurrency=concurrency,
+                              duration=duration, iterations=iterations)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    changes = {}
+    if compare:
+        with open(compare) as f:
+            changes = harness.compare(results, json.load(f))
+    for endpoint, result in results.items():
+        line = '{0:20} {requests_per_second:8.1f} req/s p50={p50_ms:8.3f}ms p95={p95_ms:8.3f}ms ' \
+               'p99={p99_ms:8.3f}ms errors={errors}'.format(endpoint, **result)
+        if endpoint in changes:
+            line += ' ({requests_per_second:+.1%} req/s, {p95_ms:+.1%} p95)'.format(**changes[endpoint])
+        click.echo(line)
+    if output:
+        harness.save(results, output)
+    if any(result['errors'] for result in results.values()):
+        exit(1)
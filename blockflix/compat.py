@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Python 2/3 compatibility module."""
+import os
 import sys
 
 PY2 = int(sys.version[0]) == 2
@@ -10,9 +11,18 @@ if PY2:
     string_types = (str, unicode)  # noqa
     unicode = unicode  # noqa
     basestring = basestring  # noqa
+    replace_file = os.rename  # Replaces an existing file on POSIX, atomically
+    from cookielib import CookieJar  # noqa
+    from urllib import urlencode  # noqa
+    from urllib2 import HTTPCookieProcessor, HTTPError, HTTPRedirectHandler, Request, build_opener  # noqa
 else:
     text_type = str
     binary_type = bytes
     string_types = (str,)
     unicode = str
     basestring = (str, bytes)
+    replace_file = os.replace
+    from http.cookiejar import CookieJar  # noqa
+    from urllib.error import HTTPError  # noqa
+    from urllib.parse import urlencode  # noqa
+    from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener  # noqa
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Response compression and precompressed static assets, as WSGI middleware.
+
+:class:`Compressor` gzips (or, with the ``brotli`` package installed, brotli
+compresses) responses for clients that accept it. Streamed responses are
+compressed chunk by chunk as they are sent. Responses that are small,
+already encoded, or of a type that doesn't compress are passed through.
+
+:class:`FingerprintedStatic` serves webpack's fingerprinted assets under
+``/static/build``. It uses the ``.br`` or ``.gz`` sibling written by
+``npm run build`` when the client accepts it, and sends far-future immutable
+cache headers, since a fingerprinted file never changes.
+"""
+import mimetypes
+import os
+import re
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.security import safe_join
+from werkzeug.wsgi import FileWrapper
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#: Names with a webpack content hash, e.g. ``main_js.3f9a2c1d0b7e4a5f6c8d.js``
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.\w+$')
+
+#: Precompressed sibling suffixes by encoding, in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(environ):
+    """The content codings a request accepts, ignoring those refused with ``q=0``."""
+    encodings = set()
+    for coding in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(name.lower())
+    return encodings
+
+
+class GzipStream(object):
+    """Incremental gzip compression."""
+
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        """Create instance."""
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """Compress a chunk, flushing it so the client can decode it right away."""
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """The end of the stream."""
+        return self._compressor.flush()
+
+
+class BrotliStream(object):
+    """Incremental brotli compression."""
+
+    encoding = 'br'
+
+    def __init__(self, quality):
+        """Create instance."""
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        """Compress a chunk, flushing it so the client can decode it right away."""
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        """The end of the stream."""
+        return self._compressor.finish()
+
+
+class Compressor(object):
+    """Compresses responses on the fly for clients that accept gzip or brotli."""
+
+    def __init__(self, wsgi_app, min_size=500, level=6, brotli_quality=4, content_types=()):
+        """Create instance.
+
+        :param min_size: Responses of known length smaller than this many bytes are sent as is.
+        :param level: gzip compression level.
+        :param brotli_quality: brotli quality; low levels suit compressing on the fly.
+        :param content_types: Content types to compress.
+        """
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.content_types = frozenset(content_types)
+
+    def stream_for(self, environ, status, headers):
+        """A compression stream for a response, or None to send it as is."""
+        if environ.get('REQUEST_METHOD') == 'HEAD' or status[:3] in ('204', '206', '304'):
+            return None
+        if 'Content-Encoding' in headers:
+            return None
+        if headers.get('Content-Type', '').split(';')[0].strip() not in self.content_types:
+            return None
+        length = headers.get('Content-Length')
+        if length is not None and int(length) < self.min_size:
+            return None
+        accepted = accepted_encodings(environ)
+        if brotli is not None and 'br' in accepted:
+            return BrotliStream(self.brotli_quality)
+        if 'gzip' in accepted:
+            return GzipStream(self.level)
+        return None
+
+    def __call__(self, environ, start_response):
+        """Run the app, compressing its response if worthwhile."""
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            stream = self.stream_for(environ, status, headers)
+            if stream is None:
+                return start_response(status, headers.to_wsgi_list(), exc_info)
+            state['stream'] = stream
+            headers.remove('Content-Length')
+            headers['Content-Encoding'] = stream.encoding
+            headers.add('Vary', 'Accept-Encoding')
+            write = start_response(status, headers.to_wsgi_list(), exc_info)
+            return lambda data: write(stream.compress(data))
+
+        body = self.wsgi_app(environ, compressing_start_response)
+        if 'stream' not in state:
+            return body
+        return CompressedBody(body, state['stream'])
+
+
+class CompressedBody(object):
+    """A response body compressed as it is iterated over."""
+
+    def __init__(self, body, stream):
+        """Create instance."""
+        self.body = body
+        self.stream = stream
+
+    def __iter__(self):
+        """Compressed chunks, ending with the end of the compressed stream."""
+        for chunk in self.body:
+            if chunk:
+                yield self.stream.compress(chunk)
+        yield self.stream.finish()
+
+    def close(self):
+        """Close the wrapped body, as the WSGI server would have."""
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+class FingerprintedStatic(object):
+    """Serves fingerprinted static assets precompressed, with immutable cache headers."""
+
+    def __init__(self, wsgi_app, static_folder, url_path, max_age=31536000):
+        """Create instance.
+
+        :param static_folder: Directory the assets live in.
+        :param url_path: URL prefix they are served under, e.g. ``/static/build``.
+        :param max_age: Seconds browsers and proxies may cache them.
+        """
+        self.wsgi_app = wsgi_app
+        self.static_folder = static_folder
+        self.url_path = url_path.rstrip('/') + '/'
+        self.max_age = max_age
+
+    def __call__(self, environ, start_response):
+        """Serve a fingerprinted asset, or pass the request on to the app."""
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.url_path) or not FINGERPRINTED.search(path) \
+                or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.wsgi_app(environ, start_response)
+        filename = safe_join(self.static_folder, path[len(self.url_path):])
+        if filename is None or not os.path.isfile(filename):
+            return self.wsgi_app(environ, start_response)
+
+        headers = Headers()
+        accepted = accepted_encodings(environ)
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accepted and os.path.isfile(filename + suffix):
+                headers['Content-Encoding'] = encoding
+                served = filename + suffix
+                break
+        else:
+            served = filename
+        headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        headers['Content-Length'] = str(os.path.getsize(served))
+        headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(self.max_age)
+        headers['Vary'] = 'Accept-Encoding'
+        start_response('200 OK', headers.to_wsgi_list())
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(served, 'rb'))
+
+
+class Compression(object):
+    """Wraps an app's WSGI callable in :class:`FingerprintedStatic` and :class:`Compressor`."""
+
+    def __init__(self, app=None):
+        """Create instance."""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install the middleware, if ``COMPRESS_ENABLED``."""
+        if not app.config['COMPRESS_ENABLED']:
+            return
+        app.extensions['compression'] = self
+        # Fingerprinted assets are served before the compressor, which passes
+        # precompressed ones through and compresses the others on the fly.
+        app.wsgi_app = FingerprintedStatic(app.wsgi_app, os.path.join(app.static_folder, 'build'),
+                                           app.static_url_path + '/build',
+                                           max_age=app.config['STATIC_IMMUTABLE_MAX_AGE'])
+        app.wsgi_app = Compressor(app.wsgi_app, min_size=app.config['COMPRESS_MIN_SIZE'],
+                                  level=app.config['COMPRESS_LEVEL'],
+                                  brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+                                  content_types=app.config['COMPRESS_MIMETYPES'])
+
+
+compression = Compression()
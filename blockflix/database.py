@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
 """Database module, including the SQLAlchemy database object and DB-related utilities."""
+import random
+import time
+
+from sqlalchemy.exc import OperationalError
+
 from .compat import basestring
 from .extensions import db
 
+#: MySQL errors after which the whole transaction can be retried: lock wait timeout, deadlock
+RETRYABLE_ERRORS = (1205, 1213)
+
 # Alias common SQLAlchemy names
 Column = db.Column
 relationship = db.relationship
@@ -73,3 +81,32 @@ def reference_col(tablename, nullable=False, pk_name='id', **kwargs):
     return Column(
         db.ForeignKey('{0}.{1}'.format(tablename, pk_name)),
         nullable=nullable, **kwargs)
+
+
+def is_retryable(error):
+    """Whether a database error is a deadlock or lock wait timeout."""
+    args = getattr(error.orig, 'args', ())
+    return isinstance(error, OperationalError) and bool(args) and args[0] in RETRYABLE_ERRORS
+
+
+def retry_on_deadlock(transaction, attempts=5, backoff=0.05, sleep=time.sleep):
+    """Run a function making and committing one transaction, retrying it when it deadlocks.
+
+    The session is rolled back whenever the function raises, releasing its
+    locks. Retries wait exponentially longer each time, with jitter so that
+    the transactions that deadlocked don't collide again.
+
+    :param attempts: Times to try before letting the error propagate.
+    :param backoff: Seconds to wait, on average, before the first retry.
+    """
+    for attempt in range(attempts):
+        try:
+            return transaction()
+        except OperationalError as error:
+            db.session.rollback()
+            if not is_retryable(error) or attempt == attempts - 1:
+                raise
+            sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        except Exception:
+            db.session.rollback()
+            raise
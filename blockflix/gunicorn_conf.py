@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Gunicorn configuration.
+
+Use with ``gunicorn -c python:blockflix.gunicorn_conf 'blockflix.app:create_app()'``.
+Every setting can be overridden from the environment:
+
+* ``GUNICORN_WORKER_CLASS``: ``gthread`` (default) or ``sync``.
+* ``GUNICORN_WORKERS``: defaults to two per CPU, plus one.
+* ``GUNICORN_THREADS``: threads per ``gthread`` worker, default 4.
+* ``GUNICORN_PRELOAD``: load the app once in the master (default ``1``), so
+  workers share its memory copy-on-write.
+
+A preloaded app's database engine is created in the master. Each forked
+worker gets a fresh connection pool, so no two processes ever share a
+connection.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+
+def env_flag(name, default):
+    """A boolean setting from the environment."""
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+bind = '0.0.0.0:{0}'.format(os.environ.get('PORT', '5000'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+preload_app = env_flag('GUNICORN_PRELOAD', '1')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound the growth of their heaps
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+# Workers share their Prometheus metrics through this directory. It must be
+# set before the app (and prometheus_client) is imported, and emptied of the
+# files of a previous run.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'blockflix-metrics'))
+if not os.path.isdir(metrics_dir):
+    os.makedirs(metrics_dir)
+for stale in glob.glob(os.path.join(metrics_dir, '*.db')):
+    os.remove(stale)
+
+from blockflix import metrics, warmup  # noqa: E402 isort:skip
+
+# Gunicorn server hooks
+child_exit = metrics.child_exit
+post_worker_init = warmup.post_worker_init
+
+
+def dispose_engine(server):
+    """Drop the connections of the app's database engine in this process."""
+    from blockflix.extensions import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
+
+
+def pre_fork(server, worker):
+    """Close the master's connections to a preloaded app's database before forking."""
+    if server.cfg.preload_app:
+        dispose_engine(server)
+
+
+def post_fork(server, worker):
+    """Give each worker forked from a preloaded app a connection pool of its own."""
+    if server.cfg.preload_app:
+        dispose_engine(server)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Load generation against the app, in process or over HTTP.
+
+Virtual users each log in, then run the chosen scenarios in a loop until the
+run ends. Every request is timed under its endpoint. :func:`run` returns
+throughput and latency percentiles per endpoint, which ``flask loadtest``
+prints and can save as JSON to compare two runs.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from blockflix.compat import (CookieJar, HTTPCookieProcessor, HTTPError, HTTPRedirectHandler, Request, build_opener,
+                              urlencode)
+
+CSRF_TOKEN = re.compile(r'name="csrf-token" content="([^"]+)"')
+
+#: Scenario name -> function running it for a logged-in :class:`Session`
+SCENARIOS = OrderedDict()
+
+
+def scenario(name):
+    """Register a scenario."""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class WSGIClient(object):
+    """Sends requests straight to the WSGI app, in this process."""
+
+    def __init__(self, app):
+        """Create instance."""
+        self._client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        """Send a request, returning its status code and body."""
+        response = self._client.open(path, method=method, data=data, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class NoRedirects(HTTPRedirectHandler):
+    """Hands redirects back as responses, as the test client does, rather than following them."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        """Don't follow the redirect."""
+        return None
+
+
+class HTTPClient(object):
+    """Sends requests to a running server, e.g. a local gunicorn."""
+
+    def __init__(self, base_url):
+        """Create instance."""
+        self.base_url = base_url.rstrip('/')
+        self._opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirects())
+
+    def request(self, method, path, data=None, headers=None):
+        """Send a request, returning its status code and body."""
+        body = urlencode(data).encode('utf-8') if data is not None else (b'' if method == 'POST' else None)
+        request = Request(self.base_url + path, data=body, headers=headers or {})
+        request.get_method = lambda: method
+        try:
+            response = self._opener.open(request)
+        except HTTPError as error:
+            return error.code, error.read()
+        return response.getcode(), response.read()
+
+
+class Session(object):
+    """A virtual user: a client and its login, timing every request it sends."""
+
+    def __init__(self, client, recorder, username, password):
+        """Create instance."""
+        self.client = client
+        self.recorder = recorder
+        self.username = username
+        self.password = password
+        self.csrf_token = None
+
+    def request(self, method, path, data=None, expect=200):
+        """Send a request, timed under ``<method> <path>``; returns the body, or None if it failed."""
+        headers = {'X-CSRFToken': self.csrf_token} if self.csrf_token and method == 'POST' else {}
+        start = time.time()
+        try:
+            status, body = self.client.request(method, path, data=data, headers=headers)
+        except IOError:
+            status, body = None, None
+        self.recorder.record('{0} {1}'.format(method, path), time.time() - start, ok=status == expect)
+        return body.decode('utf-8') if status == expect else None
+
+    def log_in(self):
+        """Log in through the login form; returns whether it worked."""
+        match = CSRF_TOKEN.search(self.request('GET', '/') or '')
+        if match is None:
+            return False
+        self.csrf_token = match.group(1)
+        form = {'username': self.username, 'password': self.password, 'csrf_token': self.csrf_token}
+        return self.request('POST', '/', data=form, expect=302) is not None
+
+
+@scenario('login')
+def login(session):
+    """Log in again."""
+    session.log_in()
+
+
+@scenario('browse_films')
+def browse_films(session):
+    """Open the films page and load its table."""
+    session.request('GET', '/films/')
+    session.request('POST', '/films/')
+
+
+@scenario('list_payments')
+def list_payments(session):
+    """Open the payments page and load its table."""
+    session.request('GET', '/payments/')
+    session.request('POST', '/payments/')
+
+
+@scenario('list_actors')
+def list_actors(session):
+    """Open the actors page and load its table."""
+    session.request('GET', '/actors/')
+    session.request('POST', '/actors/')
+
+
+class Recorder(object):
+    """Collects request timings from every virtual user."""
+
+    def __init__(self):
+        """Create instance."""
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True):
+        """Record a request."""
+        with self._lock:
+            if ok:
+                self.timings[endpoint].append(seconds * 1000)
+            else:
+                self.errors[endpoint] += 1
+
+
+def percentile(timings, pct):
+    """The pct-th percentile of a list of timings."""
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def summarize(recorder, seconds):
+    """Throughput and latency percentiles per endpoint."""
+    results = OrderedDict()
+    for endpoint in sorted(set(recorder.timings) | set(recorder.errors)):
+        timings = recorder.timings.get(endpoint) or [0.0]
+        results[endpoint] = {
+            'requests': len(recorder.timings.get(endpoint, [])),
+            'errors': recorder.errors.get(endpoint, 0),
+            'requests_per_second': len(recorder.timings.get(endpoint, [])) / seconds,
+            'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+        }
+    return results
+
+
+def run(make_client, username, password, scenarios=None, concurrency=4, duration=10.0, iterations=None):
+    """Run virtual users against the app and summarize the requests they made.
+
+    :param make_client: Returns a new :class:`WSGIClient` or :class:`HTTPClient` per virtual user.
+    :param scenarios: Names of the scenarios each user runs in turn; all of them by default.
+    :param duration: Seconds to run for, unless ``iterations`` is given.
+    :param iterations: Times each user runs through the scenarios.
+    :raises ValueError: If a virtual user can't log in.
+    """
+    scenarios = [SCENARIOS[name] for name in (scenarios or SCENARIOS)]
+    recorder = Recorder()
+    failures = []
+    start = time.time()
+    deadline = None if iterations else start + duration
+
+    def virtual_user():
+        session = Session(make_client(), recorder, username, password)
+        if not session.log_in():
+            failures.append(username)
+            return
+        done = 0
+        while (deadline is None and done < iterations) or (deadline is not None and time.time() < deadline):
+            for func in scenarios:
+                func(session)
+            done += 1
+
+    users = [threading.Thread(target=virtual_user) for _ in range(concurrency)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    if failures:
+        raise ValueError('Could not log in as {0}'.format(username))
+    return summarize(recorder, time.time() - start)
+
+
+def compare(results, baseline):
+    """Relative change of each endpoint's p95 latency and throughput against a baseline."""
+    changes = OrderedDict()
+    for endpoint, result in results.items():
+        before = baseline.get(endpoint)
+        if before and before['p95_ms'] and before['requests_per_second']:
+            changes[endpoint] = {
+                'p95_ms': result['p95_ms'] / before['p95_ms'] - 1,
+                'requests_per_second': result['requests_per_second'] / before['requests_per_second'] - 1,
+            }
+    return changes
+
+
+def save(results, path):
+    """Write results as JSON."""
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
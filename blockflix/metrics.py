@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Prometheus metrics, served at ``/metrics``.
+
+Request latency, response size and throughput are recorded per endpoint and
+blueprint. Each worker also reports its requests in flight, its database
+connection pool and its cache counters after every request.
+
+Under gunicorn every worker is its own process. Point
+``PROMETHEUS_MULTIPROC_DIR`` at an empty directory before the app is first
+imported, and call :func:`child_exit` from gunicorn's ``child_exit`` hook.
+Every worker then writes its metrics to that directory, and whichever worker
+answers ``/metrics`` aggregates all of them.
+"""
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from blockflix.cache import stats as cache_stats
+from blockflix.extensions import db
+
+REQUEST_LATENCY = Histogram(
+    'blockflix_request_duration_seconds', 'Time spent handling a request.',
+    ['blueprint', 'endpoint', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+RESPONSE_SIZE = Histogram(
+    'blockflix_response_size_bytes', 'Size of response bodies.',
+    ['blueprint', 'endpoint'],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000))
+REQUESTS = Counter(
+    'blockflix_requests_total', 'Requests handled.',
+    ['blueprint', 'endpoint', 'method', 'status'])
+IN_FLIGHT = Gauge(
+    'blockflix_requests_in_flight', 'Requests being handled.',
+    multiprocess_mode='livesum')
+POOL_SIZE = Gauge(
+    'blockflix_db_pool_size', 'Connections the database pool keeps open.',
+    multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge(
+    'blockflix_db_pool_checked_out', 'Database connections in use.',
+    multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'blockflix_db_pool_overflow', 'Database connections open beyond the pool size.',
+    multiprocess_mode='livesum')
+CACHE_LOOKUPS = Gauge(
+    'blockflix_cache_lookups', 'Cache lookups since the worker started, by result.',
+    ['result'], multiprocess_mode='livesum')
+
+#: Two-tier cache counter -> ``result`` label of CACHE_LOOKUPS
+CACHE_RESULTS = (('local_hits', 'local_hit'), ('shared_hits', 'shared_hit'), ('misses', 'miss'),
+                 ('coalesced', 'coalesced'), ('stale_served', 'stale'))
+
+
+def multiprocess_dir():
+    """The directory worker processes share their metrics through, if any."""
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+
+def child_exit(server, worker):
+    """Gunicorn hook dropping the live gauges of a worker that exited."""
+    if multiprocess_dir():
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def registry():
+    """The registry to expose: every worker's metrics in multiprocess mode, else this process's."""
+    if not multiprocess_dir():
+        return REGISTRY
+    aggregated = CollectorRegistry()
+    multiprocess.MultiProcessCollector(aggregated)
+    return aggregated
+
+
+def record_process_stats():
+    """Update this worker's pool and cache gauges."""
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        POOL_SIZE.set(pool.size())
+        POOL_CHECKED_OUT.set(pool.checkedout())
+        POOL_OVERFLOW.set(max(pool.overflow(), 0))
+    stats = cache_stats()
+    for counter, result in CACHE_RESULTS:
+        if counter in stats:
+            CACHE_LOOKUPS.labels(result).set(stats[counter])
+
+
+class Metrics(object):
+    """Records request metrics and serves them at ``/metrics``."""
+
+    def __init__(self, app=None):
+        """Create instance."""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks and the ``/metrics`` endpoint, if ``METRICS_ENABLED``."""
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.extensions['metrics'] = self
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.teardown_request(self._finish)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _start(self):
+        g.metrics_start = time.time()
+        IN_FLIGHT.inc()
+
+    def _record(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        blueprint = request.blueprint or ''
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.labels(blueprint, endpoint, request.method).observe(time.time() - start)
+        REQUESTS.labels(blueprint, endpoint, request.method, str(response.status_code)).inc()
+        # Streamed responses have no length until they are sent
+        if response.content_length is not None:
+            RESPONSE_SIZE.labels(blueprint, endpoint).observe(response.content_length)
+        return response
+
+    def _finish(self, exc=None):
+        if g.pop('metrics_start', None) is not None:
+            IN_FLIGHT.dec()
+            record_process_stats()
+
+    def view(self):
+        """The metrics of every worker in Prometheus' text format."""
+        record_process_stats()
+        return generate_latest(registry()), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+
+metrics = Metrics()
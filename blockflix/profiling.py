@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Opt-in sampling profiler for requests.
+
+A sampled request has its thread's stack recorded every ``PROFILE_INTERVAL``
+seconds by a single background thread per worker. Requests are sampled at
+random at ``PROFILE_SAMPLE_RATE``, or when they carry a ``X-Blockflix-Profile``
+header matching ``PROFILE_TOKEN``. Stacks are appended in collapsed
+("folded") format to one file per endpoint and worker under ``PROFILE_DIR``.
+``flask profile report`` merges those files into input for ``flamegraph.pl``
+or speedscope.
+
+With no sample rate and no token configured, no hooks are registered at all.
+"""
+import glob
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Blockflix-Profile'
+
+
+def collapse(frame):
+    """A frame's stack in folded format, outermost call first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{0} ({1}:{2})'.format(code.co_name, code.co_filename, code.co_firstlineno).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(object):
+    """Samples the stacks of the threads it is asked to watch from one background thread."""
+
+    def __init__(self, interval=0.005):
+        """Create instance.
+
+        :param interval: Seconds between samples.
+        """
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+
+    def start(self, thread_id):
+        """Start sampling a thread."""
+        with self._lock:
+            self._watched[thread_id] = Counter()
+            # A sampler thread started before a fork doesn't exist in the child
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='stack-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+            self._wake.notify()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread, returning how many times each of its stacks was seen."""
+        with self._lock:
+            return self._watched.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            # Sleep until there is something to sample, so an idle sampler costs nothing
+            with self._wake:
+                while not self._watched:
+                    self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                frames = sys._current_frames()
+                for thread_id, stacks in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+
+
+def write_stacks(directory, endpoint, stacks):
+    """Append a request's stacks to its endpoint's file for this worker."""
+    if not stacks:
+        return
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '{0}.{1}.folded'.format(endpoint, os.getpid()))
+    with open(path, 'a') as f:
+        for stack, count in stacks.items():
+            f.write('{0} {1}\n'.format(stack, count))
+
+
+def merge(directory, endpoints=None):
+    """Sum the stacks recorded under a directory, each prefixed with its endpoint.
+
+    :param endpoints: Only merge these endpoints.
+    """
+    merged = Counter()
+    for path in glob.glob(os.path.join(directory, '*.folded')):
+        endpoint = os.path.basename(path).rsplit('.', 2)[0]
+        if endpoints and endpoint not in endpoints:
+            continue
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    merged['{0};{1}'.format(endpoint, stack)] += int(count)
+    return merged
+
+
+class Profiler(object):
+    """Samples a fraction of requests, or those carrying the profiling token."""
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.sampler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks, unless profiling is off."""
+        self.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.token = app.config['PROFILE_TOKEN']
+        self.directory = app.config['PROFILE_DIR']
+        if not self.sample_rate and not self.token:
+            return
+        self.sampler = StackSampler(app.config['PROFILE_INTERVAL'])
+        app.extensions['profiler'] = self
+        app.before_request(self._start)
+        app.teardown_request(self._stop)
+
+    def wants_profile(self):
+        """Whether to sample the current request."""
+        if self.token:
+            header = request.headers.get(PROFILE_HEADER)
+            if header and hmac.compare_digest(header.encode('utf-8'), self.token.encode('utf-8')):
+                return True
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def _start(self):
+        if self.wants_profile():
+            g.profiled_thread = threading.current_thread().ident
+            self.sampler.start(g.profiled_thread)
+
+    def _stop(self, exc=None):
+        thread_id = g.pop('profiled_thread', None)
+        if thread_id is not None:
+            stacks = self.sampler.stop(thread_id)
+            write_stacks(self.directory, request.endpoint or 'unmatched', stacks)
+
+
+profiler = Profiler()
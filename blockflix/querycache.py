@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Query-result cache invalidated by table-level version counters.
+
+Every table has a version token kept in the cache tier shared by all workers.
+Cached results are keyed by their compiled SQL, its parameters and the
+current version of every table the query reads, so bumping a table's version
+orphans every result that depended on it, in every worker at once.
+
+Versions are bumped when a transaction that wrote to a table commits, once
+as the COMMIT is sent and again from the Session's ``after_commit`` once it
+has landed, so a result recomputed in between can't outlive the write. Writes
+are recorded from the engine's ``after_execute`` event rather than the
+Session's ``after_flush``, so ``bulk_save_objects``, ``Query.update``/``delete``
+and Core statements count too. Raw SQL strings are matched against a simple
+``INSERT``/``UPDATE``/``DELETE``/``REPLACE`` pattern; anything else that writes
+must call :meth:`QueryCache.invalidate` itself.
+"""
+import hashlib
+import re
+import threading
+import uuid
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import Table
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+from blockflix.cache import get_or_compute
+from blockflix.compat import string_types
+from blockflix.extensions import cache, db
+
+WRITE_STATEMENT = re.compile(r'^\s*(?:INSERT|REPLACE|UPDATE|DELETE)\s+(?:(?:LOW_PRIORITY|IGNORE|QUICK)\s+)*'
+                             r'(?:INTO\s+|FROM\s+)?`?(\w+)`?', re.IGNORECASE)
+
+#: Tables committed by this thread, for the Session's after_commit to bump again
+_committed = threading.local()
+
+
+def written_table(clauseelement):
+    """The name of the table a statement writes to, if it is a write."""
+    if isinstance(clauseelement, UpdateBase):
+        return clauseelement.table.name
+    if isinstance(clauseelement, TextClause):
+        clauseelement = clauseelement.text
+    if isinstance(clauseelement, string_types):
+        match = WRITE_STATEMENT.match(clauseelement)
+        return match.group(1) if match else None
+    return None
+
+
+def read_tables(statement):
+    """The names of every table a statement reads, including through joins and subqueries."""
+    return set(element.name for element in visitors.iterate(statement, {}) if isinstance(element, Table))
+
+
+class QueryCache(object):
+    """Caches query results until a write to a table they read is committed."""
+
+    version_prefix = 'qc:version:'
+    result_prefix = 'qc:result:'
+
+    def __init__(self, app=None):
+        """Create instance."""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the cache with an app and start tracking writes."""
+        app.extensions['query_cache'] = self
+        if not event.contains(Engine, 'after_execute', _record_write):
+            event.listen(Engine, 'after_execute', _record_write)
+            event.listen(Engine, 'commit', _publish_writes)
+            event.listen(Engine, 'rollback', _discard_writes)
+            event.listen(Session, 'after_commit', _republish_writes)
+
+    @property
+    def versions_backend(self):
+        """Where table versions live: the shared tier of a two-tier cache, else the cache itself."""
+        backend = cache.cache
+        return getattr(backend, 'shared', backend)
+
+    def versions(self, tables):
+        """The current version token of each table, starting a fresh one for unversioned tables."""
+        tables = sorted(tables)
+        keys = [self.version_prefix + table for table in tables]
+        backend = self.versions_backend
+        versions = backend.get_many(*keys)
+        for index, version in enumerate(versions):
+            if version is None:
+                # A fresh token rather than a counter, so a version evicted from
+                # the cache can never bring back results cached under it.
+                backend.add(keys[index], uuid.uuid4().hex, timeout=0)
+                versions[index] = backend.get(keys[index])
+        return dict(zip(tables, versions))
+
+    def invalidate(self, *tables):
+        """Orphan every cached result reading any of the tables."""
+        backend = self.versions_backend
+        for table in tables:
+            backend.set(self.version_prefix + table, uuid.uuid4().hex, timeout=0)
+
+    def key(self, query, tables):
+        """The cache key for a query, given the tables it depends on."""
+        compiled = query.statement.compile(dialect=db.engine.dialect)
+        versions = self.versions(tables)
+        digest = hashlib.sha1()
+        digest.update(str(compiled).encode('utf-8'))
+        digest.update(repr(sorted(compiled.params.items())).encode('utf-8'))
+        digest.update(repr(sorted(versions.items())).encode('utf-8'))
+        return self.result_prefix + digest.hexdigest()
+
+    def all(self, query, transform=list, depends_on=(), timeout=None):
+        """The rows of a query passed through ``transform``, cached until one of the tables it reads is written to.
+
+        :param transform: Turns the result rows into something picklable, e.g. a list of dicts.
+        :param depends_on: Further tables ``transform`` reads, e.g. through lazy relationships.
+        :param timeout: Seconds to keep the result; defaults to ``QUERY_CACHE_TIMEOUT``.
+        """
+        if timeout is None:
+            timeout = current_app.config['QUERY_CACHE_TIMEOUT']
+        tables = read_tables(query.statement) | set(depends_on)
+        return get_or_compute(self.key(query, tables), lambda: transform(query.all()), timeout=timeout)
+
+
+def _record_write(conn, clauseelement, multiparams, params, result):
+    """Remember the tables a connection's transaction wrote to."""
+    table = written_table(clauseelement)
+    if table:
+        conn.info.setdefault('query_cache_writes', set()).add(table)
+
+
+def _invalidate(tables):
+    if has_app_context() and 'query_cache' in current_app.extensions:
+        current_app.extensions['query_cache'].invalidate(*tables)
+
+
+def _publish_writes(conn):
+    """Bump the version of every table written by a transaction about to commit."""
+    tables = conn.info.pop('query_cache_writes', None)
+    if tables:
+        _invalidate(tables)
+        _committed.tables = getattr(_committed, 'tables', set()) | tables
+
+
+def _republish_writes(session):
+    """Bump the versions again once the commit has landed."""
+    tables = getattr(_committed, 'tables', None)
+    if tables:
+        _committed.tables = set()
+        _invalidate(tables)
+
+
+def _discard_writes(conn):
+    """Forget writes rolled back with their transaction."""
+    conn.info.pop('query_cache_writes', None)
+
+
+query_cache = QueryCache()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Serving last-known-good results while the database is slow or failing.
+
+:class:`ServeStale` keeps the last good result of each listing. A result
+younger than ``SERVE_STALE_FRESH_FOR`` seconds is served as is. An older one
+is served immediately while a single background refresh, across all workers,
+recomputes it; results are kept for up to ``SERVE_STALE_MAX_AGE`` seconds.
+Only when there is no result young enough does a request wait on the database.
+
+Every database call goes through a :class:`CircuitBreaker`. Calls that fail,
+or take longer than ``DB_BREAKER_LATENCY`` seconds, count against it. After
+``DB_BREAKER_FAILURES`` of them in a row it opens. While it is open, stale
+results are served without refreshing, and requests with nothing to serve get
+a 503 rather than another query. After ``DB_BREAKER_RESET`` seconds a single
+trial call is let through, and the breaker closes again if that call succeeds.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+
+from blockflix.extensions import cache
+
+#: What is kept per key: the last good value and when it was computed.
+Stored = namedtuple('Stored', ['value', 'computed_at'])
+
+
+class CircuitOpenError(ServiceUnavailable):
+    """The circuit breaker is open and there is nothing stale to serve."""
+
+    description = 'The database is overloaded. Please try again in a little while.'
+
+
+class CircuitBreaker(object):
+    """Stops calling a dependency after too many consecutive slow or failed calls."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, latency_threshold=2.0, reset_timeout=30, clock=time.time):
+        """Create instance.
+
+        :param failure_threshold: Consecutive slow or failed calls that open the breaker.
+        :param latency_threshold: Seconds after which a successful call still counts as a failure.
+        :param reset_timeout: Seconds the breaker stays open before letting a trial call through.
+        """
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Closed, open, or half open once ``reset_timeout`` has passed."""
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a call may go through now; a half-open breaker lets one trial call through."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record(self, duration, failed=False):
+        """Count a finished call."""
+        with self._lock:
+            self._trial_running = False
+            if failed or duration > self.latency_threshold:
+                self.failures += 1
+                if self.opened_at is not None or self.failures >= self.failure_threshold:
+                    self.opened_at = self.clock()
+            else:
+                self.failures = 0
+                self.opened_at = None
+
+    def call(self, func):
+        """``func()``, unless the breaker is open.
+
+        :raises CircuitOpenError: When the breaker is open.
+        """
+        if not self.allow():
+            raise CircuitOpenError()
+        start = self.clock()
+        try:
+            result = func()
+        except Exception:  # noqa
+            self.record(self.clock() - start, failed=True)
+            raise
+        self.record(self.clock() - start)
+        return result
+
+
+class ServeStale(object):
+    """Serves the last good result of a computation while one background refresh replaces it."""
+
+    prefix = 'stale:'
+    refresh_timeout = 60  # Seconds before a refresh that never finished may be retried
+
+    def __init__(self, app=None, backend=None):
+        """Create instance.
+
+        :param backend: Where results are kept; defaults to the app's cache.
+        """
+        self._backend = backend
+        self.fresh_for = 5
+        self.max_age = 600
+        self.breaker = CircuitBreaker()
+        self._refreshing = {}
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('fresh', 'stale_served', 'refreshes', 'waited', 'rejected'), 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure from an app's ``SERVE_STALE_*`` and ``DB_BREAKER_*`` settings."""
+        app.extensions['serve_stale'] = self
+        self.fresh_for = app.config['SERVE_STALE_FRESH_FOR']
+        self.max_age = app.config['SERVE_STALE_MAX_AGE']
+        self.breaker = CircuitBreaker(failure_threshold=app.config['DB_BREAKER_FAILURES'],
+                                      latency_threshold=app.config['DB_BREAKER_LATENCY'],
+                                      reset_timeout=app.config['DB_BREAKER_RESET'])
+
+    @property
+    def backend(self):
+        """Where results are kept."""
+        return self._backend if self._backend is not None else cache.cache
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        """How requests were served by this process, and the breaker's state."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['breaker'] = self.breaker.state
+        return stats
+
+    def get(self, key, compute):
+        """The result of ``compute()`` for a key, served stale while the database is slow.
+
+        ``compute`` may run in a background thread with only an app context, so
+        it must not rely on the request (e.g. ``current_user``).
+
+        :raises CircuitOpenError: When there is no result to serve and the breaker is open.
+        """
+        stored = self.backend.get(self.prefix + key)
+        if stored is not None:
+            age = time.time() - stored.computed_at
+            if age < self.fresh_for:
+                self._count('fresh')
+                return stored.value
+            if age < self.max_age:
+                self._count('stale_served')
+                self._refresh_in_background(key, compute)
+                return stored.value
+        self._count('waited')
+        try:
+            return self.refresh(key, compute)
+        except CircuitOpenError:
+            self._count('rejected')
+            raise
+
+    def refresh(self, key, compute):
+        """Recompute a key now and keep the result, e.g. to warm it.
+
+        :raises CircuitOpenError: When the breaker is open.
+        """
+        value = self.breaker.call(compute)
+        self.backend.set(self.prefix + key, Stored(value, time.time()), timeout=self.max_age)
+        return value
+
+    def _refresh_in_background(self, key, compute):
+        """Start recomputing a key, unless it is already being recomputed or the breaker is open."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            # One refresh across workers too, through the tier they share
+            shared = getattr(self.backend, 'shared', self.backend)
+            if not shared.add(self.prefix + 'refreshing:' + key, 1, timeout=self.refresh_timeout):
+                return
+            if not self.breaker.allow():
+                shared.delete(self.prefix + 'refreshing:' + key)
+                return
+            app = current_app._get_current_object() if has_app_context() else None
+            thread = threading.Thread(target=self._refresh, args=(app, key, compute))
+            thread.daemon = True
+            self._refreshing[key] = thread
+        self._count('refreshes')
+        thread.start()
+
+    def _refresh(self, app, key, compute):
+        context = app.app_context() if app is not None else None
+        if context is not None:
+            context.push()
+        start = time.time()
+        try:
+            value = compute()
+        except Exception:  # noqa
+            self.breaker.record(time.time() - start, failed=True)
+            if app is not None:
+                app.logger.exception('Refreshing %s failed, serving the stale result', key)
+        else:
+            self.breaker.record(time.time() - start)
+            self.backend.set(self.prefix + key, Stored(value, time.time()), timeout=self.max_age)
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+            getattr(self.backend, 'shared', self.backend).delete(self.prefix + 'refreshing:' + key)
+            if context is not None:
+                context.pop()
+
+
+serve_stale = ServeStale()
@@ -11,25 +11,37 @@ from numpy.random import choice
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import func
 from blockflix.extensions import db
-from blockflix.store.models import Category, Actor, Film, FilmCategory, FilmActor, \
-                                Address, User, Payment, Rental
+from blockflix.store import film_stats, popularity, revenue
+from blockflix.store.models import Category, Actor, Film, FilmCategory, FilmActor, FilmStat, \
+                                Address, User, UserScore, Payment, PaymentMonthly, Rental, OverdueNotice, ScanCheckpoint
 
 
 CURRENT = date(2017, 1, 1)
 DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..','data')
 
-def simulate():
+def simulate(scale=1):
     """
     Runs the seeding for Blockflix
+    - scale multiplies the number of users (and so payments and rentals);
+      below 1 it also seeds only that fraction of the films
     """
     clear_db()
-    create_films()
-    create_users_payments()
+    create_films(scale)
+    create_users_payments(scale)
     create_rentals()
+    create_film_stats()
+    update_popularity()
+    create_revenue_rollup()
 
 
 def clear_db():
     print("Resetting database...")
+    # Tables derived from the others first, film_stats and user_scores referencing films and users
+    FilmStat.query.delete()
+    UserScore.query.delete()
+    OverdueNotice.query.delete()
+    PaymentMonthly.query.delete()
+    ScanCheckpoint.query.delete()
     FilmActor.query.delete()
     FilmCategory.query.delete()
     Category.query.delete()
@@ -75,10 +87,34 @@ def create_rentals():
 
 
 
-def create_users_payments():
+def create_film_stats():
+    """
+    Count each film's rentals into film_stats, which create_rentals bypasses
+    """
+    print("Building film stats...")
+    film_stats.rebuild()
+
+
+def update_popularity():
+    """
+    Blend each film's TMDB popularity with its rentals
+    """
+    print("Updating popularity...")
+    popularity.refresh(rebuild=True)
+
+
+def create_revenue_rollup():
+    """
+    Roll up every month's payments into payments_monthly
+    """
+    print("Rolling up revenue...")
+    revenue.refresh(rebuild=True)
+
+
+def create_users_payments(scale=1):
     """
     Start from current date until today's date:
-    - Seed a base of n users and create payments for their first month
+    - Seed a base of n users (100 times scale) and create payments for their first month
     - Grow the user base by a random rate 1 month at a time (e.g. 3% per month)
     - Create payments for all users each month, pays 9.99 on the first of the month
     """
@@ -108,12 +144,12 @@ def create_users_payments():
 
     today = date.today()
     current = CURRENT
-    n = 100
+    n = max(1, int(round(100 * scale)))
     min_growth = 3
     max_growth = 5
     amount = 9.99
 
-    # Build the first 100 users
+    # Build the first n users
     users = []
     users_count = 0
     print("Building first {0} users".format(n))
@@ -159,7 +195,7 @@ def create_users_payments():
     session.commit()
 
 
-def create_films():
+def create_films(scale=1):
 
     # Merge movies_metadata.csv with credits.csv, write to list of dicts
     films_df = pd.read_csv(os.path.join(DATA_PATH,'movies_metadata.csv'))
@@ -168,6 +204,8 @@ def create_films():
 
     films_credits_df["popularity"] = pd.to_numeric(films_credits_df["popularity"],errors='coerce')
     film_data = films_credits_df.dropna(subset=['cast','genres']).fillna(0).to_dict('records')
+    if scale < 1:
+        film_data = film_data[:int(len(film_data) * scale)]
 
 
 
@@ -176,8 +214,9 @@ def create_films():
     films = {}
     categories = {}
     actors = {}
-    film_actors = []
-    film_categories = []
+    # Sets, since a cast can list an actor once per role
+    film_actors = set()
+    film_categories = set()
 
     # Process all the films, parse out the actors and the categories
     for row in tqdm(film_data):
@@ -194,6 +233,7 @@ def create_films():
             film["popularity"] = float(row["popularity"])
         except (ValueError, TypeError) as e:
             film["popularity"] = 0
+        film["tmdb_popularity"] = film["popularity"]
         try:
             film["length"] = int(float(row["runtime"]))
         except (ValueError, TypeError) as e:
@@ -207,7 +247,7 @@ def create_films():
             category = {'id': category["id"], 'name': category["name"][0:25]}
             # Add the category and film_category relation to the list, will save later
             categories[category["id"]] = category
-            film_categories.append((category["id"], film["id"]))
+            film_categories.add((category["id"], film["id"]))
 
         # Extract the actor information
         _actors = literal_eval(row["cast"])
@@ -218,7 +258,7 @@ def create_films():
             actor = {'id': actor["id"], 'first_name': actor["first_name"], 'last_name': actor["last_name"]}
             # Add the actor and film_actor relation to the list, will save later
             actors[actor["id"]] = actor
-            film_actors.append((actor["id"], film["id"]))
+            film_actors.add((actor["id"], film["id"]))
 
     print("Saving {0} categories, {1} actors, {2} films...".format(len(categories), len(actors), len(films)))
     db.session.add_all([
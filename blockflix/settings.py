@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """Application configuration."""
+import multiprocessing
 import os
+import tempfile
 
 
 class Config(object):
@@ -12,9 +14,61 @@ class Config(object):
     BCRYPT_LOG_ROUNDS = 13
     DEBUG_TB_ENABLED = False  # Disable Debug toolbar
     DEBUG_TB_INTERCEPT_REDIRECTS = False
-    CACHE_TYPE = 'simple'  # Can be "memcached", "redis", etc.
+    CACHE_TYPE = 'blockflix.cache.two_tier'  # In-process LRU in front of a cache shared by all workers
+    CACHE_DIR = os.environ.get('BLOCKFLIX_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'blockflix-cache'))
+    CACHE_REDIS_URL = os.environ.get('BLOCKFLIX_CACHE_REDIS_URL')  # Share through Redis instead of CACHE_DIR
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_LOCAL_SIZE = 1024  # Entries kept in each worker's in-process tier
+    CACHE_LOCAL_TIMEOUT = 30  # Longest a worker serves a value without checking the shared tier
+    CACHE_STALE_GRACE = 60  # Seconds an expired value is still served while it is recomputed
+    QUERY_CACHE_TIMEOUT = 3600  # Cached query results are also invalidated by writes to their tables
+    SERVE_STALE_FRESH_FOR = 5  # Seconds a listing is served before it is refreshed in the background
+    SERVE_STALE_MAX_AGE = 600  # Oldest listing served while the database is slow or unavailable
+    DB_BREAKER_FAILURES = 5  # Consecutive slow or failed queries that stop further ones
+    DB_BREAKER_LATENCY = 2.0  # Seconds after which a query counts as failed
+    DB_BREAKER_RESET = 30  # Seconds before a query is tried again
+    CACHE_WARM_ON_BOOT = False  # Warm cached listings as each gunicorn worker boots
+    CACHE_WARM_CONCURRENCY = 4  # Listings warmed at once
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    JSON_BACKEND = None  # orjson, ujson or json; the fastest one installed by default
     WEBPACK_MANIFEST_PATH = 'webpack/manifest.json'
+    COMPRESS_ENABLED = True  # gzip/brotli responses and serve precompressed fingerprinted assets
+    COMPRESS_MIN_SIZE = 500  # Bytes below which responses are sent uncompressed
+    COMPRESS_LEVEL = 6  # gzip level for responses compressed on the fly
+    COMPRESS_BROTLI_QUALITY = 4  # brotli quality for responses compressed on the fly
+    COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'application/json',
+                          'application/javascript', 'application/xml', 'image/svg+xml']
+    STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # Cache lifetime of fingerprinted assets in static/build
+    METRICS_ENABLED = True  # Serve Prometheus metrics at /metrics
+    PROFILE_SAMPLE_RATE = float(os.environ.get('BLOCKFLIX_PROFILE_SAMPLE_RATE', 0))  # Fraction of requests profiled
+    PROFILE_TOKEN = os.environ.get('BLOCKFLIX_PROFILE_TOKEN')  # Profile requests sending it as X-Blockflix-Profile
+    PROFILE_DIR = os.environ.get('BLOCKFLIX_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'blockflix-profiles'))
+    PROFILE_INTERVAL = 0.005  # Seconds between stack samples of a profiled request
+    RENTAL_LIMIT = 1  # Films a subscriber may have rented at once
+    RETURNS_CHUNK_SIZE = 1000  # Scanned returns applied per UPDATE and commit
+    OVERDUE_AFTER_DAYS = 30  # Days a film may be kept before it is overdue
+    OVERDUE_GRACE_DAYS = 7  # Days overdue with reminders only, before late fees start
+    LATE_FEE_PER_DAY = 0.5
+    LATE_FEE_MAX = 20.0
+    OVERDUE_CHUNK_SIZE = 1000  # Open rentals read, and notices written, per commit of the overdue scan
+    POPULARITY_HALF_LIFE_DAYS = 14  # Days after which a rental counts half as much toward popularity
+    POPULARITY_PRIOR_WEIGHT = 1.0  # Weight of TMDB's popularity
+    POPULARITY_DEMAND_WEIGHT = 1.0  # Weight of each rental made just now
+    ANALYTICS_CHUNK_SIZE = 100000  # Rows streamed from the database per NumPy array by the analytics
+    COHORT_CACHE_TIMEOUT = 6 * 3600  # Seconds the cohort retention matrix is cached
+    CHURN_MODEL_PATH = os.environ.get('BLOCKFLIX_CHURN_MODEL',
+                                      os.path.join(tempfile.gettempdir(), 'blockflix-churn.pkl'))
+    CHURN_HORIZON_DAYS = 60  # Users who don't pay within this many days have churned
+    CHURN_RECENT_DAYS = 90  # Rentals made within this many days count as recent
+    CHURN_TRAINING_USERS = 200000  # Users sampled, a chunk at a time, to train the model on
+    CHURN_CHUNK_SIZE = 20000  # User ids per feature query, scoring task and upsert
+    CHURN_PROCESSES = multiprocessing.cpu_count()  # Processes scoring chunks at once
+    EXPORT_ROW_GROUP_SIZE = 100000  # Rows per row group (and per fetch) of `flask export`
+    EXPORT_COMPRESSION = 'snappy'  # Parquet compression codec of exports
+    EXPORT_WATERMARK_LAG = 60  # Seconds before the start of an export that it exports changes up to
+    HISTORY_CHUNK_SIZE = 1000  # Rows fetched and written per piece of a streamed history download
+    PARTITION_RETENTION_MONTHS = 24  # Months of payments/rentals kept out of the archive tables
+    PARTITION_MONTHS_AHEAD = 3  # Empty monthly partitions kept ready ahead of today
 
 
 class ProdConfig(Config):
@@ -44,7 +98,6 @@ class DevConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'mysql://{user}:{password}@{host}/{database}'\
                               .format(user=user, password=password, host=host, database=database)
     DEBUG_TB_ENABLED = True
-    CACHE_TYPE = 'simple'  # Can be "memcached", "redis", etc.
 
 
 class TestConfig(Config):
@@ -55,3 +108,5 @@ class TestConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'mysql://root@localhost/blockflix_test'
     BCRYPT_LOG_ROUNDS = 4  # For faster tests; needs at least 4 to avoid "ValueError: Invalid rounds"
     WTF_CSRF_ENABLED = False  # Allows form testing
+    CACHE_TYPE = 'simple'  # Keep each test app's cache to itself
+    CHURN_PROCESSES = 1  # Score in the test's own process
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 """Store controller."""
-from flask import Blueprint, render_template, flash, redirect, request, url_for
+import datetime as dt
+
+from flask import Blueprint, current_app, render_template, flash, redirect, request, stream_with_context, url_for
 from flask_login import login_required, current_user
-from flask import jsonify
-from blockflix.store.models import Film, Actor, Category, Payment
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound
+from blockflix.analytics import cohorts
+from blockflix.serializers import json_response
+from blockflix.store import history, listings, queries, rentals, returns, revenue, serializers
+from blockflix.store.models import User
 
 
 api_blueprint = Blueprint('api', __name__, url_prefix='/api', static_folder='../static')
@@ -18,30 +23,46 @@ payment_blueprint = Blueprint('payments', __name__, url_prefix='/payments', stat
 def films():
     """List films."""
     if request.method == 'POST':
-        films = Film.query.order_by(Film.popularity.desc()).limit(100).all()
-        films = [film.to_dict() for film in films]
-        return jsonify({'data': films})
+        films = listings.top_films()
+        return json_response({'data': films})
     return render_template('films/index.html')
 
 @payment_blueprint.route('/', methods=['GET', 'POST'])
 @login_required
 def payments():
-    """List payments."""
+    """List payments, including archived ones when ``archived=1`` is passed."""
     if request.method == 'POST':
-        print(current_user)
-        payments = Payment.query.filter(Payment.user_id == current_user.get_id()).all()
-        payments = [payment.to_dict() for payment in payments]
-        return jsonify({'data': payments})
+        include_archived = request.values.get('archived', default=0, type=int)
+        payments = queries.user_payment_history(current_user.get_id(), include_archived=bool(include_archived))
+        payments = serializers.payments(payments, user=current_user.full_name)
+        return json_response({'data': payments})
     return render_template('payments/index.html')
 
+@payment_blueprint.route('/history.csv', methods=['GET'])
+@login_required
+def payment_history_csv():
+    """Download every rental and payment, archived ones included, as CSV; staff may pass another ``user_id``."""
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None or user_id == current_user.id:
+        user = current_user
+    elif not current_user.is_admin:
+        raise Forbidden('Only staff can download another user\'s history.')
+    else:
+        user = User.query.get(user_id)
+        if user is None:
+            raise NotFound('No user {0}.'.format(user_id))
+    chunks = history.csv_chunks(user.id, current_app.config['HISTORY_CHUNK_SIZE'])
+    response = current_app.response_class(stream_with_context(chunks), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=blockflix-history-{0}.csv'.format(user.id)
+    return response
+
 @actor_blueprint.route('/', methods=['GET', 'POST'])
 @login_required
 def actors():
     """List actors."""
     if request.method == 'POST':
-        actors = Actor.query.all()
-        actors = [actor.to_dict() for actor in actors]
-        return jsonify({'data': actors})
+        actors = listings.all_actors()
+        return json_response({'data': actors})
     return render_template('actors/index.html')
 
 
@@ -50,7 +71,78 @@ def actors():
 def categories():
     """List categories."""
     if request.method == 'POST':
-        categories = Category.query.all()
-        categories = [category.to_dict() for category in categories]
-        return jsonify({'data': categories})
+        categories = listings.all_categories()
+        return json_response({'data': categories})
     return render_template('categories/index.html')
+
+
+def api_error(error):
+    """Errors as JSON."""
+    return json_response({'error': error.description}, error.code)
+
+
+# By code, since the app's own handlers for a code take precedence over a blueprint's for a class
+for code in (400, 401, 403, 404, 409):
+    api_blueprint.errorhandler(code)(api_error)
+
+
+@api_blueprint.route('/rentals/', methods=['POST'])
+@login_required
+def checkout():
+    """Rent the film ``film_id``."""
+    film_id = request.values.get('film_id', type=int)
+    if film_id is None:
+        raise BadRequest('film_id is required.')
+    rental = rentals.checkout(current_user.id, film_id)
+    return json_response(serializers.rental(rental), 201)
+
+
+@api_blueprint.route('/rentals/<int:rental_id>/return', methods=['POST'])
+@login_required
+def return_film(rental_id):
+    """Return a rented film."""
+    rental = rentals.return_film(current_user.id, rental_id)
+    return json_response(serializers.rental(rental))
+
+
+@api_blueprint.route('/returns/', methods=['POST'])
+@login_required
+def batch_returns():
+    """Return the rentals scanned by a kiosk or drop box, posted as ``{"returns": [...]}``."""
+    if not current_user.is_admin:
+        raise Forbidden('Only staff can process returns.')
+    records = (request.get_json(silent=True) or {}).get('returns')
+    if not isinstance(records, list):
+        raise BadRequest('Post the scans as {"returns": [...]}.')
+    try:
+        scans = [returns.parse_scan(record) for record in records]
+    except (AttributeError, TypeError, ValueError) as error:
+        raise BadRequest(str(error))
+    outcomes = list(returns.process(scans, current_app.config['RETURNS_CHUNK_SIZE']))
+    return json_response({
+        'summary': dict(returns.summarize(outcomes)),
+        'returns': [{'rental_id': outcome.rental_id, 'status': outcome.status} for outcome in outcomes],
+    })
+
+
+@api_blueprint.route('/revenue/', methods=['GET'])
+@login_required
+def revenue_report():
+    """Revenue by month, from the ``from`` through the ``to`` month (as ``YYYY-MM``), read from the rollup."""
+    if not current_user.is_admin:
+        raise Forbidden('Only staff can see revenue.')
+    try:
+        first, last = [dt.datetime.strptime(request.args[key], '%Y-%m') if request.args.get(key) else None
+                       for key in ('from', 'to')]
+    except ValueError:
+        raise BadRequest('Give months as YYYY-MM.')
+    return json_response({'data': serializers.revenue(serializers.revenue.query(revenue.months(first, last)))})
+
+
+@api_blueprint.route('/analytics/cohorts/', methods=['GET'])
+@login_required
+def cohort_retention():
+    """Retention of each signup cohort by month, cached (see ``flask analytics cohorts``)."""
+    if not current_user.is_admin:
+        raise Forbidden('Only staff can see analytics.')
+    return json_response(cohorts.report())
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Per-film rental counters, materialized in ``film_stats``.
+
+Checkouts and returns update the counters of their films in their own
+transactions, so the films listing can show them without counting
+``rentals``. :func:`rebuild` recomputes every counter from ``rentals`` and
+``rentals_archive`` in a single statement, e.g. after seeding or to repair
+drift. Checkouts wait for it to commit.
+"""
+from sqlalchemy import case, func, select, union_all
+from sqlalchemy.dialects.mysql import insert
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store.models import FilmStat, Rental, RentalArchive
+
+film_stats = FilmStat.__table__
+
+
+def rented(film_id, rental_date):
+    """Count a new rental of a film, in the current transaction."""
+    statement = insert(film_stats).values(film_id=film_id, active_rentals=1, lifetime_rentals=1,
+                                          last_rented=rental_date)
+    db.session.execute(statement.on_duplicate_key_update(
+        active_rentals=film_stats.c.active_rentals + 1,
+        lifetime_rentals=film_stats.c.lifetime_rentals + 1,
+        last_rented=func.greatest(func.coalesce(film_stats.c.last_rented, statement.inserted.last_rented),
+                                  statement.inserted.last_rented),
+        last_update=func.now(),
+    ))
+
+
+def returned(counts):
+    """Count returned rentals, given as film id -> rentals returned, in the current transaction."""
+    if not counts:
+        return
+    db.session.execute(
+        film_stats.update()
+        .where(film_stats.c.film_id.in_(counts))
+        .values(active_rentals=func.greatest(film_stats.c.active_rentals - case(counts, value=film_stats.c.film_id),
+                                             0)))
+
+
+def rebuild():
+    """Recompute every film's counters from its rentals, archived ones included, and commit."""
+    rentals = Rental.__table__
+    archive = RentalArchive.__table__
+    history = union_all(
+        select([rentals.c.film_id, rentals.c.rental_date, rentals.c.return_date]),
+        select([archive.c.film_id, archive.c.rental_date, archive.c.return_date]),
+    ).alias('history')
+    counters = select([
+        history.c.film_id,
+        func.sum(case([(history.c.return_date.is_(None), 1)], else_=0)),
+        func.count(),
+        func.max(history.c.rental_date),
+    ]).group_by(history.c.film_id)
+
+    def transaction():
+        db.session.execute(film_stats.delete())
+        db.session.execute(film_stats.insert().from_select(
+            ['film_id', 'active_rentals', 'lifetime_rentals', 'last_rented'], counters))
+        db.session.commit()
+
+    retry_on_deadlock(transaction)
@@ -5,6 +5,7 @@ from wtforms import PasswordField, StringField
 from wtforms.validators import DataRequired, Email, EqualTo, Length
 
 from .models import User
+from .queries import user_by_email
 
 
 class RegisterForm(FlaskForm):
@@ -37,7 +38,7 @@ class RegisterForm(FlaskForm):
         if user:
             self.username.errors.append('Username already registered')
             return False
-        user = User.query.filter_by(email=self.email.data).first()
+        user = user_by_email(self.email.data).first()
         if user:
             self.email.errors.append('Email already registered')
             return False
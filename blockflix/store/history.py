@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""A subscriber's full rental and payment history, as a streamed CSV download.
+
+Rentals (with their film's title) and payments, archived ones included, come
+from one query in date order, read through a server-side cursor
+``HISTORY_CHUNK_SIZE`` rows at a time. Each chunk is written as CSV and sent
+before the next is read, so memory use does not grow with the history, and
+the compression middleware gzips the response as it goes.
+"""
+import csv
+import io
+
+from sqlalchemy import literal, null, select, union_all
+
+from blockflix.compat import PY2, text_type
+from blockflix.extensions import db
+from blockflix.serializers import format_dates
+from blockflix.store.models import Film, Payment, PaymentArchive, Rental, RentalArchive
+
+HEADER = ('type', 'date', 'film', 'returned', 'amount')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def statement(user_id):
+    """A user's rentals and payments as (type, date, film, returned, amount) rows, oldest first."""
+    films = Film.__table__
+    rentals = [select([literal('rental').label('type'), table.c.rental_date.label('date'), films.c.title.label('film'),
+                       table.c.return_date.label('returned'), null().label('amount')])
+               .select_from(table.join(films, films.c.id == table.c.film_id))
+               .where(table.c.user_id == user_id)
+               for table in (Rental.__table__, RentalArchive.__table__)]
+    payments = [select([literal('payment').label('type'), table.c.payment_date.label('date'), null().label('film'),
+                        null().label('returned'), table.c.amount])
+                .where(table.c.user_id == user_id)
+                for table in (Payment.__table__, PaymentArchive.__table__)]
+    return union_all(*(rentals + payments)).order_by('date')
+
+
+def format_amounts(values):
+    """Format a column of amounts to the cent, leaving missing ones blank."""
+    return ['' if value is None else '{0:.2f}'.format(value) for value in values]
+
+
+def encoded(rows):
+    """Rows as the csv module writes them: text encoded to UTF-8 bytes on Python 2, as is on Python 3."""
+    if not PY2:
+        return rows
+    return [[value.encode('utf-8') if isinstance(value, text_type) else value for value in row] for row in rows]
+
+
+def csv_chunks(user_id, chunk_size):
+    """A user's history as CSV text, the header first and then a piece per ``chunk_size`` rows."""
+    # The csv module writes bytes on Python 2
+    buffer = io.BytesIO() if PY2 else io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    yield buffer.getvalue()
+
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement(user_id))
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            kinds, dates, films, returned, amounts = zip(*rows)
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(encoded(zip(kinds, format_dates(dates, DATE_FORMAT), films,
+                                         format_dates(returned, DATE_FORMAT), format_amounts(amounts))))
+            yield buffer.getvalue()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Store listings served from the cache and warmed on deploy."""
+from blockflix.querycache import query_cache
+from blockflix.store import queries, serializers
+from blockflix.warmup import warmed
+
+
+@warmed('films:top')
+def top_films():
+    """The most popular films, as listed on /films/."""
+    return query_cache.all(serializers.films.query(queries.top_films()), serializers.films)
+
+
+@warmed('actors:all')
+def all_actors():
+    """Every actor, as listed on /actors/."""
+    return query_cache.all(serializers.actors.query(queries.all_actors()), serializers.actors)
+
+
+@warmed('categories:all')
+def all_categories():
+    """Every category, as listed on /categories/."""
+    return query_cache.all(serializers.categories.query(queries.all_categories()), serializers.categories)
@@ -10,30 +10,33 @@ from blockflix.database import Column, Model, SurrogatePK, db, reference_col, re
 from blockflix.extensions import bcrypt
 
 """
-Association Tables: Tables used for many-to-many relationships, no need to
-                    create classes since these won't be referenced in ORM layer
+Association Tables: Tables used for many-to-many relationships. Each row is
+                    keyed by the pair it relates, film first, so cast and
+                    category lookups by film read the clustered primary key
+                    and the reverse index covers lookups from the other side.
 """
 
-films_actors = db.Table('films_actors',
-    db.Column('actor_id', db.Integer, db.ForeignKey('actors.id'), nullable=False),
-    db.Column('film_id', db.Integer, db.ForeignKey('films.id'), nullable=False)
-)
 
-films_categories = db.Table('films_categories',
-    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), nullable=False),
-    db.Column('film_id', db.Integer, db.ForeignKey('films.id'), nullable=False)
-)
-
-class FilmCategory(SurrogatePK, Model):
+class FilmCategory(Model):
     __tablename__ = 'films_categories'
-    category_id = Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    film_id = Column(db.Integer, db.ForeignKey('films.id'), nullable=False)
+    __table_args__ = (
+        db.Index('ix_films_categories_category_id_film_id', 'category_id', 'film_id'),
+    )
+    film_id = Column(db.Integer, db.ForeignKey('films.id'), primary_key=True, autoincrement=False)
+    category_id = Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True, autoincrement=False)
 
 
-class FilmActor(SurrogatePK, Model):
+class FilmActor(Model):
     __tablename__ = 'films_actors'
-    actor_id = Column(db.Integer, db.ForeignKey('actors.id'), nullable=False)
-    film_id = Column(db.Integer, db.ForeignKey('films.id'), nullable=False)
+    __table_args__ = (
+        db.Index('ix_films_actors_actor_id_film_id', 'actor_id', 'film_id'),
+    )
+    film_id = Column(db.Integer, db.ForeignKey('films.id'), primary_key=True, autoincrement=False)
+    actor_id = Column(db.Integer, db.ForeignKey('actors.id'), primary_key=True, autoincrement=False)
+
+
+films_categories = FilmCategory.__table__
+films_actors = FilmActor.__table__
 
 
 class Role(SurrogatePK, Model):
@@ -59,13 +62,13 @@ class User(UserMixin, SurrogatePK, Model):
     first_name = Column(db.String(45), nullable=False)
     last_name = Column(db.String(45), nullable=False)
     picture = Column(mysql.BLOB())
-    email = Column(db.String(50))
+    email = Column(db.String(50), index=True)
     active = Column(db.Boolean())
     username = Column(db.String(80), unique=True, nullable=False)
     #: The hashed password
     password = Column(db.Binary(128), nullable=True)
     created_at = Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
-    last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
+    last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now(), index=True)
     is_admin = Column(db.Boolean(), default=False)
 
     def __init__(self, username, email, password=None, **kwargs):
@@ -158,10 +161,14 @@ class Film(SurrogatePK, Model):
     title = Column(db.String(45), nullable=False)
     description = Column(mysql.TEXT(), nullable=False)
     poster_url = Column(db.String(500))
-    release_date = Column(db.Date)
+    release_date = Column(db.Date, index=True)
     language_id = db.Column(db.Integer, db.ForeignKey('languages.id'))
     original_language_id = db.Column(db.Integer, db.ForeignKey('languages.id'))
-    popularity = Column(db.Float())
+    #: TMDB popularity blended with recent rentals, see store.popularity
+    popularity = Column(db.Float(), index=True)
+    tmdb_popularity = Column(db.Float())
+    #: Decayed rental count, relative to store.popularity.EPOCH
+    demand = Column(mysql.DOUBLE(), nullable=False, default=0, server_default='0')
     length = Column(db.Integer())
     replacement_cost =  Column(db.Float())
     last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
@@ -183,6 +190,17 @@ class Film(SurrogatePK, Model):
         }
 
 
+class FilmStat(Model):
+    """Rental counters of a film, kept up to date as films are rented and returned."""
+
+    __tablename__ = 'film_stats'
+    film_id = Column(db.Integer, db.ForeignKey('films.id'), primary_key=True, autoincrement=False)
+    active_rentals = Column(db.Integer, nullable=False, default=0)
+    lifetime_rentals = Column(db.Integer, nullable=False, default=0)
+    last_rented = Column(db.DateTime)
+    last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
+
+
 class Language(SurrogatePK, Model):
     __tablename__ = 'languages'
     name = Column(db.String(45), nullable=False)
@@ -190,7 +208,14 @@ class Language(SurrogatePK, Model):
 
 
 class Payment(SurrogatePK, Model):
+    # On MySQL this table is range-partitioned by month (see store.partitions),
+    # which drops its foreign keys and extends the primary key to (id, payment_date).
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_user_id_payment_date', 'user_id', 'payment_date'),
+        db.Index('ix_payments_last_update', 'last_update'),  # Incremental exports
+        SurrogatePK.__table_args__,
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     amount = Column(db.Float(), nullable=False)
     payment_date = Column(db.DateTime, nullable=False, server_default=func.now())
@@ -205,8 +230,39 @@ class Payment(SurrogatePK, Model):
         }
 
 
+class PaymentMonthly(Model):
+    """Revenue of a month, rolled up from its payments, archived ones included."""
+
+    __tablename__ = 'payments_monthly'
+    month = Column(db.Date, primary_key=True)  # The first of the month
+    amount = Column(mysql.DOUBLE(), nullable=False, default=0)
+    payments = Column(db.Integer, nullable=False, default=0)
+    payers = Column(db.Integer, nullable=False, default=0)
+    # Payers whose first payment ever was in this month
+    new_payers = Column(db.Integer, nullable=False, default=0)
+    last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
+
+
+class UserScore(Model):
+    """A user's churn risk, as of the nightly scoring job."""
+
+    __tablename__ = 'user_scores'
+    user_id = Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, autoincrement=False)
+    churn_risk = Column(mysql.FLOAT(), nullable=False)  # Probability of not paying again within the horizon
+    scored_on = Column(db.Date, nullable=False)
+
+
 class Rental(SurrogatePK, Model):
+    # Partitioned by month of rental_date on MySQL, like payments.
     __tablename__ = 'rentals'
+    __table_args__ = (
+        db.Index('ix_rentals_user_id_return_date', 'user_id', 'return_date'),
+        # Open rentals in id order, for the overdue scan; InnoDB appends the
+        # rest of the primary key, so the rental_date filter reads the index too
+        db.Index('ix_rentals_return_date_id', 'return_date', 'id'),
+        db.Index('ix_rentals_last_update', 'last_update'),  # Incremental exports
+        SurrogatePK.__table_args__,
+    )
     rental_date = Column(db.DateTime, nullable=False, default=dt.datetime.utcnow)
     film_id = db.Column(db.Integer, db.ForeignKey('films.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -214,3 +270,65 @@ class Rental(SurrogatePK, Model):
     last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
     film = db.relationship('Film', foreign_keys=[film_id], backref='rentals', lazy=True)
     user = db.relationship('User', foreign_keys=[user_id], backref='rentals', lazy=True)
+
+
+class OverdueNotice(SurrogatePK, Model):
+    """A reminder or late fee for a rental kept past its due date, as of a day's overdue scan."""
+
+    __tablename__ = 'overdue_notices'
+    __table_args__ = (
+        db.UniqueConstraint('rental_id', 'notice_date', name='uq_overdue_notices_rental_id_notice_date'),
+        db.Index('ix_overdue_notices_notice_date_kind', 'notice_date', 'kind'),
+        SurrogatePK.__table_args__,
+    )
+    rental_id = Column(db.Integer, nullable=False)
+    user_id = Column(db.Integer, nullable=False)
+    film_id = Column(db.Integer, nullable=False)
+    email = Column(db.String(50))
+    first_name = Column(db.String(45))
+    film_title = Column(db.String(45))
+    rental_date = Column(db.DateTime, nullable=False)
+    days_overdue = Column(db.Integer, nullable=False)
+    kind = Column(db.String(10), nullable=False)  # 'reminder' or 'late_fee'
+    late_fee = Column(db.Float(), nullable=False, default=0)
+    notice_date = Column(db.Date, nullable=False)
+
+
+class ScanCheckpoint(Model):
+    """How far a resumable scan has got, by name."""
+
+    __tablename__ = 'scan_checkpoints'
+    name = Column(db.String(80), primary_key=True)
+    last_id = Column(db.Integer, nullable=False, default=0)
+    last_update = Column(db.DateTime, nullable=False, onupdate=func.now(), server_default=func.now())
+
+
+class PaymentArchive(Model):
+    """Payments moved out of the partitioned ``payments`` table once they pass the retention window."""
+
+    __tablename__ = 'payments_archive'
+    __table_args__ = (
+        db.Index('ix_payments_archive_user_id_payment_date', 'user_id', 'payment_date'),
+        {'mysql_row_format': 'COMPRESSED'},
+    )
+    id = Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = Column(db.Integer, nullable=False)
+    amount = Column(db.Float(), nullable=False)
+    payment_date = Column(db.DateTime, nullable=False)
+    last_update = Column(db.DateTime, nullable=False)
+
+
+class RentalArchive(Model):
+    """Returned rentals moved out of the partitioned ``rentals`` table once they pass the retention window."""
+
+    __tablename__ = 'rentals_archive'
+    __table_args__ = (
+        db.Index('ix_rentals_archive_user_id_rental_date', 'user_id', 'rental_date'),
+        {'mysql_row_format': 'COMPRESSED'},
+    )
+    id = Column(db.Integer, primary_key=True, autoincrement=False)
+    rental_date = Column(db.DateTime, nullable=False)
+    film_id = Column(db.Integer, nullable=False)
+    user_id = Column(db.Integer, nullable=False)
+    return_date = Column(db.DateTime)
+    last_update = Column(db.DateTime, nullable=False)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""The nightly scan for overdue rentals.
+
+Open rentals rented more than ``OVERDUE_AFTER_DAYS`` ago get a notice: a
+reminder for the first ``OVERDUE_GRACE_DAYS`` days, then a late fee of
+``LATE_FEE_PER_DAY`` per further day, up to ``LATE_FEE_MAX``.
+
+The scan reads open rentals a page at a time in id order, resuming after the
+last id of the previous page (over ``ix_rentals_return_date_id``), and each
+page fetches its users' and films' details in the same query. A page's
+notices are inserted in one statement, in the same transaction that moves
+the scan's checkpoint past it. Memory use is therefore that of one page,
+however many rentals are open. An interrupted scan picks up after the last
+page it committed. Notices are unique per rental and day, so a page that is
+scanned again writes nothing new.
+"""
+import datetime as dt
+from collections import namedtuple
+
+from flask import current_app
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store import queries
+from blockflix.store.models import OverdueNotice, ScanCheckpoint
+
+REMINDER = 'reminder'
+LATE_FEE = 'late_fee'
+
+FeeSchedule = namedtuple('FeeSchedule', ['overdue_after_days', 'grace_days', 'fee_per_day', 'max_fee'])
+Page = namedtuple('Page', ['last_id', 'scanned', 'written'])
+
+
+def fee_schedule(config):
+    """The fee schedule set in an app's config."""
+    return FeeSchedule(config['OVERDUE_AFTER_DAYS'], config['OVERDUE_GRACE_DAYS'], config['LATE_FEE_PER_DAY'],
+                       config['LATE_FEE_MAX'])
+
+
+def notice_for(row, today, schedule):
+    """The notice for an overdue rental row, as inserted into ``overdue_notices``."""
+    days_overdue = (today - row.rental_date.date()).days - schedule.overdue_after_days
+    late_days = days_overdue - schedule.grace_days
+    late_fee = min(schedule.max_fee, round(late_days * schedule.fee_per_day, 2)) if late_days > 0 else 0.0
+    return {
+        'rental_id': row.id,
+        'user_id': row.user_id,
+        'film_id': row.film_id,
+        'email': row.email,
+        'first_name': row.first_name,
+        'film_title': row.title,
+        'rental_date': row.rental_date,
+        'days_overdue': days_overdue,
+        'kind': LATE_FEE if late_fee else REMINDER,
+        'late_fee': late_fee,
+        'notice_date': today,
+    }
+
+
+def checkpoint_name(today):
+    """The name the scan of a day keeps its checkpoint under."""
+    return 'overdue:{0:%Y-%m-%d}'.format(today)
+
+
+def scan(today=None, chunk_size=None, restart=False, schedule=None):
+    """Write the notices for a day's overdue rentals, yielding a :class:`Page` as each one is committed.
+
+    :param today: Day of the scan; resuming applies to scans of the same day.
+    :param chunk_size: Rentals per page (default: ``OVERDUE_CHUNK_SIZE``).
+    :param restart: Scan from the first open rental, rather than after the checkpoint.
+    """
+    today = today or dt.date.today()
+    chunk_size = chunk_size or current_app.config['OVERDUE_CHUNK_SIZE']
+    schedule = schedule or fee_schedule(current_app.config)
+    rented_before = dt.datetime.combine(today - dt.timedelta(days=schedule.overdue_after_days), dt.time())
+    name = checkpoint_name(today)
+    checkpoint = None if restart else ScanCheckpoint.query.get(name)
+    last_id = checkpoint.last_id if checkpoint else 0
+
+    while True:
+        rows = queries.overdue_rentals(rented_before, last_id, chunk_size).all()
+        if not rows:
+            return
+        notices = [notice_for(row, today, schedule) for row in rows]
+        last_id = rows[-1].id
+
+        def write():
+            written = db.session.execute(OverdueNotice.__table__.insert().prefix_with('IGNORE', dialect='mysql'),
+                                         notices).rowcount
+            db.session.merge(ScanCheckpoint(name=name, last_id=last_id))
+            db.session.commit()
+            return written
+
+        yield Page(last_id, len(rows), retry_on_deadlock(write))
+        if len(rows) < chunk_size:
+            return
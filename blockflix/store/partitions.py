@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Monthly range partitions for payments and rentals, and archival of cold history.
+
+On MySQL, ``payments`` and ``rentals`` are partitioned by month of their date
+column, one partition per month named ``pYYYYMM`` plus a catch-all ``pmax``.
+:func:`maintain` keeps partitions created ahead of time and moves partitions
+older than the retention window into the compressed archive tables.
+"""
+import datetime as dt
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import text
+
+from blockflix.extensions import db
+
+#: Partitioned table -> (partition column, archive table)
+PARTITIONED_TABLES = OrderedDict([
+    ('payments', ('payment_date', 'payments_archive')),
+    ('rentals', ('rental_date', 'rentals_archive')),
+])
+
+Partition = namedtuple('Partition', ['name', 'month'])
+
+
+def add_months(month, months):
+    """The first day of the month ``months`` after (or before) ``month``."""
+    years, index = divmod(month.month - 1 + months, 12)
+    return dt.date(month.year + years, index + 1, 1)
+
+
+def partition_name(month):
+    """The name of the partition holding a month."""
+    return 'p{0:%Y%m}'.format(month)
+
+
+def partition_definitions(first_month, last_month):
+    """``PARTITION ... VALUES LESS THAN`` clauses from first_month to last_month, plus ``pmax``."""
+    clauses = []
+    month = first_month
+    while month <= last_month:
+        clauses.append("PARTITION {0} VALUES LESS THAN ('{1:%Y-%m-%d}')".format(
+            partition_name(month), add_months(month, 1)))
+        month = add_months(month, 1)
+    clauses.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+    return clauses
+
+
+def list_partitions(connection, table):
+    """The monthly partitions of a table, oldest first; empty if it is not partitioned."""
+    rows = connection.execute(text(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL '
+        'ORDER BY PARTITION_ORDINAL_POSITION'), table=table)
+    partitions = []
+    for (name,) in rows:
+        if name != 'pmax':
+            partitions.append(Partition(name, dt.datetime.strptime(name, 'p%Y%m').date()))
+    return partitions
+
+
+def maintain(retention_months, months_ahead, today=None, dry_run=False):
+    """Create upcoming partitions and archive expired ones.
+
+    Yields a ``(table, action)`` line for everything done (or, with ``dry_run``,
+    everything that would be done).
+
+    :param retention_months: Months of history kept in the partitioned tables.
+    :param months_ahead: Months of empty partitions to keep ready ahead of today.
+    """
+    current = (today or dt.date.today()).replace(day=1)
+    cutoff = add_months(current, -retention_months)
+
+    with db.engine.connect() as connection:
+        def run(sql):
+            if not dry_run:
+                connection.execute(text(sql))
+
+        for table, (column, archive) in PARTITIONED_TABLES.items():
+            partitions = list_partitions(connection, table)
+            if not partitions:
+                yield table, 'not partitioned, skipped'
+                continue
+
+            last_month = partitions[-1].month
+            wanted = add_months(current, months_ahead)
+            if last_month < wanted:
+                run('ALTER TABLE {0} REORGANIZE PARTITION pmax INTO ({1})'.format(
+                    table, ', '.join(partition_definitions(add_months(last_month, 1), wanted))))
+                yield table, 'added partitions through {0}'.format(partition_name(wanted))
+
+            for partition in partitions:
+                if add_months(partition.month, 1) > cutoff:
+                    break
+                if table == 'rentals':
+                    open_rentals = connection.execute(text(
+                        'SELECT COUNT(*) FROM rentals PARTITION ({0}) '
+                        'WHERE return_date IS NULL'.format(partition.name))).scalar()
+                    if open_rentals:
+                        yield table, 'kept {0}, {1} rentals still open'.format(partition.name, open_rentals)
+                        continue
+                archive_partition(connection, table, partition.name, run)
+                yield table, 'archived {0} into {1}'.format(partition.name, archive)
+
+
+def archive_partition(connection, table, partition, run):
+    """Move a partition's rows into the archive table and drop the partition, losing none written meanwhile.
+
+    The partition is swapped with an empty staging table in one step, so the
+    bulk of its rows are copied from the staging table without blocking the
+    live one. Rows written to the partition after the swap are copied, and the
+    partition dropped, under a write lock, so none can land in between.
+
+    :param run: Runs a statement on ``connection`` (or, in a dry run, doesn't).
+    """
+    archive = PARTITIONED_TABLES[table][1]
+    columns = ', '.join(db.metadata.tables[archive].columns.keys())
+    staging = '{0}_archiving'.format(table)
+    copy = 'INSERT IGNORE INTO {0} ({1}) SELECT {1} FROM {{0}}'.format(archive, columns)
+
+    # INSERT IGNORE makes archiving the rows left by an interrupted run harmless
+    if connection.dialect.has_table(connection, staging):
+        run(copy.format(staging))
+        run('DROP TABLE {0}'.format(staging))
+    run('CREATE TABLE {0} LIKE {1}'.format(staging, table))
+    run('ALTER TABLE {0} REMOVE PARTITIONING'.format(staging))
+    run('ALTER TABLE {0} EXCHANGE PARTITION {1} WITH TABLE {2}'.format(table, partition, staging))
+    run(copy.format(staging))
+
+    run('LOCK TABLES {0} WRITE, {1} WRITE'.format(table, archive))
+    try:
+        run(copy.format('{0} PARTITION ({1})'.format(table, partition)))
+        run('ALTER TABLE {0} DROP PARTITION {1}'.format(table, partition))
+    finally:
+        run('UNLOCK TABLES')
+    run('DROP TABLE {0}'.format(staging))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Film popularity from recent rentals, blended with TMDB's.
+
+Each rental counts toward its film's demand with a weight that halves every
+``POPULARITY_HALF_LIFE_DAYS``. ``films.popularity``, which the films listing
+sorts by, is ``POPULARITY_PRIOR_WEIGHT`` times the TMDB popularity plus
+``POPULARITY_DEMAND_WEIGHT`` times the film's demand.
+
+Decay is the same for every film. So ``films.demand`` keeps each rental at
+its weight as of the fixed :data:`EPOCH`, ``exp(rate * (rental_date -
+EPOCH))``, and a past rental's weight never has to change. A refresh adds
+only the rentals made since the previous refresh, to the films they are of,
+then writes back every film's popularity in one UPDATE, scaling demand down
+to now. Its cost grows with new rentals and the size of the catalogue, not
+with the rental history. The weights overflow a double about 39 years after
+the epoch at a 14 day half-life.
+
+Changing the half-life changes every past rental's weight: refresh with
+``rebuild`` afterwards.
+"""
+import datetime as dt
+import math
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func, text
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store.models import Film, Rental, ScanCheckpoint
+
+EPOCH = dt.datetime(2017, 1, 1)
+CHECKPOINT = 'popularity'
+
+#: Add the weights of rentals in an id range to the demand of their films
+ADD_DEMAND = """
+UPDATE films
+JOIN (SELECT film_id, SUM(EXP(:rate * TIMESTAMPDIFF(SECOND, :epoch, rental_date))) AS weight
+      FROM {rentals}
+      WHERE id > :after_id AND id <= :up_to_id
+      GROUP BY film_id) AS new_rentals ON new_rentals.film_id = films.id
+SET films.demand = films.demand + new_rentals.weight
+"""
+REBUILT_RENTALS = ('(SELECT id, film_id, rental_date FROM rentals '
+                   'UNION ALL SELECT id, film_id, rental_date FROM rentals_archive) AS history')
+
+Refresh = namedtuple('Refresh', ['last_id', 'films_rented'])
+
+
+def decay_rate(half_life_days):
+    """The decay rate, per second, of a half-life in days."""
+    return math.log(2) / (half_life_days * 86400.0)
+
+
+def refresh(now=None, rebuild=False):
+    """Add rentals made since the last refresh to demand, and write back every film's popularity.
+
+    :param rebuild: Recompute demand from every rental, archived ones included.
+    """
+    config = current_app.config
+    now = now or dt.datetime.utcnow()
+    rate = decay_rate(config['POPULARITY_HALF_LIFE_DAYS'])
+    films = Film.__table__
+
+    def transaction():
+        checkpoint = None if rebuild else ScanCheckpoint.query.get(CHECKPOINT)
+        after_id = checkpoint.last_id if checkpoint else 0
+        up_to_id = db.session.query(func.max(Rental.id)).scalar() or 0
+        if rebuild:
+            db.session.execute(films.update().values(demand=0))
+        films_rented = db.session.execute(
+            text(ADD_DEMAND.format(rentals=REBUILT_RENTALS if rebuild else 'rentals')),
+            {'rate': rate, 'epoch': EPOCH, 'after_id': after_id, 'up_to_id': up_to_id}).rowcount
+        decay = math.exp(-rate * (now - EPOCH).total_seconds())
+        prior = config['POPULARITY_PRIOR_WEIGHT'] * func.coalesce(films.c.tmdb_popularity, 0)
+        demand = config['POPULARITY_DEMAND_WEIGHT'] * decay * films.c.demand
+        db.session.execute(films.update().values(popularity=prior + demand))
+        db.session.merge(ScanCheckpoint(name=CHECKPOINT, last_id=up_to_id))
+        db.session.commit()
+        return Refresh(up_to_id, films_rented)
+
+    return retry_on_deadlock(transaction)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Hot-path store queries.
+
+Queries the site runs on a hot path are built here and registered with the
+index advisor, so ``flask db advise`` explains exactly what production runs.
+Full listings (every actor, every category) scan by design and are not registered.
+"""
+from blockflix.advisor import hot_query
+from blockflix.extensions import db
+from blockflix.store.models import (Actor, Category, Film, FilmActor, FilmStat, Payment, PaymentArchive, Rental,
+                                    RentalArchive, User)
+
+
+@hot_query('films.top')
+def top_films(limit=100):
+    """Most popular films, as listed on /films/, with their rental counters."""
+    return Film.query.outerjoin(FilmStat, FilmStat.film_id == Film.id)\
+                     .order_by(Film.popularity.desc()).limit(limit)
+
+
+@hot_query('films.released_before')
+def films_released_before(date='2017-01-01', min_popularity=5):
+    """Popular films already released on a date, as picked for rentals."""
+    return Film.query.filter(Film.release_date <= date, Film.popularity >= min_popularity)
+
+
+def all_actors():
+    """Every actor, as listed on /actors/."""
+    return Actor.query
+
+
+def all_categories():
+    """Every category, as listed on /categories/."""
+    return Category.query
+
+
+@hot_query('payments.for_user')
+def user_payments(user_id=1):
+    """A user's payments, as listed on /payments/."""
+    return Payment.query.filter(Payment.user_id == user_id)
+
+
+def user_payment_history(user_id, include_archived=False):
+    """A user's payments as (amount, payment_date) rows, optionally including archived ones."""
+    history = db.session.query(Payment.amount, Payment.payment_date).filter(Payment.user_id == user_id)
+    if include_archived:
+        history = history.union_all(
+            db.session.query(PaymentArchive.amount, PaymentArchive.payment_date)
+                      .filter(PaymentArchive.user_id == user_id))
+    return history
+
+
+def user_rental_history(user_id, include_archived=False):
+    """A user's rentals as (film_id, rental_date, return_date) rows, optionally including archived ones."""
+    history = db.session.query(Rental.film_id, Rental.rental_date, Rental.return_date)\
+                        .filter(Rental.user_id == user_id)
+    if include_archived:
+        history = history.union_all(
+            db.session.query(RentalArchive.film_id, RentalArchive.rental_date, RentalArchive.return_date)
+                      .filter(RentalArchive.user_id == user_id))
+    return history
+
+
+@hot_query('rentals.open_for_user')
+def open_rental(user_id=1):
+    """A user's open rental."""
+    return Rental.query.filter(Rental.user_id == user_id, Rental.return_date.is_(None))
+
+
+@hot_query('rentals.overdue')
+def overdue_rentals(rented_before='2017-01-01', after_id=0, limit=1000):
+    """A page of open rentals rented before a date, in id order, with their user's and film's details."""
+    return db.session.query(Rental.id, Rental.user_id, Rental.film_id, Rental.rental_date,
+                            User.email, User.first_name, Film.title)\
+                     .join(User, User.id == Rental.user_id)\
+                     .join(Film, Film.id == Rental.film_id)\
+                     .filter(Rental.return_date.is_(None), Rental.rental_date < rented_before,
+                             Rental.id > after_id)\
+                     .order_by(Rental.id)\
+                     .limit(limit)
+
+
+@hot_query('users.by_email')
+def user_by_email(email='user@example.com'):
+    """The user registered with an email address."""
+    return User.query.filter_by(email=email)
+
+
+@hot_query('films.by_actor')
+def actor_filmography(actor_id=1):
+    """Films an actor appears in."""
+    return Film.query.join(FilmActor, FilmActor.film_id == Film.id).filter(FilmActor.actor_id == actor_id)
+
+
+@hot_query('actors.by_film')
+def film_cast(film_id=1):
+    """Actors appearing in a film."""
+    return Actor.query.join(FilmActor, FilmActor.actor_id == Actor.id).filter(FilmActor.film_id == film_id)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Renting and returning films.
+
+A subscriber may have at most ``RENTAL_LIMIT`` open rentals. ``rentals`` is
+partitioned by ``rental_date``, and MySQL requires every unique key of a
+partitioned table to include the partitioning column, so the database can't
+enforce that limit with a unique key. Instead, every checkout and return
+first locks the subscriber's ``users`` row with ``SELECT ... FOR UPDATE``.
+That serializes all the rentals of one subscriber, across every worker,
+while rentals of different subscribers go ahead in parallel. Transactions
+that deadlock anyway are rolled back and retried.
+"""
+import datetime as dt
+
+from flask import current_app
+from werkzeug.exceptions import Conflict, NotFound
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store import film_stats, queries
+from blockflix.store.models import Film, Rental, User
+
+
+class RentalLimitReached(Conflict):
+    """The subscriber already has as many open rentals as allowed."""
+
+    description = 'Return a film before renting another one.'
+
+
+class AlreadyReturned(Conflict):
+    """The rental was returned already."""
+
+    description = 'This film was returned already.'
+
+
+def lock_user(user_id):
+    """Lock a user's row until the end of the transaction."""
+    user = User.query.filter(User.id == user_id).with_for_update().one_or_none()
+    if user is None:
+        raise NotFound('No such user.')
+    return user
+
+
+def checkout(user_id, film_id, limit=None, now=None):
+    """Rent a film to a user, unless they have ``limit`` (default: ``RENTAL_LIMIT``) open rentals.
+
+    :raises RentalLimitReached: If the user can't rent another film yet.
+    :raises NotFound: If there is no such user or film.
+    """
+    if limit is None:
+        limit = current_app.config['RENTAL_LIMIT']
+
+    def transaction():
+        lock_user(user_id)
+        # A locking read, so rentals committed since this transaction's
+        # snapshot was taken (e.g. while loading the current user) are seen
+        if len(queries.open_rental(user_id).with_for_update().all()) >= limit:
+            raise RentalLimitReached()
+        if Film.query.get(film_id) is None:
+            raise NotFound('No such film.')
+        rental = Rental(user_id=user_id, film_id=film_id, rental_date=now or dt.datetime.utcnow())
+        db.session.add(rental)
+        film_stats.rented(film_id, rental.rental_date)
+        db.session.commit()
+        return rental
+
+    return retry_on_deadlock(transaction)
+
+
+def return_film(user_id, rental_id, now=None):
+    """Return one of a user's rentals.
+
+    :raises AlreadyReturned: If it was returned already.
+    :raises NotFound: If the user has no such rental.
+    """
+    def transaction():
+        lock_user(user_id)
+        rental = Rental.query.filter(Rental.id == rental_id, Rental.user_id == user_id)\
+                             .with_for_update().one_or_none()
+        if rental is None:
+            raise NotFound('No such rental.')
+        if rental.return_date is not None:
+            raise AlreadyReturned()
+        rental.return_date = now or dt.datetime.utcnow()
+        film_stats.returned({rental.film_id: 1})
+        db.session.commit()
+        return rental
+
+    return retry_on_deadlock(transaction)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Batch processing of returned films, as scanned by kiosks and drop boxes.
+
+A scan names a rental by its id, or by the user and film it was rented
+between, and when it was returned. Scans are applied a chunk at a time. Each
+chunk takes a single locking SELECT to find its rentals and a single UPDATE
+to return all of the open ones (and another to count them in ``film_stats``),
+and is committed on its own. Every scan gets
+an outcome: ``returned``, ``already_returned`` (including a second scan of
+the same rental) or ``not_found``.
+"""
+import datetime as dt
+from collections import Counter, namedtuple
+
+from sqlalchemy import case, select, tuple_
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store import film_stats
+from blockflix.store.models import Rental
+
+RETURNED = 'returned'
+ALREADY_RETURNED = 'already_returned'
+NOT_FOUND = 'not_found'
+
+#: Formats a scan's return date may be given in
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+Scan = namedtuple('Scan', ['rental_id', 'user_id', 'film_id', 'return_date'])
+Outcome = namedtuple('Outcome', ['scan', 'rental_id', 'status'])
+
+
+def parse_date(value):
+    """A return date from a datetime or one of DATE_FORMATS."""
+    if isinstance(value, dt.datetime):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError('Unrecognized return date {0!r}'.format(value))
+
+
+def parse_scan(record, now=None):
+    """A :class:`Scan` from a mapping, as posted as JSON or read from CSV.
+
+    :raises ValueError: If it names neither a rental nor a user and film.
+    """
+    def integer(key):
+        value = record.get(key)
+        return int(value) if value not in (None, '') else None
+
+    rental_id, user_id, film_id = integer('rental_id'), integer('user_id'), integer('film_id')
+    if rental_id is None and (user_id is None or film_id is None):
+        raise ValueError('A scan needs a rental_id, or a user_id and a film_id')
+    return_date = record.get('return_date')
+    return_date = parse_date(return_date) if return_date else (now or dt.datetime.utcnow())
+    return Scan(rental_id, user_id, film_id, return_date)
+
+
+def chunked(items, size):
+    """Successive lists of up to ``size`` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def return_chunk(scans):
+    """Return the rentals a chunk of scans name, in one transaction; their outcomes, in order."""
+    rentals = Rental.__table__
+    by_id = set(scan.rental_id for scan in scans if scan.rental_id is not None)
+    by_pair = set((scan.user_id, scan.film_id) for scan in scans if scan.rental_id is None)
+    conditions = []
+    if by_id:
+        conditions.append(rentals.c.id.in_(by_id))
+    if by_pair:
+        # A user has at most one open rental, so at most one per film
+        conditions.append(tuple_(rentals.c.user_id, rentals.c.film_id).in_(by_pair))
+    rows = db.session.execute(
+        select([rentals.c.id, rentals.c.user_id, rentals.c.film_id, rentals.c.return_date])
+        .where(db.or_(*conditions)).with_for_update()).fetchall()
+
+    open_by_pair, returned_by_pair, found, film_ids = {}, set(), {}, {}
+    for row in rows:
+        found[row.id] = row.return_date is None
+        film_ids[row.id] = row.film_id
+        pair = (row.user_id, row.film_id)
+        if row.return_date is None:
+            open_by_pair[pair] = row.id
+        else:
+            returned_by_pair.add(pair)
+
+    outcomes, return_dates = [], {}
+    for scan in scans:
+        rental_id = scan.rental_id
+        if rental_id is None:
+            pair = (scan.user_id, scan.film_id)
+            rental_id = open_by_pair.get(pair)
+            if rental_id is None:
+                status = ALREADY_RETURNED if pair in returned_by_pair else NOT_FOUND
+                outcomes.append(Outcome(scan, None, status))
+                continue
+        if rental_id not in found:
+            status = NOT_FOUND
+        elif not found[rental_id] or rental_id in return_dates:
+            status = ALREADY_RETURNED
+        else:
+            status = RETURNED
+            return_dates[rental_id] = scan.return_date
+        outcomes.append(Outcome(scan, rental_id, status))
+
+    if return_dates:
+        db.session.execute(
+            rentals.update()
+            .where(rentals.c.id.in_(return_dates))
+            .where(rentals.c.return_date.is_(None))
+            .values(return_date=case(return_dates, value=rentals.c.id)))
+        film_stats.returned(Counter(film_ids[rental_id] for rental_id in return_dates))
+    db.session.commit()
+    return outcomes
+
+
+def process(scans, chunk_size=1000):
+    """Apply scans a chunk at a time, yielding each one's :class:`Outcome` in order."""
+    for chunk in chunked(list(scans), chunk_size):
+        for outcome in retry_on_deadlock(lambda: return_chunk(chunk)):
+            yield outcome
+
+
+def summarize(outcomes):
+    """How many scans had each outcome."""
+    return Counter(outcome.status for outcome in outcomes)
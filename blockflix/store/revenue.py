@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Monthly revenue, rolled up into ``payments_monthly``.
+
+Each month's row holds its revenue, payments and payers, and how many of
+those payers paid for the first time, counting archived payments too.
+Reports read only the rollup, so they cost the same however many payments
+there are.
+
+A refresh recomputes the months from the earliest one that payments added
+since the previous refresh (by id) fall in, through the latest. Payments
+come in for the current month, so that is usually one month's partition. An
+older, backdated payment can make a later month's new payers returning ones,
+so the later months are recomputed with it. Payments that are corrected or
+deleted in place are not picked up: refresh ``since`` their month, or
+``rebuild``.
+"""
+import datetime as dt
+from collections import namedtuple
+
+from sqlalchemy import func, text
+
+from blockflix.database import retry_on_deadlock
+from blockflix.extensions import db
+from blockflix.store.models import Payment, PaymentMonthly, ScanCheckpoint
+
+CHECKPOINT = 'payments_monthly'
+
+#: Roll up the months from :start on, a row per month, via a row per payer and month
+ROLLUP = """
+INSERT INTO payments_monthly (month, amount, payments, payers, new_payers)
+SELECT month, SUM(amount), SUM(payments), COUNT(*),
+       SUM(NOT EXISTS (SELECT 1 FROM payments AS earlier
+                       WHERE earlier.user_id = by_payer.user_id AND earlier.payment_date < by_payer.month)
+           AND NOT EXISTS (SELECT 1 FROM payments_archive AS earlier
+                           WHERE earlier.user_id = by_payer.user_id AND earlier.payment_date < by_payer.month))
+FROM (SELECT CAST(DATE_FORMAT(payment_date, '%Y-%m-01') AS DATE) AS month, user_id,
+             SUM(amount) AS amount, COUNT(*) AS payments
+      FROM (SELECT user_id, amount, payment_date FROM payments {where}
+            UNION ALL
+            SELECT user_id, amount, payment_date FROM payments_archive {where}) AS history
+      GROUP BY month, user_id) AS by_payer
+GROUP BY month
+"""
+
+Refresh = namedtuple('Refresh', ['last_id', 'first_month', 'months'])
+
+
+def month_of(value):
+    """The first day of a date's month."""
+    return dt.date(value.year, value.month, 1)
+
+
+def refresh(since=None, rebuild=False):
+    """Roll up the months that payments made since the last refresh fall in, and every later month.
+
+    The first refresh recomputes every month.
+
+    :param since: Also recompute the months from this date's on.
+    :param rebuild: Recompute every month.
+    """
+    monthly = PaymentMonthly.__table__
+
+    def transaction():
+        checkpoint = None if rebuild else ScanCheckpoint.query.get(CHECKPOINT)
+        after_id = checkpoint.last_id if checkpoint else 0
+        up_to_id = db.session.query(func.max(Payment.id)).scalar() or 0
+        first_month = None
+        if checkpoint:
+            earliest = db.session.query(func.min(Payment.payment_date)) \
+                .filter(Payment.id > after_id, Payment.id <= up_to_id).scalar()
+            first_month = min(month_of(day) for day in (earliest, since) if day) if earliest or since else None
+        months = 0
+        if not checkpoint or first_month:
+            delete = monthly.delete()
+            if first_month:
+                delete = delete.where(monthly.c.month >= first_month)
+            db.session.execute(delete)
+            months = db.session.execute(
+                text(ROLLUP.format(where='WHERE payment_date >= :start' if first_month else '')),
+                {'start': first_month}).rowcount
+        db.session.merge(ScanCheckpoint(name=CHECKPOINT, last_id=up_to_id))
+        db.session.commit()
+        return Refresh(up_to_id, first_month, months)
+
+    return retry_on_deadlock(transaction)
+
+
+def months(first=None, last=None):
+    """The rolled-up months from ``first`` through ``last``, oldest first."""
+    query = PaymentMonthly.query.order_by(PaymentMonthly.month)
+    if first:
+        query = query.filter(PaymentMonthly.month >= month_of(first))
+    if last:
+        query = query.filter(PaymentMonthly.month <= month_of(last))
+    return query
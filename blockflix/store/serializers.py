@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Row serializers for the store's API responses."""
+from functools import partial
+
+from sqlalchemy import func
+
+from blockflix.serializers import RowSerializer, format_dates
+from blockflix.store.models import Actor, Category, Film, FilmStat, Payment, PaymentMonthly, Rental
+
+format_datetimes = partial(format_dates, fmt='%Y-%m-%dT%H:%M:%S', missing=None)
+
+
+def counts(values):
+    """Format a column of counters, where films with no counters yet have none."""
+    return [value or 0 for value in values]
+
+
+def money(values):
+    """Format a column of amounts to the cent, where months with no payers have no average."""
+    return [round(value, 2) if value is not None else None for value in values]
+
+
+films = RowSerializer(
+    ('title', Film.title),
+    ('description', Film.description),
+    ('release_date', Film.release_date, format_dates),
+    ('length', Film.length),
+    ('popularity', Film.popularity),
+    ('active_rentals', FilmStat.active_rentals, counts),
+    ('last_rented', FilmStat.last_rented, format_dates),
+)
+
+actors = RowSerializer(
+    ('first_name', Actor.first_name),
+    ('last_name', Actor.last_name),
+)
+
+categories = RowSerializer(
+    ('name', Category.name),
+)
+
+payments = RowSerializer(
+    ('amount', Payment.amount),
+    ('payment_date', Payment.payment_date, format_dates),
+)
+
+revenue = RowSerializer(
+    ('month', PaymentMonthly.month, partial(format_dates, fmt='%Y-%m')),
+    ('amount', PaymentMonthly.amount, money),
+    ('payments', PaymentMonthly.payments),
+    ('payers', PaymentMonthly.payers),
+    ('new_payers', PaymentMonthly.new_payers),
+    ('returning_payers', PaymentMonthly.payers - PaymentMonthly.new_payers),
+    ('arpu', PaymentMonthly.amount / func.nullif(PaymentMonthly.payers, 0), money),
+)
+
+rentals = RowSerializer(
+    ('id', Rental.id),
+    ('film_id', Rental.film_id),
+    ('rental_date', Rental.rental_date, format_datetimes),
+    ('return_date', Rental.return_date, format_datetimes),
+)
+
+
+def rental(instance):
+    """A single loaded Rental, serialized like :data:`rentals`."""
+    return rentals([tuple(getattr(instance, column.key) for column in rentals.columns)])[0]
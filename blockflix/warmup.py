@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Cached listings and warming them ahead of the first request.
+
+Functions decorated with :func:`warmed` are served stale-while-revalidate
+under a cache key (see :mod:`blockflix.resilience`) and are precomputed by
+``flask cache warm`` after a deploy. With ``CACHE_WARM_ON_BOOT`` set, each
+gunicorn worker also warms them as it boots. Use :func:`post_worker_init`
+as that hook in the gunicorn config.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app
+
+from blockflix.resilience import serve_stale
+
+#: Cache key -> function computing the value kept under it
+WARMERS = OrderedDict()
+
+Warmed = namedtuple('Warmed', ['key', 'seconds', 'error'])
+
+
+def warmed(key):
+    """Serve a function's result stale-while-revalidate under a cache key, and warm it on deploy."""
+    def decorator(compute):
+        WARMERS[key] = compute
+
+        def serve():
+            return serve_stale.get(key, compute)
+        serve.__name__ = compute.__name__
+        serve.__doc__ = compute.__doc__
+        serve.key = key
+        serve.compute = compute
+        return serve
+    return decorator
+
+
+def _warm_one(app, key):
+    with app.app_context():
+        start = time.time()
+        try:
+            serve_stale.refresh(key, WARMERS[key])
+        except Exception as error:  # noqa
+            return Warmed(key, time.time() - start, error)
+        return Warmed(key, time.time() - start, None)
+
+
+def warm(keys=None, concurrency=4):
+    """Recompute cached listings, ``concurrency`` at a time.
+
+    Yields a :class:`Warmed` for each key as it finishes.
+
+    :param keys: Keys to warm; all registered keys by default.
+    """
+    keys = list(keys or WARMERS)
+    unknown = [key for key in keys if key not in WARMERS]
+    if unknown:
+        raise KeyError('No cached listing named {0}'.format(', '.join(unknown)))
+    app = current_app._get_current_object()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = [executor.submit(_warm_one, app, key) for key in keys]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True)
+
+
+def post_worker_init(worker):
+    """Gunicorn hook warming the listings in the background as a worker boots, if ``CACHE_WARM_ON_BOOT``."""
+    app = worker.wsgi
+    if not getattr(app, 'config', {}).get('CACHE_WARM_ON_BOOT'):
+        return
+
+    def run():
+        with app.app_context():
+            for result in warm(concurrency=app.config['CACHE_WARM_CONCURRENCY']):
+                if result.error:
+                    worker.log.warning('Warming %s failed after %.3fs: %s', result.key, result.seconds, result.error)
+                else:
+                    worker.log.info('Warmed %s in %.3fs', result.key, result.seconds)
+
+    thread = threading.Thread(target=run, name='cache-warm')
+    thread.daemon = True
+    thread.start()
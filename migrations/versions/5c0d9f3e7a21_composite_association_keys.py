@@ -0,0 +1,51 @@
+"""Composite primary keys on the association tables
+
+Revision ID: 5c0d9f3e7a21
+Revises: abe56de8f21c
+Create Date: 2026-10-19 11:03:17.554902
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5c0d9f3e7a21'
+down_revision = 'abe56de8f21c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep one row per pair before the pair becomes the primary key
+    op.execute('DELETE a FROM films_actors a JOIN films_actors b '
+               'ON a.film_id = b.film_id AND a.actor_id = b.actor_id AND a.id > b.id')
+    op.execute('DELETE a FROM films_categories a JOIN films_categories b '
+               'ON a.film_id = b.film_id AND a.category_id = b.category_id AND a.id > b.id')
+
+    # One ALTER per table, so both foreign keys stay indexed throughout
+    op.execute('ALTER TABLE films_actors '
+               'DROP COLUMN id, '
+               'ADD PRIMARY KEY (film_id, actor_id), '
+               'ADD INDEX ix_films_actors_actor_id_film_id (actor_id, film_id), '
+               'DROP INDEX ix_films_actors_film_id, '
+               'DROP INDEX ix_films_actors_actor_id')
+    op.execute('ALTER TABLE films_categories '
+               'DROP COLUMN id, '
+               'ADD PRIMARY KEY (film_id, category_id), '
+               'ADD INDEX ix_films_categories_category_id_film_id (category_id, film_id), '
+               'DROP INDEX ix_films_categories_film_id, '
+               'DROP INDEX ix_films_categories_category_id')
+
+
+def downgrade():
+    op.execute('ALTER TABLE films_categories '
+               'DROP PRIMARY KEY, '
+               'ADD COLUMN id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY, '
+               'ADD INDEX ix_films_categories_film_id (film_id), '
+               'ADD INDEX ix_films_categories_category_id (category_id), '
+               'DROP INDEX ix_films_categories_category_id_film_id')
+    op.execute('ALTER TABLE films_actors '
+               'DROP PRIMARY KEY, '
+               'ADD COLUMN id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY, '
+               'ADD INDEX ix_films_actors_film_id (film_id), '
+               'ADD INDEX ix_films_actors_actor_id (actor_id), '
+               'DROP INDEX ix_films_actors_actor_id_film_id')
@@ -0,0 +1,113 @@
+"""Partition payments and rentals by month, add archive tables
+
+Revision ID: 8f41b2d6c093
+Revises: 5c0d9f3e7a21
+Create Date: 2026-10-19 13:47:05.102334
+
+"""
+import datetime as dt
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f41b2d6c093'
+down_revision = '5c0d9f3e7a21'
+branch_labels = None
+depends_on = None
+
+# Partitioned table -> (partition column, foreign keys as (column, referenced table))
+PARTITIONED = [
+    ('payments', 'payment_date', [('user_id', 'users')]),
+    ('rentals', 'rental_date', [('film_id', 'films'), ('user_id', 'users')]),
+]
+MONTHS_AHEAD = 3
+
+
+def next_month(month):
+    return (month.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+
+
+def partition_clauses(first_month, last_month):
+    clauses = []
+    month = first_month
+    while month <= last_month:
+        clauses.append("PARTITION p{0:%Y%m} VALUES LESS THAN ('{1:%Y-%m-%d}')".format(month, next_month(month)))
+        month = next_month(month)
+    clauses.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+    return clauses
+
+
+def foreign_key_names(bind, table):
+    return [row[0] for row in bind.execute(sa.text(
+        'SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table '
+        'AND REFERENCED_TABLE_NAME IS NOT NULL'), table=table)]
+
+
+def upgrade():
+    op.create_table('payments_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('payment_date', sa.DateTime(), nullable=False),
+    sa.Column('last_update', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    mysql_row_format='COMPRESSED'
+    )
+    op.create_index('ix_payments_archive_user_id_payment_date', 'payments_archive',
+                    ['user_id', 'payment_date'], unique=False)
+    op.create_table('rentals_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('rental_date', sa.DateTime(), nullable=False),
+    sa.Column('film_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('return_date', sa.DateTime(), nullable=True),
+    sa.Column('last_update', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    mysql_row_format='COMPRESSED'
+    )
+    op.create_index('ix_rentals_archive_user_id_rental_date', 'rentals_archive',
+                    ['user_id', 'rental_date'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        return
+
+    current = dt.date.today().replace(day=1)
+    last_month = current
+    for _ in range(MONTHS_AHEAD):
+        last_month = next_month(last_month)
+
+    for table, column, _ in PARTITIONED:
+        # Partitioned InnoDB tables can't have foreign keys, and every unique
+        # key must include the partitioning column.
+        for name in foreign_key_names(bind, table):
+            op.drop_constraint(name, table, type_='foreignkey')
+        op.execute('ALTER TABLE {0} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {1})'.format(table, column))
+
+        oldest = bind.execute(sa.text('SELECT MIN({0}) FROM {1}'.format(column, table))).scalar()
+        first_month = min(oldest.date(), current).replace(day=1) if oldest else current
+        op.execute('ALTER TABLE {0} PARTITION BY RANGE COLUMNS({1}) ({2})'.format(
+            table, column, ', '.join(partition_clauses(first_month, last_month))))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        for table, column, foreign_keys in PARTITIONED:
+            op.execute('ALTER TABLE {0} REMOVE PARTITIONING'.format(table))
+            op.execute('ALTER TABLE {0} DROP PRIMARY KEY, ADD PRIMARY KEY (id)'.format(table))
+            for local, remote in foreign_keys:
+                op.create_foreign_key(None, table, remote, [local], ['id'])
+
+    # Bring archived history back before dropping the archive tables
+    op.execute('INSERT INTO payments (id, user_id, amount, payment_date, last_update) '
+               'SELECT id, user_id, amount, payment_date, last_update FROM payments_archive')
+    op.execute('INSERT INTO rentals (id, rental_date, film_id, user_id, return_date, last_update) '
+               'SELECT id, rental_date, film_id, user_id, return_date, last_update FROM rentals_archive')
+    op.drop_index('ix_rentals_archive_user_id_rental_date', table_name='rentals_archive')
+    op.drop_table('rentals_archive')
+    op.drop_index('ix_payments_archive_user_id_payment_date', table_name='payments_archive')
+    op.drop_table('payments_archive')
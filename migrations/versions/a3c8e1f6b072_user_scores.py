@@ -0,0 +1,31 @@
+"""Add user_scores for nightly churn risk
+
+Revision ID: a3c8e1f6b072
+Revises: f5a9c3d7e214
+Create Date: 2026-10-19 18:27:41.630582
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e1f6b072'
+down_revision = 'f5a9c3d7e214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_scores',
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('churn_risk', mysql.FLOAT(), nullable=False),
+    sa.Column('scored_on', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_scores')
@@ -0,0 +1,46 @@
+"""Add hot-path indexes
+
+Revision ID: abe56de8f21c
+Revises: 03c7de04c77f
+Create Date: 2026-10-19 09:12:41.218530
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'abe56de8f21c'
+down_revision = '03c7de04c77f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_films_popularity', 'films', ['popularity'], unique=False)
+    op.create_index('ix_films_release_date', 'films', ['release_date'], unique=False)
+    op.create_index('ix_users_email', 'users', ['email'], unique=False)
+    op.create_index('ix_payments_user_id_payment_date', 'payments', ['user_id', 'payment_date'], unique=False)
+    op.create_index('ix_rentals_user_id_return_date', 'rentals', ['user_id', 'return_date'], unique=False)
+    op.create_index('ix_films_actors_film_id', 'films_actors', ['film_id'], unique=False)
+    op.create_index('ix_films_actors_actor_id', 'films_actors', ['actor_id'], unique=False)
+    op.create_index('ix_films_categories_film_id', 'films_categories', ['film_id'], unique=False)
+    op.create_index('ix_films_categories_category_id', 'films_categories', ['category_id'], unique=False)
+
+
+def downgrade():
+    # MySQL refuses to drop an index backing a foreign key, so put back the
+    # single-column indexes it created implicitly before dropping ours.
+    op.create_index('user_id', 'payments', ['user_id'], unique=False)
+    op.create_index('user_id', 'rentals', ['user_id'], unique=False)
+    op.create_index('film_id', 'films_actors', ['film_id'], unique=False)
+    op.create_index('actor_id', 'films_actors', ['actor_id'], unique=False)
+    op.create_index('film_id', 'films_categories', ['film_id'], unique=False)
+    op.create_index('category_id', 'films_categories', ['category_id'], unique=False)
+    op.drop_index('ix_films_categories_category_id', table_name='films_categories')
+    op.drop_index('ix_films_categories_film_id', table_name='films_categories')
+    op.drop_index('ix_films_actors_actor_id', table_name='films_actors')
+    op.drop_index('ix_films_actors_film_id', table_name='films_actors')
+    op.drop_index('ix_rentals_user_id_return_date', table_name='rentals')
+    op.drop_index('ix_payments_user_id_payment_date', table_name='payments')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_films_release_date', table_name='films')
+    op.drop_index('ix_films_popularity', table_name='films')
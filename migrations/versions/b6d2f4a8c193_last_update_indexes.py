@@ -0,0 +1,26 @@
+"""Index last_update on payments, rentals and users, for incremental exports
+
+Revision ID: b6d2f4a8c193
+Revises: a3c8e1f6b072
+Create Date: 2026-10-19 19:03:15.774209
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f4a8c193'
+down_revision = 'a3c8e1f6b072'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payments_last_update', 'payments', ['last_update'], unique=False)
+    op.create_index('ix_rentals_last_update', 'rentals', ['last_update'], unique=False)
+    op.create_index('ix_users_last_update', 'users', ['last_update'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_last_update', table_name='users')
+    op.drop_index('ix_rentals_last_update', table_name='rentals')
+    op.drop_index('ix_payments_last_update', table_name='payments')
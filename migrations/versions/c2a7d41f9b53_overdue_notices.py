@@ -0,0 +1,51 @@
+"""Add overdue notices, scan checkpoints and the open-rentals index
+
+Revision ID: c2a7d41f9b53
+Revises: 8f41b2d6c093
+Create Date: 2026-10-19 15:02:18.440917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a7d41f9b53'
+down_revision = '8f41b2d6c093'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_rentals_return_date_id', 'rentals', ['return_date', 'id'], unique=False)
+    op.create_table('overdue_notices',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rental_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('film_id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=50), nullable=True),
+    sa.Column('first_name', sa.String(length=45), nullable=True),
+    sa.Column('film_title', sa.String(length=45), nullable=True),
+    sa.Column('rental_date', sa.DateTime(), nullable=False),
+    sa.Column('days_overdue', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('late_fee', sa.Float(), nullable=False),
+    sa.Column('notice_date', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('rental_id', 'notice_date', name='uq_overdue_notices_rental_id_notice_date')
+    )
+    op.create_index('ix_overdue_notices_notice_date_kind', 'overdue_notices', ['notice_date', 'kind'],
+                    unique=False)
+    op.create_table('scan_checkpoints',
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('last_update', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scan_checkpoints')
+    op.drop_index('ix_overdue_notices_notice_date_kind', table_name='overdue_notices')
+    op.drop_table('overdue_notices')
+    op.drop_index('ix_rentals_return_date_id', table_name='rentals')
@@ -0,0 +1,37 @@
+"""Add film_stats, counted from rentals
+
+Revision ID: d7e3b5a1c820
+Revises: c2a7d41f9b53
+Create Date: 2026-10-19 16:21:37.905112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3b5a1c820'
+down_revision = 'c2a7d41f9b53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('film_stats',
+    sa.Column('film_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('active_rentals', sa.Integer(), nullable=False),
+    sa.Column('lifetime_rentals', sa.Integer(), nullable=False),
+    sa.Column('last_rented', sa.DateTime(), nullable=True),
+    sa.Column('last_update', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['film_id'], ['films.id'], ),
+    sa.PrimaryKeyConstraint('film_id')
+    )
+    op.execute('INSERT INTO film_stats (film_id, active_rentals, lifetime_rentals, last_rented) '
+               'SELECT film_id, SUM(return_date IS NULL), COUNT(*), MAX(rental_date) '
+               'FROM (SELECT film_id, rental_date, return_date FROM rentals '
+               '      UNION ALL SELECT film_id, rental_date, return_date FROM rentals_archive) AS history '
+               'GROUP BY film_id')
+
+
+def downgrade():
+    op.drop_table('film_stats')
@@ -0,0 +1,30 @@
+"""Keep TMDB popularity apart, add decayed rental demand to films
+
+Revision ID: e4b8f2c6a917
+Revises: d7e3b5a1c820
+Create Date: 2026-10-19 17:08:52.316470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8f2c6a917'
+down_revision = 'd7e3b5a1c820'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('films', sa.Column('tmdb_popularity', sa.Float(), nullable=True))
+    op.add_column('films', sa.Column('demand', mysql.DOUBLE(), server_default='0', nullable=False))
+    # popularity is blended with demand from now on (flask films popularity --rebuild)
+    op.execute('UPDATE films SET tmdb_popularity = popularity')
+
+
+def downgrade():
+    op.execute('UPDATE films SET popularity = tmdb_popularity')
+    op.drop_column('films', 'demand')
+    op.drop_column('films', 'tmdb_popularity')
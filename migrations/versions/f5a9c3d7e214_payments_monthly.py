@@ -0,0 +1,34 @@
+"""Add the payments_monthly revenue rollup
+
+Revision ID: f5a9c3d7e214
+Revises: e4b8f2c6a917
+Create Date: 2026-10-19 17:46:05.218394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a9c3d7e214'
+down_revision = 'e4b8f2c6a917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in by the first `flask revenue refresh`, which rolls up every month
+    op.create_table('payments_monthly',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('amount', mysql.DOUBLE(), nullable=False),
+    sa.Column('payments', sa.Integer(), nullable=False),
+    sa.Column('payers', sa.Integer(), nullable=False),
+    sa.Column('new_payers', sa.Integer(), nullable=False),
+    sa.Column('last_update', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('payments_monthly')
@@ -4,6 +4,8 @@ sleep 10 # Wait for Postgres
 flask db upgrade
 if [ "$FLASK_DEBUG" = "1" ] ; then
   flask seed
+  exec flask run --host=0.0.0.0
 fi
 
-exec flask run --host=0.0.0.0
+flask cache warm || echo "Cache warm-up failed, starting anyway"
+exec gunicorn -c python:blockflix.gunicorn_conf autoapp:application
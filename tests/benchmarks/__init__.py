@@ -0,0 +1 @@
+"""Benchmarks, kept apart from the unit tests and run against a seeded database."""
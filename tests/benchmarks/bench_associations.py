@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Filmography and cast lookup benchmark.
+
+Run it against a seeded database before and after a schema change to the
+association tables, and compare the two result files::
+
+    python -m tests.benchmarks.bench_associations --output before.json
+    flask db upgrade
+    python -m tests.benchmarks.bench_associations --compare before.json
+"""
+import json
+import time
+
+import click
+from sqlalchemy.sql.expression import func
+
+from blockflix.app import create_app
+from blockflix.settings import DevConfig
+from blockflix.store import queries
+from blockflix.store.models import Actor, Film
+
+
+def percentile(timings, pct):
+    """The pct-th percentile of a list of timings."""
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def time_lookups(build_query, ids):
+    """Time a lookup query for every id, in milliseconds."""
+    timings = []
+    for record_id in ids:
+        start = time.perf_counter()
+        build_query(record_id).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'lookups': len(timings),
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+    }
+
+
+def sample_ids(model, samples, seed):
+    """A repeatable random sample of primary keys for a model."""
+    return [row.id for row in model.query.with_entities(model.id).order_by(func.rand(seed)).limit(samples)]
+
+
+@click.command()
+@click.option('--samples', default=500, help='Lookups to time per query (default: 500)')
+@click.option('--seed', default=0, help='Random seed for picking ids')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+@click.option('--compare', default=None, help='Compare against a previous JSON result file')
+def main(samples, seed, output, compare):
+    """Time filmography (films by actor) and cast (actors by film) lookups."""
+    app = create_app(DevConfig)
+    with app.app_context():
+        results = {
+            'filmography': time_lookups(queries.actor_filmography, sample_ids(Actor, samples, seed)),
+            'cast': time_lookups(queries.film_cast, sample_ids(Film, samples, seed)),
+        }
+
+    baseline = json.load(open(compare)) if compare else {}
+    for name, result in sorted(results.items()):
+        line = '{0:12} mean={mean_ms:8.3f}ms p50={p50_ms:8.3f}ms p95={p95_ms:8.3f}ms'.format(name, **result)
+        if name in baseline:
+            line += '  ({0:+.1%} p50 vs baseline)'.format(result['p50_ms'] / baseline[name]['p50_ms'] - 1)
+        click.echo(line)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Cohort retention benchmark at 10M payments.
+
+Builds the matrix of :func:`blockflix.analytics.cohorts.cohort_matrix` from
+synthetic users and payments: monthly signups over ``--months`` months, each
+user paying every month until they churn. The payments are fed to it in
+chunks, as they are streamed from the database, at several chunk sizes. Each
+run records its wall time and the peak memory it allocated beyond the
+synthetic data::
+
+    python -m tests.benchmarks.bench_cohorts --output cohorts.json
+
+Pass ``--database`` to also time :func:`blockflix.analytics.cohorts.retention`
+against the development database, reading its users and payments.
+"""
+import json
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+from blockflix.analytics import cohorts
+from blockflix.app import create_app
+from blockflix.settings import DevConfig
+
+FIRST_MONTH = 2015 * 12
+
+
+def synthesize(payments, months, churn, seed=0):
+    """(users, payments) arrays: users signing up evenly over ``months``, paying monthly until they churn."""
+    random = np.random.RandomState(seed)
+    count = payments // months + 1
+    while True:
+        signup = FIRST_MONTH + random.randint(0, months, count)
+        tenure = np.minimum(random.geometric(churn, count), FIRST_MONTH + months - signup)
+        if tenure.sum() >= payments:
+            break
+        count *= 2
+    user_ids = np.arange(1, count + 1)
+    paying = np.repeat(user_ids, tenure)[:payments]
+    offsets = np.arange(len(paying)) - np.repeat(np.cumsum(tenure) - tenure, tenure)[:payments]
+    paid = np.repeat(signup, tenure)[:payments] + offsets
+    users = np.column_stack([user_ids, signup])
+    return users, np.column_stack([paying, paid])
+
+
+def chunks(rows, size):
+    """Successive views of ``size`` rows."""
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def timed(compute):
+    """Run a function, returning its result, wall time and peak allocations in kB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = compute()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak // 1024
+
+
+@click.command()
+@click.option('--payments', default=10000000, help='Synthetic payments (default: 10M)')
+@click.option('--months', default=36, help='Months of history (default: 36)')
+@click.option('--churn', default=0.06, help='Share of users cancelling each month (default: 0.06)')
+@click.option('--chunk-size', 'chunk_sizes', multiple=True, type=int, default=[10000, 100000, 1000000],
+              help='Chunk size to time (may be repeated; default: 10k, 100k and 1M)')
+@click.option('--database', default=False, is_flag=True,
+              help='Also time reading the development database\'s users and payments')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+def main(payments, months, churn, chunk_sizes, database, output):
+    """Time the cohort retention matrix."""
+    users, rows = synthesize(payments, months, churn)
+    click.echo('{0} users, {1} payments over {2} months'.format(len(users), len(rows), months))
+    results = {}
+    for chunk_size in chunk_sizes:
+        (matrix, _), seconds, peak_kb = timed(lambda: cohorts.cohort_matrix(users, chunks(rows, chunk_size)))
+        results[str(chunk_size)] = {
+            'payments': len(rows),
+            'seconds': seconds,
+            'payments_per_second': len(rows) / seconds,
+            'peak_memory_kb': peak_kb,
+            'cohorts': len(matrix),
+        }
+
+    if database:
+        app = create_app(DevConfig)
+        with app.app_context():
+            (matrix, sizes), seconds, peak_kb = timed(cohorts.retention)
+            results['database'] = {
+                'users': int(sizes.sum()),
+                'seconds': seconds,
+                'peak_memory_kb': peak_kb,
+                'cohorts': len(matrix),
+            }
+
+    for name, result in results.items():
+        click.echo('{0:>10}: {1}'.format(name, ', '.join(
+            '{0} {1:.3f}'.format(key, value) if isinstance(value, float) else '{0} {1}'.format(key, value)
+            for key, value in sorted(result.items()))))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""Endpoint benchmark at several data scale factors.
+
+For each scale factor, reseeds the database (``flask seed --scale``), timing
+every seed stage, then times every route of the public and store blueprints
+as a staff user of its own, created for the run and deleted after it. Each
+stage and route records its wall time, the queries it sent and its peak
+Python memory. It runs against the development database (``DevConfig``);
+point the ``MYSQL_*`` variables at a local database it may wipe, keep a
+baseline, and fail when a later run regresses against it::
+
+    python -m tests.benchmarks.bench_endpoints --yes --output tests/benchmarks/baseline_endpoints.json
+    python -m tests.benchmarks.bench_endpoints --yes --baseline tests/benchmarks/baseline_endpoints.json
+
+Pass ``--skip-seed`` to time the routes against the database as it is.
+"""
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import click
+from flask import Blueprint
+from sqlalchemy import event
+
+from blockflix import loadtest
+from blockflix.app import create_app
+from blockflix.extensions import cache, db
+from blockflix.public import controllers as public_controllers
+from blockflix.settings import DevConfig
+from blockflix.store import controllers as store_controllers
+from blockflix.store.models import User
+
+from .bench_associations import percentile
+
+#: Seed stages, in the order ``simulate`` runs them, and whether they take the scale factor
+SEED_STAGES = [('clear_db', False), ('create_films', True), ('create_users_payments', True),
+               ('create_rentals', False), ('create_film_stats', False), ('update_popularity', False),
+               ('create_revenue_rollup', False)]
+#: Routes that would end the benchmark's session or write data
+SKIPPED = {'public.logout', 'public.register', 'api.checkout', 'api.batch_returns'}
+#: Measurements that fail the run when they grow past the threshold
+GATED = ('seconds', 'p50_ms', 'queries', 'cold_queries', 'peak_memory_kb')
+USERNAME = PASSWORD = 'benchmark'
+
+
+class BenchmarkConfig(DevConfig):
+    """The development database, without the debug toolbar in every page timed."""
+
+    DEBUG_TB_ENABLED = False
+
+
+@contextmanager
+def measured(engine, trace_memory=True):
+    """Measure the wall time, queries and (optionally) peak Python memory of a block."""
+    result = {}
+    queries = []
+
+    def count(*args):
+        queries.append(1)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        result['queries'] = len(queries)
+        if trace_memory:
+            result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def seed(scale):
+    """Reseed the database at a scale factor, measuring each stage."""
+    from blockflix import seed as seeding
+    stages = OrderedDict()
+    for name, scaled in SEED_STAGES:
+        stage = getattr(seeding, name)
+        with measured(db.engine) as stages[name]:
+            if scaled:
+                stage(scale)
+            else:
+                stage()
+    return stages
+
+
+def routes(app):
+    """The routes to time, as ``(method, path)``: every public and store page, and the store's data POSTs."""
+    blueprints = {}
+    for module in (public_controllers, store_controllers):
+        blueprints.update((value.name, module) for value in vars(module).values() if isinstance(value, Blueprint))
+    timed = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        blueprint = rule.endpoint.rpartition('.')[0]
+        if blueprint not in blueprints or rule.arguments or rule.endpoint in SKIPPED:
+            continue
+        if 'GET' in rule.methods:
+            timed.append(('GET', rule.rule))
+        if 'POST' in rule.methods and blueprints[blueprint] is store_controllers:
+            timed.append(('POST', rule.rule))
+    # The login form posts back to the home page
+    timed.append(('POST', '/'))
+    return timed
+
+
+def time_route(session, method, path, samples, data=None, expect=200):
+    """Time a route: once from a cold cache, tracing memory, then ``samples`` times warm."""
+    with measured(db.engine) as cold:
+        session.request(method, path, data=data, expect=expect)
+    with measured(db.engine, trace_memory=False) as warm:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            session.request(method, path, data=data, expect=expect)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'cold_ms': cold['seconds'] * 1000,
+        'cold_queries': cold['queries'],
+        'peak_memory_kb': cold['peak_memory_kb'],
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'queries': warm['queries'] / float(samples),
+    }
+
+
+@contextmanager
+def benchmark_user():
+    """A staff user for the run, so the staff-only reports are timed too, deleted afterwards."""
+    # Left behind by an interrupted run
+    User.query.filter(User.username == USERNAME).delete()
+    user = User.create(username=USERNAME, email='benchmark@example.com', first_name='Bench', last_name='Mark',
+                       password=PASSWORD, active=True, is_admin=True)
+    user_id = user.id
+    try:
+        yield user
+    finally:
+        db.session.rollback()
+        User.query.filter(User.id == user_id).delete()
+        db.session.commit()
+
+
+def time_routes(app, samples):
+    """Time every route as the benchmark's user, from an empty cache."""
+    cache.clear()
+    with benchmark_user() as user:
+        return time_routes_as(app, user, samples)
+
+
+def time_routes_as(app, user, samples):
+    """Time every route as a user."""
+    recorder = loadtest.Recorder()
+    session = loadtest.Session(loadtest.WSGIClient(app), recorder, user.username, PASSWORD)
+    if not session.log_in():
+        raise click.ClickException('Could not log in as {0}'.format(user.username))
+    login = {'username': user.username, 'password': PASSWORD, 'csrf_token': session.csrf_token}
+    results = OrderedDict()
+    for method, path in routes(app):
+        data, expect = (login, 302) if (method, path) == ('POST', '/') else (None, 200)
+        results['{0} {1}'.format(method, path)] = time_route(session, method, path, samples, data, expect)
+    failed = [endpoint for endpoint, errors in recorder.errors.items() if errors]
+    if failed:
+        raise click.ClickException('Requests failed: {0}'.format(', '.join(sorted(failed))))
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Measurements grown more than ``threshold`` (a fraction) past the baseline's."""
+    found = []
+    for scale, sections in results.items():
+        for section, measurements in sections.items():
+            for name, result in measurements.items():
+                before = baseline.get(scale, {}).get(section, {}).get(name)
+                if not before:
+                    continue
+                for metric in GATED:
+                    if metric in result and metric in before and result[metric] > before[metric] * (1 + threshold):
+                        found.append('{0} {1} {2}: {3} {4:.3f} -> {5:.3f}'.format(
+                            scale, section, name, metric, before[metric], result[metric]))
+    return found
+
+
+@click.command()
+@click.option('--scale', 'scales', multiple=True, type=float, default=[0.1, 0.5, 1.0],
+              help='Seed at this scale factor (may be repeated; default: 0.1, 0.5 and 1)')
+@click.option('--samples', default=50, help='Warm requests to time per route (default: 50)')
+@click.option('--skip-seed', default=False, is_flag=True,
+              help='Time the routes against the database as it is, without reseeding')
+@click.option('--yes', default=False, is_flag=True, help='Don\'t ask before wiping the database')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+@click.option('--baseline', default=None, help='Fail on regressions against this JSON result file')
+@click.option('--threshold', default=0.2,
+              help='Growth over the baseline that counts as a regression (default: 0.2, i.e. 20%)')
+def main(scales, samples, skip_seed, yes, output, baseline, threshold):
+    """Time the seed stages and every route at several data scale factors."""
+    app = create_app(BenchmarkConfig)
+    if not skip_seed and not yes:
+        click.confirm('This wipes {0}. Continue?'.format(app.config['SQLALCHEMY_DATABASE_URI']), abort=True)
+    results = OrderedDict()
+    with app.app_context():
+        for scale in (['current'] if skip_seed else scales):
+            key = scale if skip_seed else '{0:g}'.format(scale)
+            results[key] = OrderedDict()
+            if not skip_seed:
+                results[key]['seed'] = seed(scale)
+            results[key]['routes'] = time_routes(app, samples)
+
+    for scale, sections in results.items():
+        click.echo('scale {0}'.format(scale))
+        for name, result in sections.get('seed', {}).items():
+            click.echo('  {0:24} {seconds:9.3f}s queries={queries} memory={peak_memory_kb} kB'.format(
+                name, **result))
+        for name, result in sections['routes'].items():
+            click.echo('  {0:24} p50={p50_ms:8.3f}ms p95={p95_ms:8.3f}ms cold={cold_ms:8.3f}ms '
+                       'queries={queries:.1f} cold_queries={cold_queries} memory={peak_memory_kb} kB'.format(
+                           name, **result))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            found = regressions(results, json.load(f), threshold)
+        for regression in found:
+            click.echo('regression: {0}'.format(regression), err=True)
+        if found:
+            raise click.ClickException('{0} measurements regressed more than {1:.0%}'.format(len(found), threshold))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Gunicorn worker configuration benchmark.
+
+Starts gunicorn with ``blockflix.gunicorn_conf`` in each configuration to
+compare: sync workers, gthread workers, and gthread workers with the app
+preloaded. Each run loads the listing endpoints from concurrent logged-in
+clients and reports throughput, latency and the memory all of gunicorn's
+processes take. Point the ``MYSQL_*`` variables at a seeded database and pass
+a user to log in as::
+
+    python -m tests.benchmarks.bench_gunicorn --username admin --password secret --output gunicorn.json
+"""
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener, urlopen
+
+import click
+
+from .bench_associations import percentile
+
+CONFIGURATIONS = [
+    ('sync', {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_PRELOAD': '0'}),
+    ('gthread', {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_PRELOAD': '0'}),
+    ('gthread+preload', {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_PRELOAD': '1'}),
+]
+LISTINGS = ['/films/', '/actors/', '/categories/']
+CSRF_TOKEN = re.compile(r'name="csrf-token" content="([^"]+)"')
+
+
+def log_in(base_url, username, password):
+    """A URL opener holding a logged-in session, and the CSRF token to send with POSTs."""
+    opener = build_opener(HTTPCookieProcessor(CookieJar()))
+    token = CSRF_TOKEN.search(opener.open(base_url + '/').read().decode('utf-8')).group(1)
+    form = urlencode({'username': username, 'password': password, 'csrf_token': token}).encode('utf-8')
+    page = opener.open(base_url + '/', form).read().decode('utf-8')
+    if 'You are logged in' not in page:
+        raise click.ClickException('Could not log in as {0}'.format(username))
+    return opener, token
+
+
+def wait_until_up(base_url, timeout=30):
+    """Wait for the server to answer."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urlopen(base_url + '/about/').read()
+            return
+        except (URLError, IOError):
+            time.sleep(0.2)
+    raise click.ClickException('gunicorn did not start within {0}s'.format(timeout))
+
+
+def process_memory_kb(pid):
+    """Proportional set size of a process and its children, in kB (Linux only), or None."""
+    total = 0
+    pids = [pid]
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(pid)) as f:
+            pids += [int(child) for child in f.read().split()]
+        for process in pids:
+            with open('/proc/{0}/smaps_rollup'.format(process)) as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+    except IOError:
+        return None
+    return total
+
+
+def load(base_url, username, password, clients, seconds):
+    """POST the listings from concurrent clients for a while; returns latencies in ms and errors."""
+    timings, errors = [], []
+    deadline = time.time() + seconds
+
+    def client():
+        opener, token = log_in(base_url, username, password)
+        while time.time() < deadline:
+            for path in LISTINGS:
+                request = Request(base_url + path, data=b'', headers={'X-CSRFToken': token})
+                start = time.time()
+                try:
+                    opener.open(request).read()
+                except (URLError, IOError) as error:
+                    errors.append(error)
+                    continue
+                timings.append((time.time() - start) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+@click.command()
+@click.option('--username', required=True, help='User to log in as')
+@click.option('--password', required=True, help='Password of that user')
+@click.option('--port', default=8765, help='Port to run gunicorn on (default: 8765)')
+@click.option('--workers', default=None, type=int, help='Workers (default: the config module\'s)')
+@click.option('--clients', default=16, help='Concurrent clients (default: 16)')
+@click.option('--seconds', default=20, help='Seconds to load each configuration (default: 20)')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+def main(username, password, port, workers, clients, seconds, output):
+    """Compare gunicorn worker configurations on the listing endpoints."""
+    base_url = 'http://127.0.0.1:{0}'.format(port)
+    results = {}
+    for name, settings in CONFIGURATIONS:
+        env = dict(os.environ, PORT=str(port), **settings)
+        if workers:
+            env['GUNICORN_WORKERS'] = str(workers)
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'python:blockflix.gunicorn_conf',
+                                   '--access-logfile', os.devnull, 'autoapp:application'], env=env)
+        try:
+            wait_until_up(base_url)
+            timings, errors = load(base_url, username, password, clients, seconds)
+            if not timings:
+                raise click.ClickException('{0}: every request failed, e.g. {1}'.format(name, errors[0]))
+            results[name] = {
+                'requests_per_second': len(timings) / float(seconds),
+                'p50_ms': percentile(timings, 50),
+                'p95_ms': percentile(timings, 95),
+                'p99_ms': percentile(timings, 99),
+                'errors': len(errors),
+                'memory_kb': process_memory_kb(server.pid),
+            }
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    for name, result in results.items():
+        click.echo('{0:16} {requests_per_second:8.1f} req/s p50={p50_ms:8.3f}ms p95={p95_ms:8.3f}ms '
+                   'p99={p99_ms:8.3f}ms errors={errors} memory={memory_kb} kB'.format(name, **result))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
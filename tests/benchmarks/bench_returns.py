@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Batch return throughput benchmark.
+
+Returns the open rentals of a seeded database through
+:func:`blockflix.store.returns.process`, half of them scanned by rental id and
+half by user and film, at several chunk sizes. Rentals are reopened after
+each run, so the database is left as it was::
+
+    python -m tests.benchmarks.bench_returns --output returns.json
+"""
+import json
+import time
+
+import click
+
+from blockflix.app import create_app
+from blockflix.extensions import db
+from blockflix.settings import DevConfig
+from blockflix.store import returns
+from blockflix.store.models import Rental
+
+
+def reopen(rental_ids):
+    """Undo the returns of a run."""
+    for chunk in returns.chunked(rental_ids, 10000):
+        db.session.execute(Rental.__table__.update().where(Rental.id.in_(chunk)).values(return_date=None))
+    db.session.commit()
+
+
+@click.command()
+@click.option('--scans', default=20000, help='Open rentals to return (default: 20000)')
+@click.option('--chunk-size', 'chunk_sizes', multiple=True, type=int, default=[100, 1000, 5000],
+              help='Chunk size to time (may be repeated; default: 100, 1000 and 5000)')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+def main(scans, chunk_sizes, output):
+    """Time returning open rentals in batches."""
+    app = create_app(DevConfig)
+    results = {}
+    with app.app_context():
+        rows = db.session.query(Rental.id, Rental.user_id, Rental.film_id)\
+                         .filter(Rental.return_date.is_(None)).limit(scans).all()
+        if not rows:
+            raise click.ClickException('There are no open rentals; seed the database first')
+        batch = [returns.Scan(row.id, None, None, returns.parse_date('2018-01-01')) if index % 2 else
+                 returns.Scan(None, row.user_id, row.film_id, returns.parse_date('2018-01-01'))
+                 for index, row in enumerate(rows)]
+        for chunk_size in chunk_sizes:
+            start = time.perf_counter()
+            outcomes = list(returns.process(batch, chunk_size))
+            seconds = time.perf_counter() - start
+            reopen([row.id for row in rows])
+            results[str(chunk_size)] = {
+                'scans': len(batch),
+                'seconds': seconds,
+                'scans_per_second': len(batch) / seconds,
+                'outcomes': dict(returns.summarize(outcomes)),
+            }
+
+    for chunk_size, result in sorted(results.items(), key=lambda item: int(item[0])):
+        click.echo('chunks of {0:>6}: {scans} scans in {seconds:8.3f}s ({scans_per_second:10.0f}/s) {outcomes}'.format(
+            chunk_size, **result))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Listing serialization benchmark.
+
+Times building each listing endpoint's JSON body both ways: ORM instances
+through ``to_dict()`` and ``jsonify``, and result rows through the store's row
+serializers and :func:`blockflix.serializers.dumps`. Run against a seeded
+database::
+
+    python -m tests.benchmarks.bench_serializers --output serializers.json
+"""
+import json
+import time
+
+import click
+from flask import jsonify
+from sqlalchemy import func
+
+from blockflix.app import create_app
+from blockflix.serializers import BACKENDS, dumps
+from blockflix.settings import DevConfig
+from blockflix.store import queries, serializers
+from blockflix.store.models import Payment
+
+from .bench_associations import percentile
+
+
+def busiest_user_id():
+    """The user with the most payments, for the largest /payments/ page."""
+    return Payment.query.with_entities(Payment.user_id)\
+                        .group_by(Payment.user_id)\
+                        .order_by(func.count(Payment.id).desc())\
+                        .limit(1).scalar()
+
+
+def listings(user_id):
+    """Listing endpoint -> (ORM path, row serializer path), each building the response body."""
+    return {
+        'films': (
+            lambda: jsonify({'data': [film.to_dict() for film in queries.top_films()]}).get_data(),
+            lambda: dumps({'data': serializers.films(serializers.films.query(queries.top_films()))}),
+        ),
+        'actors': (
+            lambda: jsonify({'data': [actor.to_dict() for actor in queries.all_actors()]}).get_data(),
+            lambda: dumps({'data': serializers.actors(serializers.actors.query(queries.all_actors()))}),
+        ),
+        'categories': (
+            lambda: jsonify({'data': [category.to_dict() for category in queries.all_categories()]}).get_data(),
+            lambda: dumps({'data': serializers.categories(serializers.categories.query(queries.all_categories()))}),
+        ),
+        'payments': (
+            lambda: jsonify({'data': [payment.to_dict() for payment in queries.user_payments(user_id)]}).get_data(),
+            lambda: dumps({'data': serializers.payments(queries.user_payment_history(user_id), user='')}),
+        ),
+    }
+
+
+def time_calls(func, repeat):
+    """Time ``repeat`` calls of a function, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'mean_ms': sum(timings) / len(timings), 'p50_ms': percentile(timings, 50),
+            'p95_ms': percentile(timings, 95)}
+
+
+@click.command()
+@click.option('--repeat', default=50, help='Responses to build per endpoint and path (default: 50)')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+@click.option('--compare', default=None, help='Compare against a previous JSON result file')
+def main(repeat, output, compare):
+    """Time ORM to_dict + jsonify against row serializers + fast JSON for every listing."""
+    app = create_app(DevConfig)
+    backend = next(name for name, encoder in BACKENDS.items() if encoder is not None)
+    click.echo('JSON backend: {0}'.format(backend))
+    results = {}
+    with app.test_request_context():
+        for name, (orm, rows) in sorted(listings(busiest_user_id()).items()):
+            results[name] = {'orm': time_calls(orm, repeat), 'rows': time_calls(rows, repeat)}
+
+    baseline = json.load(open(compare)) if compare else {}
+    for name, result in sorted(results.items()):
+        line = '{0:12} orm p50={1:8.3f}ms rows p50={2:8.3f}ms ({3:.1f}x)'.format(
+            name, result['orm']['p50_ms'], result['rows']['p50_ms'],
+            result['orm']['p50_ms'] / result['rows']['p50_ms'])
+        if name in baseline:
+            line += '  ({0:+.1%} rows p50 vs baseline)'.format(
+                result['rows']['p50_ms'] / baseline[name]['rows']['p50_ms'] - 1)
+        click.echo(line)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
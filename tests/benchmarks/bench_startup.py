@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Worker startup benchmark.
+
+Boots the app in fresh interpreters, as gunicorn workers do, and reports how
+long importing and creating it takes, the resident memory it needs and the
+slowest imports::
+
+    python -m tests.benchmarks.bench_startup --output startup.json
+"""
+import json
+import subprocess
+import sys
+
+import click
+
+from .bench_associations import percentile
+
+STARTUP = """
+import json, resource, time
+start = time.time()
+from blockflix.app import create_app
+from blockflix.settings import ProdConfig
+create_app(ProdConfig)
+print(json.dumps({'seconds': time.time() - start,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def boot():
+    """Boot the app once in a fresh interpreter."""
+    return json.loads(subprocess.check_output([sys.executable, '-c', STARTUP]).decode('utf-8'))
+
+
+def slowest_imports(count):
+    """The modules taking longest to import, including what they import, in milliseconds."""
+    if sys.version_info < (3, 7):
+        return []
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import blockflix.app'],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        timings.append((int(cumulative) / 1000.0, module.rstrip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+@click.command()
+@click.option('--boots', default=10, help='Times to boot the app (default: 10)')
+@click.option('--top', default=15, help='Slowest imports to list (default: 15)')
+@click.option('--output', default=None, help='Write the results to this JSON file')
+@click.option('--compare', default=None, help='Compare against a previous JSON result file')
+def main(boots, top, output, compare):
+    """Time worker startup and measure its memory."""
+    runs = [boot() for _ in range(boots)]
+    seconds = [run['seconds'] * 1000 for run in runs]
+    results = {
+        'startup': {'mean_ms': sum(seconds) / len(seconds), 'p50_ms': percentile(seconds, 50),
+                    'p95_ms': percentile(seconds, 95)},
+        'max_rss_kb': max(run['max_rss_kb'] for run in runs),
+    }
+
+    baseline = json.load(open(compare)) if compare else {}
+    line = 'startup      mean={mean_ms:8.3f}ms p50={p50_ms:8.3f}ms p95={p95_ms:8.3f}ms'.format(**results['startup'])
+    if baseline:
+        line += '  ({0:+.1%} p50 vs baseline)'.format(results['startup']['p50_ms'] / baseline['startup']['p50_ms'] - 1)
+    click.echo(line)
+    click.echo('max RSS      {0} kB per worker'.format(results['max_rss_kb']))
+    for milliseconds, module in slowest_imports(top):
+        click.echo('{0:10.1f}ms {1}'.format(milliseconds, module))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Index advisor tests."""
+from blockflix.advisor import HOT_QUERIES, analyze_plan
+
+
+def plan_row(**kwargs):
+    """An EXPLAIN row with sensible defaults."""
+    row = {'table': 'films', 'type': 'ref', 'possible_keys': 'ix_films_popularity',
+           'key': 'ix_films_popularity', 'rows': 5000, 'Extra': ''}
+    row.update(kwargs)
+    return row
+
+
+class TestAnalyzePlan:
+    """Plan analysis."""
+
+    def test_index_lookup_is_clean(self):
+        """An index lookup is not flagged."""
+        assert analyze_plan('films.top', [plan_row()]) == []
+
+    def test_full_scan_and_filesort_are_flagged(self):
+        """A full scan sorted in memory is flagged twice."""
+        findings = analyze_plan('films.top', [plan_row(type='ALL', key=None, Extra='Using filesort')])
+        assert [f.problem for f in findings] == ['full table scan', 'filesort']
+
+    def test_temporary_table_is_flagged(self):
+        """A temporary table is flagged."""
+        findings = analyze_plan('films.top', [plan_row(Extra='Using temporary; Using filesort')])
+        assert [f.problem for f in findings] == ['filesort', 'temporary table']
+
+    def test_small_scans_are_ignored(self):
+        """Scans estimated below min_rows are not flagged."""
+        assert analyze_plan('films.top', [plan_row(type='ALL', rows=10)], min_rows=1000) == []
+
+
+def test_store_hot_queries_are_registered(app):
+    """The store's hot-path queries register with the advisor."""
+    for name in ('films.top', 'payments.for_user', 'rentals.open_for_user', 'users.by_email'):
+        assert name in HOT_QUERIES
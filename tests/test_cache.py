@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Two-tier cache tests."""
+import threading
+import time
+
+import pytest
+
+from blockflix.cache import LRUCache, SharedFileSystemCache, TwoTierCache
+
+
+def two_tier(**kwargs):
+    """A two-tier cache with an in-process stand-in for the shared tier."""
+    return TwoTierCache(LRUCache(max_size=10), LRUCache(max_size=100), **kwargs)
+
+
+class TestSharedFileSystemCache:
+    """Directory tier."""
+
+    def test_add_only_once(self, tmpdir):
+        """Of several adds racing for a key, exactly one stores its value."""
+        cache = SharedFileSystemCache(str(tmpdir))
+        results = []
+        threads = [threading.Thread(target=lambda n=n: results.append(cache.add('lock:a', n))) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count(True) == 1
+        assert cache.get('lock:a') in range(8)
+        assert len(tmpdir.listdir()) == 2  # The key and the file count
+
+    def test_add_replaces_expired(self, tmpdir):
+        """An expired value doesn't block an add."""
+        cache = SharedFileSystemCache(str(tmpdir))
+        cache.set('a', 'old', timeout=2)
+        assert not cache.add('a', 'new')
+        time.sleep(2.1)
+        assert cache.add('a', 'new')
+        assert cache.get('a') == 'new'
+
+
+class TestLRUCache:
+    """In-process tier."""
+
+    def test_evicts_least_recently_used(self):
+        """The least recently used key goes first once full."""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+
+    def test_expires(self):
+        """Entries past their timeout are gone."""
+        cache = LRUCache()
+        cache.set('a', 1, timeout=1)
+        cache._entries['a'] = (time.time() - 1, 1)
+        assert cache.get('a') is None
+
+
+class TestTwoTierCache:
+    """Two-tier cache."""
+
+    def test_shared_tier_fills_local_tier(self):
+        """A value set by another worker is read from the shared tier, then locally."""
+        cache = two_tier()
+        cache.set('a', 1, timeout=60)
+        cache.local.clear()
+        assert cache.get('a') == 1
+        assert cache.get('a') == 1
+        stats = cache.stats()
+        assert (stats['shared_hits'], stats['local_hits'], stats['misses']) == (1, 1, 0)
+
+    def test_get_or_compute_caches(self):
+        """The second call is a hit."""
+        cache = two_tier()
+        assert cache.get_or_compute('a', lambda: 1) == 1
+        assert cache.get_or_compute('a', lambda: 2) == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_concurrent_misses_compute_once(self):
+        """Threads missing the same key together wait for a single computation."""
+        cache = two_tier()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'films'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('films', compute)))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert results == ['films'] * 10
+        assert cache.stats()['coalesced'] == 9
+        assert cache._key_locks == {}
+
+    def test_key_locks_are_dropped(self):
+        """Each key's lock is forgotten once done with, even when computing fails."""
+        cache = two_tier()
+        for version in range(100):
+            cache.get_or_compute('films:v{0}'.format(version), lambda: 'films')
+
+        def fail():
+            raise ValueError('Database down')
+
+        with pytest.raises(ValueError):
+            cache.get_or_compute('actors', fail)
+        assert cache._key_locks == {}
+
+    def test_expired_value_served_while_another_worker_recomputes(self):
+        """Within the grace period, the old value is served if the key is locked elsewhere."""
+        cache = two_tier(stale_grace=60)
+        cache.set('a', 'old', timeout=1)
+        cache.local.clear()
+        entry = cache.shared.get('a')
+        cache.shared.set('a', entry._replace(expires=time.time() - 1))
+        cache.shared.add('lock:a', 1)
+        assert cache.get_or_compute('a', lambda: 'new') == 'old'
+        assert cache.stats()['stale_served'] == 1
+
+    def test_recomputes_early_near_expiry(self):
+        """A slow-to-compute value about to expire is recomputed ahead of time."""
+        cache = two_tier(beta=1.0)
+        cache._store('a', 'old', 60, 0)
+        entry = cache.local.get('a')
+        cache.local.set('a', entry._replace(expires=time.time() + 0.001, delta=1000.0))
+        assert cache.get_or_compute('a', lambda: 'new') == 'new'
+        assert cache.stats()['early_recomputes'] == 1
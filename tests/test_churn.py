@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Churn scoring tests."""
+import datetime as dt
+import os
+
+import numpy as np
+
+from blockflix import seed
+from blockflix.analytics import churn
+from blockflix.store.models import Film, Payment, Rental, User, UserScore
+
+TODAY = dt.date(2017, 6, 1)
+
+
+def square(task):
+    """A task for the process pool."""
+    return task * task
+
+
+def test_map_chunks_in_process(app):
+    """With one process, tasks run here, in order."""
+    assert list(churn.map_chunks(square, [1, 2, 3], 1)) == [1, 4, 9]
+
+
+def test_map_chunks_across_processes(app):
+    """Tasks are spread across processes."""
+    assert sorted(churn.map_chunks(square, range(10), 2)) == [task * task for task in range(10)]
+
+
+def test_model_round_trip(tmpdir):
+    """Models are kept between runs, and there is none before the first."""
+    path = str(tmpdir.join('churn.pkl'))
+    assert churn.load_model(path) is None
+    churn.save_model({'weights': [1, 2]}, path)
+    assert churn.load_model(path) == {'weights': [1, 2]}
+
+
+def test_train():
+    """Users who stopped paying long ago score as riskier."""
+    features = np.array([[400, 2, 3, 5, 1, 10, 0]] * 20 + [[400, 0.1, 0, 150, 0, 120, 3]] * 20, dtype=float)
+    churned = np.array([False] * 20 + [True] * 20)
+    model = churn.train(features, churned)
+    staying, leaving = model.predict_proba(features[[0, -1]])[:, 1]
+    assert leaving > 0.5 > staying
+
+
+def test_run(app, db, tmpdir):
+    """Every user is scored, those who stopped paying as riskier, and a second run reuses the model."""
+    app.config.update(CHURN_MODEL_PATH=str(tmpdir.join('churn.pkl')), CHURN_TRAINING_USERS=10, CHURN_CHUNK_SIZE=2)
+    film = Film.create(title='Watched', description='A film users rent')
+    for index in range(8):
+        user = User.create(username='member{0}'.format(index), email='member{0}@example.com'.format(index),
+                           first_name='Mem', last_name='Ber', active=True, created_at=dt.datetime(2016, 1, 1))
+        stopped = dt.date(2017, 1, 1) if index % 2 else TODAY
+        month = dt.date(2016, 1, 1)
+        while month < stopped:
+            Payment.create(user_id=user.id, amount=9.99, payment_date=month)
+            Rental.create(user_id=user.id, film_id=film.id, rental_date=month, return_date=month)
+            month = (month + dt.timedelta(days=32)).replace(day=1)
+
+    report = churn.run(TODAY)
+    assert (report.users, report.chunks, report.trained) == (8, 4, True)
+    assert list(report.timings)[-4:] == ['features', 'predict', 'write', 'score']
+    assert os.path.exists(app.config['CHURN_MODEL_PATH'])
+    risks = dict(UserScore.query.with_entities(UserScore.user_id, UserScore.churn_risk))
+    users = [user.id for user in User.query.order_by(User.id)]
+    assert len(risks) == 8
+    assert min(risks[user_id] for user_id in users[1::2]) > max(risks[user_id] for user_id in users[::2])
+
+    assert churn.run(TODAY).trained is False
+
+    # Reseeding deletes the scores before the users they reference
+    seed.clear_db()
+    assert UserScore.query.count() == 0
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Cohort retention tests."""
+import math
+
+import numpy as np
+
+from blockflix.analytics import cohorts
+
+JAN, FEB, MAR = 2017 * 12, 2017 * 12 + 1, 2017 * 12 + 2
+USERS = np.array([[1, JAN], [5, MAR], [2, JAN], [3, FEB]])
+
+
+def test_month_label():
+    """Month indexes count months since year 0."""
+    assert cohorts.month_label(JAN) == '2017-01'
+    assert cohorts.month_label(MAR + 9) == '2017-12'
+
+
+class TestCohortMatrix:
+    """Retention from users and chunks of payments."""
+
+    def test_shares(self):
+        """Each cohort's share of users paying at each age, counting a user once per month."""
+        chunks = [np.array([[1, JAN], [1, JAN], [2, JAN], [1, FEB]]),
+                  np.array([[3, FEB], [1, MAR], [3, MAR], [2, JAN - 1]])]
+        matrix, sizes = cohorts.cohort_matrix(USERS, chunks)
+        assert list(sizes) == [2, 1, 1]
+        assert list(matrix.loc[JAN]) == [1.0, 0.5, 0.5]
+        assert list(matrix.loc[FEB])[:2] == [1.0, 1.0]
+        assert math.isnan(matrix.loc[FEB, 2])
+
+    def test_payments_after_the_last_signup(self):
+        """The matrix runs through the month of the latest payment, of any user."""
+        matrix, _ = cohorts.cohort_matrix(USERS, [np.array([[1, MAR + 2], [9, MAR + 6]]), np.empty((0, 2))])
+        assert len(matrix.columns) == 9
+        assert matrix.loc[JAN, 4] == 0.5
+        assert matrix.loc[JAN].sum() == 0.5
+        assert matrix.loc[MAR].count() == 7
+
+    def test_as_dict(self):
+        """The API lists each cohort's shares as far as it is old."""
+        report = cohorts.as_dict(*cohorts.cohort_matrix(USERS, [np.array([[2, FEB], [5, MAR]])]))
+        assert report['ages'] == 3
+        assert report['cohorts'][0] == {'cohort': '2017-01', 'users': 2, 'retention': [0.0, 0.5, 0.0]}
+        assert report['cohorts'][2] == {'cohort': '2017-03', 'users': 1, 'retention': [1.0]}
+
+
+def test_report_is_cached(app, monkeypatch):
+    """The matrix is computed once, until it is refreshed."""
+    computed = []
+
+    def retention(chunk_size=None):
+        computed.append(chunk_size)
+        return cohorts.cohort_matrix(USERS, [])
+    monkeypatch.setattr(cohorts, 'retention', retention)
+
+    assert cohorts.report() == cohorts.report()
+    assert len(computed) == 1
+    cohorts.report(refresh=True)
+    assert len(computed) == 2
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Response compression tests."""
+import gzip
+import json
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from blockflix import compression
+from blockflix.compression import Compressor, FingerprintedStatic, accepted_encodings
+
+JSON_TYPES = ['application/json', 'text/csv']
+
+
+@pytest.fixture
+def client(tmpdir):
+    """A client for a bare app behind the compression middleware, with static files in tmpdir."""
+    app = Flask(__name__)
+
+    @app.route('/big')
+    def big():
+        return jsonify({'data': [{'first_name': 'Penelope', 'last_name': 'Guiness'}] * 200})
+
+    @app.route('/small')
+    def small():
+        return jsonify({'data': []})
+
+    @app.route('/stream')
+    def stream():
+        return Response(('{0},film\n'.format(number) for number in range(1000)), mimetype='text/csv')
+
+    @app.route('/encoded')
+    def encoded():
+        return Response(gzip.compress(b'x' * 1000), mimetype='application/json', headers={'Content-Encoding': 'gzip'})
+
+    tmpdir.join('main_js.0123456789abcdef0123.js').write('var films = [];\n' * 200)
+    tmpdir.join('main_js.0123456789abcdef0123.js.gz').write_binary(gzip.compress(b'var films = [];\n' * 200))
+    tmpdir.join('style.css').write('body {}')
+    app.wsgi_app = FingerprintedStatic(app.wsgi_app, str(tmpdir), '/static/build')
+    app.wsgi_app = Compressor(app.wsgi_app, min_size=500, content_types=JSON_TYPES)
+    return app.test_client()
+
+
+def test_accepted_encodings():
+    """Codings refused with q=0 are not accepted."""
+    assert accepted_encodings({'HTTP_ACCEPT_ENCODING': 'gzip, deflate;q=0.5, br;q=0'}) == {'gzip', 'deflate'}
+
+
+def test_compresses_large_json(client, monkeypatch):
+    """Large JSON is gzipped for clients accepting it."""
+    monkeypatch.setattr(compression, 'brotli', None)
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert 'Content-Length' not in response.headers
+    assert len(json.loads(gzip.decompress(response.data).decode('utf-8'))['data']) == 200
+
+
+def test_prefers_brotli(client):
+    """Brotli is used when installed and accepted."""
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert len(json.loads(brotli.decompress(response.data).decode('utf-8'))['data']) == 200
+
+
+def test_compresses_streamed_response(client, monkeypatch):
+    """Streamed responses are compressed as they go."""
+    monkeypatch.setattr(compression, 'brotli', None)
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+    assert lines[0] == '0,film' and lines[-1] == '999,film'
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/small', {'Accept-Encoding': 'gzip'}),
+    ('/big', {}),
+])
+def test_passed_through(client, path, headers):
+    """Small bodies and clients not accepting compression get the body as is."""
+    response = client.get(path, headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data.decode('utf-8'))
+
+
+def test_already_encoded_not_compressed_twice(client):
+    """A body the app already encoded is passed through."""
+    response = client.get('/encoded', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(response.data) == b'x' * 1000
+
+
+def test_serves_precompressed_fingerprinted_asset(client):
+    """Fingerprinted assets come from their .gz sibling, cached for good."""
+    response = client.get('/static/build/main_js.0123456789abcdef0123.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.mimetype in ('application/javascript', 'text/javascript')
+    assert gzip.decompress(response.data) == b'var films = [];\n' * 200
+
+
+def test_fingerprinted_asset_without_gzip(client):
+    """Clients not accepting gzip get the plain file, still cached for good."""
+    response = client.get('/static/build/main_js.0123456789abcdef0123.js')
+    assert 'Content-Encoding' not in response.headers
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.data == b'var films = [];\n' * 200
+
+
+def test_unfingerprinted_static_left_to_flask(client):
+    """Assets without a content hash are not given immutable headers."""
+    response = client.get('/static/build/style.css')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Columnar export tests."""
+import datetime as dt
+import glob
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import Boolean, Integer, LargeBinary, Numeric, String
+from sqlalchemy.dialects import mysql
+
+from blockflix.analytics import export
+from blockflix.store.models import Film, Payment, Rental, User
+
+
+def test_arrow_type():
+    """Column types map to Arrow types, DOUBLE columns included."""
+    assert export.arrow_type(Integer()) == pa.int64()
+    assert export.arrow_type(Boolean()) == pa.bool_()
+    assert export.arrow_type(String(50)) == pa.string()
+    assert export.arrow_type(mysql.DOUBLE()) == pa.float64()
+    assert export.arrow_type(LargeBinary()) == pa.binary()
+    with pytest.raises(TypeError):
+        export.arrow_type(Numeric(10, 2))
+
+
+def test_users_leave_out_secrets():
+    """Passwords and pictures are not exported."""
+    columns = export.exported_columns(User.__table__, export.EXPORTS['users'])
+    names = [column.name for column in columns]
+    assert 'password' not in names and 'picture' not in names
+    assert 'email' in names
+
+
+def test_watermarks_round_trip(tmpdir):
+    """Watermarks are kept between runs, and there are none before the first."""
+    directory = str(tmpdir)
+    assert export.read_watermarks(directory) == {}
+    marks = {'rentals': dt.datetime(2017, 3, 1, 12, 30, 5), 'users': dt.datetime(2017, 3, 1, 12, 30)}
+    export.write_watermarks(directory, marks)
+    assert export.read_watermarks(directory) == marks
+    assert os.listdir(directory) == [export.WATERMARKS]
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_batch_writer_row_groups(tmpdir, file_format):
+    """Each table written is a row group, and the file only appears once closed."""
+    path = str(tmpdir.join('table', 'part-1.' + file_format))
+    schema = pa.schema([pa.field('id', pa.int64())])
+    writer = export.BatchWriter(path, schema, file_format)
+    for start in (0, 2):
+        writer.write(pa.Table.from_arrays([pa.array([start, start + 1])], schema=schema))
+    assert not os.path.exists(path)
+    writer.close()
+    assert writer.rows == 4
+    if file_format == 'parquet':
+        assert pq.ParquetFile(path).metadata.num_row_groups == 2
+    else:
+        assert pa.ipc.open_file(path).num_record_batches == 2
+
+
+def test_write_file_drops_partial_file(app, tmpdir, monkeypatch):
+    """A file whose rows fail to stream is removed rather than left half written."""
+    schema = pa.schema([pa.field('id', pa.int64())])
+
+    def failing_stream(connection, statement, schema, row_group_size):
+        yield pa.Table.from_arrays([pa.array([1, 2])], schema=schema)
+        raise IOError('Lost connection')
+
+    monkeypatch.setattr(export, 'stream', failing_stream)
+    path = str(tmpdir.join('rentals', 'part-1.parquet'))
+    with pytest.raises(IOError):
+        export.write_file(None, None, schema, path, 'parquet', 2)
+    assert tmpdir.join('rentals').listdir() == []
+
+
+def read(directory, table):
+    """Every row exported of a table, across its parts."""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, table, '**', 'part-*.parquet'), recursive=True)):
+        rows.extend(pq.read_table(path).to_pylist())
+    return rows
+
+
+def test_export_is_incremental(app, db, tmpdir):
+    """Rentals land in monthly partitions, and later runs only ship what changed since."""
+    app.config['EXPORT_WATERMARK_LAG'] = 0
+    directory = str(tmpdir)
+    user = User.create(username='exporter', email='exporter@example.com', first_name='Ex', last_name='Porter',
+                       active=True, password='secret')
+    film = Film.create(title='Export', description='Columns')
+    for month in (1, 2, 2):
+        Rental.create(user_id=user.id, film_id=film.id, rental_date=dt.datetime(2017, month, 5))
+    Payment.create(user_id=user.id, amount=9.99, payment_date=dt.datetime(2017, 1, 1))
+    for table in ('rentals', 'payments', 'users', 'films'):
+        db.session.execute('UPDATE {0} SET last_update = last_update - INTERVAL 1 DAY'.format(table))
+    db.session.commit()
+
+    exported = {result.table: result for result in export.export(directory, row_group_size=1)}
+    assert (exported['rentals'].rows, exported['rentals'].files) == (3, 2)
+    assert pq.ParquetFile(glob.glob(os.path.join(directory, 'rentals', 'month=2017-02', '*'))[0]) \
+        .metadata.num_row_groups == 2
+    assert [row['username'] for row in read(directory, 'users')] == ['exporter']
+    assert 'password' not in read(directory, 'users')[0]
+    assert set(export.read_watermarks(directory)) == {name for name, spec in export.EXPORTS.items() if spec.watermark}
+
+    assert sum(result.rows for result in export.export(directory, ['rentals', 'payments'])) == 0
+    assert len(read(directory, 'rentals')) == 3
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Film rental counter tests."""
+import datetime as dt
+
+import pytest
+
+from blockflix import seed
+from blockflix.store import film_stats, rentals, returns
+from blockflix.store.models import Film, FilmStat, Rental, User
+
+
+@pytest.fixture
+def film(db):
+    """A film, and two users to rent it."""
+    film = Film.create(title='Counted', description='A film being counted')
+    for index in range(2):
+        User.create(username='viewer{0}'.format(index), email='viewer{0}@example.com'.format(index),
+                    first_name='Vi', last_name='Ewer', active=True)
+    return film
+
+
+def users():
+    """The ids of the users renting."""
+    return [user.id for user in User.query.order_by(User.id)]
+
+
+def stats(film_id):
+    """A film's counters, as read from the database."""
+    return FilmStat.query.filter(FilmStat.film_id == film_id)\
+                         .with_entities(FilmStat.active_rentals, FilmStat.lifetime_rentals, FilmStat.last_rented)\
+                         .one()
+
+
+def test_checkout_and_return_update_counters(db, film):
+    """Checkouts and returns, one at a time or in batches, keep the counters up to date."""
+    first, second = users()
+    rental = rentals.checkout(first, film.id, limit=1, now=dt.datetime(2017, 1, 1))
+    rentals.checkout(second, film.id, limit=1, now=dt.datetime(2017, 1, 2))
+    assert stats(film.id) == (2, 2, dt.datetime(2017, 1, 2))
+
+    rentals.return_film(first, rental.id)
+    assert stats(film.id) == (1, 2, dt.datetime(2017, 1, 2))
+
+    list(returns.process([returns.Scan(None, second, film.id, dt.datetime(2017, 1, 3))]))
+    assert stats(film.id) == (0, 2, dt.datetime(2017, 1, 2))
+
+
+def test_rebuild(db, film):
+    """Rebuilding counts rentals made behind the counters' back."""
+    first, second = users()
+    Rental.create(user_id=first, film_id=film.id, rental_date=dt.datetime(2017, 1, 1))
+    Rental.create(user_id=second, film_id=film.id, rental_date=dt.datetime(2017, 2, 1),
+                  return_date=dt.datetime(2017, 2, 3))
+    film_stats.rebuild()
+    assert stats(film.id) == (1, 2, dt.datetime(2017, 2, 1))
+
+
+def test_reseed_clears_counters(db, film):
+    """The seed's reset deletes the counters before the films they reference."""
+    first, _ = users()
+    rentals.checkout(first, film.id, limit=1, now=dt.datetime(2017, 1, 1))
+    seed.clear_db()
+    assert FilmStat.query.count() == 0
+    assert Film.query.count() == 0
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""History download tests."""
+import csv
+import datetime as dt
+
+from sqlalchemy.dialects import mysql
+
+from blockflix.compat import PY2
+from blockflix.store import history
+from blockflix.store.models import Film, Payment, PaymentArchive, Rental, User
+
+
+def test_format_amounts():
+    """Amounts are given to the cent, and left blank for rentals."""
+    assert history.format_amounts([9.99, 10, None]) == ['9.99', '10.00', '']
+
+
+def test_encoded():
+    """Text is encoded for the csv module only on Python 2."""
+    rows = [(u'rental', u'Am\xe9lie', '', None)]
+    expected = [[b'rental', b'Am\xc3\xa9lie', '', None]] if PY2 else rows
+    assert history.encoded(rows) == expected
+
+
+def test_statement_includes_archives():
+    """Archived rentals and payments are included, in date order."""
+    sql = str(history.statement(1).compile(dialect=mysql.dialect()))
+    assert 'rentals_archive' in sql and 'payments_archive' in sql
+    assert sql.endswith('ORDER BY date')
+
+
+def test_csv_chunks(db):
+    """Rentals carry their film's title, and the header comes first, before anything is read."""
+    user = User.create(username='historian', email='historian@example.com', first_name='His', last_name='Torian',
+                       active=True)
+    film = Film.create(title='Chronicle', description='Then and now')
+    Rental.create(user_id=user.id, film_id=film.id, rental_date=dt.datetime(2017, 2, 3),
+                  return_date=dt.datetime(2017, 2, 5, 18, 30))
+    Rental.create(user_id=user.id, film_id=film.id, rental_date=dt.datetime(2017, 3, 1))
+    Payment.create(user_id=user.id, amount=9.99, payment_date=dt.datetime(2017, 2, 1))
+    db.session.add(PaymentArchive(id=1000000, user_id=user.id, amount=4.5, payment_date=dt.datetime(2016, 12, 1),
+                                  last_update=dt.datetime(2016, 12, 1)))
+    db.session.commit()
+
+    chunks = list(history.csv_chunks(user.id, 2))
+    assert chunks[0] == 'type,date,film,returned,amount\r\n'
+    assert len(chunks) == 3
+    rows = list(csv.reader(''.join(chunks).splitlines()))[1:]
+    assert rows == [
+        ['payment', '2016-12-01 00:00:00', '', '', '4.50'],
+        ['payment', '2017-02-01 00:00:00', '', '', '9.99'],
+        ['rental', '2017-02-03 00:00:00', 'Chronicle', '2017-02-05 18:30:00', ''],
+        ['rental', '2017-03-01 00:00:00', 'Chronicle', '', ''],
+    ]
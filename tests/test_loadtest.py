@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Load test harness tests."""
+import json
+import threading
+
+import pytest
+from flask import Flask, redirect, request
+from werkzeug.serving import make_server
+
+from blockflix import loadtest
+
+LOGIN_PAGE = b'<meta name="csrf-token" content="t0ken">'
+
+
+class FakeClient(object):
+    """Answers like the app would, for the right password."""
+
+    def __init__(self, password='secret'):
+        """Create instance."""
+        self.password = password
+        self.requests = []
+
+    def request(self, method, path, data=None, headers=None):
+        """Record a request and answer it."""
+        self.requests.append((method, path, data, headers))
+        if path == '/':
+            if method == 'GET':
+                return 200, LOGIN_PAGE
+            return (302, b'') if data['password'] == self.password else (200, LOGIN_PAGE)
+        return 200, b'{"data": []}'
+
+
+def test_percentile():
+    """Percentiles of a list of timings."""
+    timings = list(range(1, 101))
+    assert loadtest.percentile(timings, 50) == 51
+    assert loadtest.percentile(timings, 99) == 100
+    assert loadtest.percentile([5.0], 95) == 5.0
+
+
+def test_run_times_every_endpoint():
+    """Each virtual user logs in, then runs its scenarios; requests are counted per endpoint."""
+    clients = []
+
+    def make_client():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    results = loadtest.run(make_client, 'admin', 'secret', scenarios=['browse_films', 'list_actors'],
+                           concurrency=3, iterations=2)
+    assert list(results) == ['GET /', 'GET /actors/', 'GET /films/', 'POST /', 'POST /actors/', 'POST /films/']
+    assert results['POST /films/']['requests'] == 6
+    assert results['POST /']['requests'] == 3
+    assert all(result['errors'] == 0 for result in results.values())
+    # POSTs carry the token from the login page
+    method, path, _, headers = clients[0].requests[-1]
+    assert (method, headers) == ('POST', {'X-CSRFToken': 't0ken'})
+
+
+def test_run_counts_errors():
+    """Unexpected statuses are counted as errors, not timed."""
+    class Failing(FakeClient):
+        def request(self, method, path, data=None, headers=None):
+            if path == '/payments/':
+                return 500, b''
+            return super(Failing, self).request(method, path, data, headers)
+
+    results = loadtest.run(Failing, 'admin', 'secret', scenarios=['list_payments'], concurrency=1, iterations=3)
+    assert results['GET /payments/']['errors'] == 3
+    assert results['GET /payments/']['requests'] == 0
+
+
+def test_run_fails_when_login_does():
+    """A wrong password stops the run."""
+    with pytest.raises(ValueError):
+        loadtest.run(FakeClient, 'admin', 'wrong', concurrency=2, iterations=1)
+
+
+def test_run_for_a_duration():
+    """Without iterations, users run until the duration is up."""
+    results = loadtest.run(FakeClient, 'admin', 'secret', scenarios=['list_actors'], concurrency=2, duration=0.2)
+    assert results['POST /actors/']['requests'] > 2
+    assert results['POST /actors/']['requests_per_second'] > 0
+
+
+def test_wsgi_client():
+    """The in-process client keeps the session cookie between requests."""
+    app = Flask(__name__)
+
+    @app.route('/', methods=['GET', 'POST'])
+    def home():
+        response = app.make_response(request.cookies.get('session', 'anonymous'))
+        response.set_cookie('session', 'admin')
+        return response
+
+    client = loadtest.WSGIClient(app)
+    assert client.request('GET', '/') == (200, b'anonymous')
+    assert client.request('POST', '/', data={'a': 1}) == (200, b'admin')
+    assert client.request('GET', '/missing')[0] == 404
+
+
+def test_http_client():
+    """The HTTP client keeps the session cookie, and returns redirects rather than following them."""
+    app = Flask(__name__)
+
+    @app.route('/', methods=['GET', 'POST'])
+    def home():
+        if request.method == 'POST':
+            response = redirect('/')
+            response.set_cookie('session', 'admin')
+            return response
+        return request.cookies.get('session', 'anonymous')
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        client = loadtest.HTTPClient('http://127.0.0.1:{0}/'.format(server.server_port))
+        assert client.request('GET', '/') == (200, b'anonymous')
+        assert client.request('POST', '/', data={'a': 1})[0] == 302
+        assert client.request('GET', '/') == (200, b'admin')
+        assert client.request('GET', '/missing')[0] == 404
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def test_compare_and_save(tmpdir):
+    """Results are saved as JSON and compared against an earlier run."""
+    before = {'GET /films/': {'requests_per_second': 100.0, 'p95_ms': 10.0}}
+    after = {'GET /films/': {'requests_per_second': 150.0, 'p95_ms': 5.0},
+             'GET /actors/': {'requests_per_second': 10.0, 'p95_ms': 1.0}}
+    path = str(tmpdir.join('after.json'))
+    loadtest.save(after, path)
+    with open(path) as f:
+        assert json.load(f) == after
+    changes = loadtest.compare(after, before)
+    assert list(changes) == ['GET /films/']
+    assert changes['GET /films/']['requests_per_second'] == pytest.approx(0.5)
+    assert changes['GET /films/']['p95_ms'] == pytest.approx(-0.5)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Metrics tests."""
+import os
+import subprocess
+import sys
+
+from prometheus_client import REGISTRY
+
+
+def sample(name, **labels):
+    """The current value of a sample in the default registry, or 0."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def run_worker(directory, code):
+    """Run code in a fresh process sharing metrics through a multiprocess directory."""
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory, prometheus_multiproc_dir=directory)
+    return subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf-8').strip()
+
+
+def test_requests_recorded_per_endpoint(testapp):
+    """Requests are counted and timed under their endpoint and blueprint."""
+    labels = dict(blueprint='public', endpoint='public.home', method='GET')
+    before = sample('blockflix_requests_total', status='200', **labels)
+    timed = sample('blockflix_request_duration_seconds_count', **labels)
+    testapp.get('/')
+    assert sample('blockflix_requests_total', status='200', **labels) == before + 1
+    assert sample('blockflix_request_duration_seconds_count', **labels) == timed + 1
+    assert sample('blockflix_response_size_bytes_count', blueprint='public', endpoint='public.home') > 0
+    assert sample('blockflix_requests_in_flight') == 0
+
+
+def test_metrics_endpoint(testapp):
+    """/metrics serves the text exposition format, including pool gauges."""
+    response = testapp.get('/metrics')
+    assert response.content_type == 'text/plain'
+    assert 'blockflix_requests_total' in response.text
+    assert 'blockflix_db_pool_checked_out' in response.text
+
+
+def test_workers_aggregate(tmpdir):
+    """Counters from separate worker processes add up in the exposed registry."""
+    directory = str(tmpdir)
+    for _ in range(2):
+        run_worker(directory, 'from blockflix.metrics import REQUESTS; '
+                              "REQUESTS.labels('store', 'films.films', 'POST', '200').inc()")
+    total = run_worker(directory, 'from blockflix.metrics import registry; print(registry().get_sample_value('
+                                  "'blockflix_requests_total', {'blueprint': 'store', 'endpoint': 'films.films', "
+                                  "'method': 'POST', 'status': '200'}))")
+    assert float(total) == 2
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Overdue scan tests."""
+import datetime as dt
+from collections import namedtuple
+
+import pytest
+
+from blockflix.store import overdue
+from blockflix.store.models import Film, OverdueNotice, Rental, ScanCheckpoint, User
+
+Row = namedtuple('Row', ['id', 'user_id', 'film_id', 'rental_date', 'email', 'first_name', 'title'])
+SCHEDULE = overdue.FeeSchedule(overdue_after_days=30, grace_days=7, fee_per_day=0.5, max_fee=5.0)
+TODAY = dt.date(2017, 3, 1)
+
+
+def rented_days_ago(days):
+    """A rental row rented some days before TODAY."""
+    return Row(1, 2, 3, dt.datetime.combine(TODAY - dt.timedelta(days=days), dt.time(18)), 'a@example.com', 'Ann',
+               'Film')
+
+
+class TestNoticeFor:
+    """Reminders and late fees."""
+
+    def test_reminder_during_grace(self):
+        """Rentals overdue by up to the grace period get a reminder."""
+        notice = overdue.notice_for(rented_days_ago(37), TODAY, SCHEDULE)
+        assert (notice['days_overdue'], notice['kind'], notice['late_fee']) == (7, overdue.REMINDER, 0.0)
+        assert notice['notice_date'] == TODAY
+        assert notice['email'] == 'a@example.com'
+
+    def test_late_fee_after_grace(self):
+        """Each day past the grace period adds to the fee."""
+        notice = overdue.notice_for(rented_days_ago(40), TODAY, SCHEDULE)
+        assert (notice['days_overdue'], notice['kind'], notice['late_fee']) == (10, overdue.LATE_FEE, 1.5)
+
+    def test_late_fee_is_capped(self):
+        """The fee stops growing at the maximum."""
+        assert overdue.notice_for(rented_days_ago(400), TODAY, SCHEDULE)['late_fee'] == 5.0
+
+
+def test_checkpoint_per_day():
+    """Each day's scan resumes from its own checkpoint."""
+    assert overdue.checkpoint_name(TODAY) == 'overdue:2017-03-01'
+
+
+@pytest.fixture
+def open_rentals(db):
+    """Five open rentals, overdue as of TODAY, and one returned."""
+    user = User.create(username='late', email='late@example.com', first_name='Lou', last_name='Late', active=True)
+    film = Film.create(title='Kept', description='A film kept too long')
+    rented = dt.datetime(2017, 1, 1)
+    for _ in range(5):
+        Rental.create(user_id=user.id, film_id=film.id, rental_date=rented)
+    Rental.create(user_id=user.id, film_id=film.id, rental_date=rented, return_date=rented)
+
+
+def test_scan_resumes(app, db, open_rentals):
+    """An interrupted scan resumes after its last committed page, and a rerun writes nothing twice."""
+    pages = overdue.scan(TODAY, chunk_size=2, schedule=SCHEDULE)
+    first = next(pages)
+    assert first.scanned == first.written == 2
+    pages.close()
+    assert ScanCheckpoint.query.get(overdue.checkpoint_name(TODAY)).last_id == first.last_id
+
+    rest = list(overdue.scan(TODAY, chunk_size=2, schedule=SCHEDULE))
+    assert sum(page.scanned for page in rest) == 3
+    assert OverdueNotice.query.count() == 5
+
+    again = list(overdue.scan(TODAY, chunk_size=2, restart=True, schedule=SCHEDULE))
+    assert sum(page.scanned for page in again) == 5
+    assert sum(page.written for page in again) == 0
+    assert OverdueNotice.query.count() == 5
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Partition maintenance tests."""
+import datetime as dt
+
+import pytest
+
+from blockflix.store import partitions
+from blockflix.store.models import Payment, PaymentArchive, User
+from blockflix.store.partitions import add_months, partition_definitions, partition_name
+
+
+def test_add_months_crosses_years():
+    """Adding and subtracting months wraps around the year."""
+    assert add_months(dt.date(2017, 11, 1), 3) == dt.date(2018, 2, 1)
+    assert add_months(dt.date(2017, 1, 1), -1) == dt.date(2016, 12, 1)
+    assert add_months(dt.date(2017, 1, 1), -24) == dt.date(2015, 1, 1)
+
+
+def test_partition_name():
+    """Partitions are named after their month."""
+    assert partition_name(dt.date(2017, 3, 1)) == 'p201703'
+
+
+def test_partition_definitions_end_with_catch_all():
+    """One partition per month bounded by the next month, then pmax."""
+    clauses = partition_definitions(dt.date(2017, 12, 1), dt.date(2018, 1, 1))
+    assert clauses == [
+        "PARTITION p201712 VALUES LESS THAN ('2018-01-01')",
+        "PARTITION p201801 VALUES LESS THAN ('2018-02-01')",
+        'PARTITION pmax VALUES LESS THAN (MAXVALUE)',
+    ]
+
+
+class RecordingConnection(object):
+    """Stands in for a connection, recording the statements run on it."""
+
+    def __init__(self, tables=()):
+        """Create instance."""
+        self.tables = set(tables)
+        self.statements = []
+        self.dialect = self
+
+    def has_table(self, connection, table):
+        """Whether a table exists."""
+        return table in self.tables
+
+    def run(self, sql):
+        """Record a statement."""
+        self.statements.append(sql)
+
+
+def test_archive_partition_locks_only_the_final_copy():
+    """The bulk copy reads the swapped-out staging table; rows written since are copied under the lock."""
+    connection = RecordingConnection()
+    partitions.archive_partition(connection, 'payments', 'p201501', connection.run)
+    statements = connection.statements
+    assert statements[:3] == [
+        'CREATE TABLE payments_archiving LIKE payments',
+        'ALTER TABLE payments_archiving REMOVE PARTITIONING',
+        'ALTER TABLE payments EXCHANGE PARTITION p201501 WITH TABLE payments_archiving',
+    ]
+    assert statements[3].startswith('INSERT IGNORE INTO payments_archive (')
+    assert statements[3].endswith('FROM payments_archiving')
+    assert statements[4] == 'LOCK TABLES payments WRITE, payments_archive WRITE'
+    assert statements[5].endswith('FROM payments PARTITION (p201501)')
+    assert statements[6:] == ['ALTER TABLE payments DROP PARTITION p201501', 'UNLOCK TABLES',
+                              'DROP TABLE payments_archiving']
+
+
+def test_archive_partition_recovers_staged_rows():
+    """Rows left in the staging table by an interrupted run are archived before it is recreated."""
+    connection = RecordingConnection(tables=['rentals_archiving'])
+    partitions.archive_partition(connection, 'rentals', 'p201501', connection.run)
+    assert connection.statements[0].endswith('FROM rentals_archiving')
+    assert connection.statements[1:3] == ['DROP TABLE rentals_archiving',
+                                          'CREATE TABLE rentals_archiving LIKE rentals']
+
+
+def test_archive_partition_unlocks_on_failure():
+    """The write lock is released even when dropping the partition fails."""
+    connection = RecordingConnection()
+
+    def run(sql):
+        connection.run(sql)
+        if 'DROP PARTITION' in sql:
+            raise RuntimeError('Lock wait timeout')
+
+    with pytest.raises(RuntimeError):
+        partitions.archive_partition(connection, 'payments', 'p201501', run)
+    assert connection.statements[-1] == 'UNLOCK TABLES'
+
+
+def partition_payments(db, first_month, last_month):
+    """Partition the test database's payments by month, as the migration does."""
+    for (name,) in db.session.execute(
+            'SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE() '
+            'AND TABLE_NAME = :table AND REFERENCED_TABLE_NAME IS NOT NULL', {'table': 'payments'}):
+        db.session.execute('ALTER TABLE payments DROP FOREIGN KEY {0}'.format(name))
+    db.session.execute('ALTER TABLE payments DROP PRIMARY KEY, ADD PRIMARY KEY (id, payment_date)')
+    db.session.execute('ALTER TABLE payments PARTITION BY RANGE COLUMNS(payment_date) ({0})'.format(
+        ', '.join(partition_definitions(first_month, last_month))))
+
+
+def test_maintain_archives_expired_partitions(db):
+    """Expired months move into the archive, and their partitions are dropped."""
+    user = User.create(username='archived', email='archived@example.com', first_name='Ar', last_name='Chived',
+                       active=True)
+    for month in (1, 2, 3):
+        Payment.create(user_id=user.id, amount=9.99, payment_date=dt.datetime(2017, month, 10))
+    partition_payments(db, dt.date(2017, 1, 1), dt.date(2017, 3, 1))
+    db.session.commit()
+
+    actions = list(partitions.maintain(retention_months=1, months_ahead=0, today=dt.date(2017, 4, 15)))
+    assert ('payments', 'archived p201701 into payments_archive') in actions
+    assert ('payments', 'archived p201702 into payments_archive') in actions
+    assert [partition.name for partition in partitions.list_partitions(db.session.connection(), 'payments')] == \
+        ['p201703', 'p201704']
+    assert sorted(payment.payment_date.month for payment in PaymentArchive.query) == [1, 2]
+    assert [payment.payment_date.month for payment in Payment.query] == [3]
+    assert not db.engine.dialect.has_table(db.session.connection(), 'payments_archiving')
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Film popularity tests."""
+import datetime as dt
+
+import pytest
+
+from blockflix.store import popularity
+from blockflix.store.models import Film, Rental, User
+
+NOW = dt.datetime(2017, 6, 1)
+
+
+def test_decay_rate():
+    """A rental's weight halves every half-life."""
+    rate = popularity.decay_rate(14)
+    assert rate * 14 * 86400 == pytest.approx(0.6931, abs=1e-4)
+
+
+@pytest.fixture
+def catalogue(app, db):
+    """Three films: popular on TMDB, rented lately, and rented long ago."""
+    app.config.update(POPULARITY_HALF_LIFE_DAYS=14, POPULARITY_PRIOR_WEIGHT=1.0, POPULARITY_DEMAND_WEIGHT=1.0)
+    user = User.create(username='fan', email='fan@example.com', first_name='Fan', last_name='Atic', active=True)
+    films = [Film.create(title=title, description=title, tmdb_popularity=prior, popularity=prior)
+             for title, prior in (('Acclaimed', 10.0), ('Trending', 1.0), ('Forgotten', 1.0))]
+    rent(user, films[1], NOW - dt.timedelta(days=1), 20)
+    rent(user, films[2], NOW - dt.timedelta(days=140), 20)
+    return user, films
+
+
+def rent(user, film, when, times):
+    """Record rentals of a film."""
+    for _ in range(times):
+        Rental.create(user_id=user.id, film_id=film.id, rental_date=when, return_date=when)
+
+
+def popularities():
+    """Each film's popularity, by title."""
+    return dict(Film.query.with_entities(Film.title, Film.popularity))
+
+
+def test_demand_outweighs_prior(db, catalogue):
+    """Recent rentals lift a film past TMDB's favourite; old ones have decayed away."""
+    result = popularity.refresh(now=NOW)
+    assert result.films_rented == 2
+    scores = popularities()
+    assert scores['Trending'] == pytest.approx(1 + 20 * 0.5 ** (1 / 14.0), rel=1e-3)
+    assert scores['Forgotten'] == pytest.approx(1 + 20 * 0.5 ** 10, rel=1e-3)
+    assert scores['Acclaimed'] == pytest.approx(10)
+
+
+def test_incremental_matches_rebuild(db, catalogue):
+    """Refreshing with only the new rentals gives the same scores as recomputing from all of them."""
+    user, films = catalogue
+    popularity.refresh(now=NOW)
+    rent(user, films[0], NOW + dt.timedelta(days=3), 5)
+    later = NOW + dt.timedelta(days=7)
+    assert popularity.refresh(now=later).films_rented == 1
+    incremental = popularities()
+    popularity.refresh(now=later, rebuild=True)
+    for title, score in popularities().items():
+        assert incremental[title] == pytest.approx(score, rel=1e-4)
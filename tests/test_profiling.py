@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Request profiler tests."""
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from blockflix.profiling import PROFILE_HEADER, Profiler, StackSampler, collapse, merge, write_stacks
+
+
+def busy(seconds):
+    """Keep the thread busy in a recognisable function."""
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+
+
+def profiled_app(tmpdir, sample_rate=0.0, token=None):
+    """A bare app with the profiler configured."""
+    app = Flask(__name__)
+    app.config.update(PROFILE_SAMPLE_RATE=sample_rate, PROFILE_TOKEN=token, PROFILE_DIR=str(tmpdir),
+                      PROFILE_INTERVAL=0.001)
+    profiler = Profiler(app)
+
+    @app.route('/slow')
+    def slow():
+        busy(0.05)
+        return 'done'
+    return app, profiler
+
+
+def test_collapse_is_outermost_first():
+    """The calling function comes before the called one."""
+    stack = collapse(sys._getframe())
+    assert stack.split(';')[-1].startswith('test_collapse_is_outermost_first (')
+
+
+def test_sampler_sees_busy_function():
+    """Sampling a busy thread records the function it is busy in."""
+    sampler = StackSampler(interval=0.001)
+    result = {}
+
+    def work():
+        sampler.start(threading.current_thread().ident)
+        busy(0.05)
+        result['stacks'] = sampler.stop(threading.current_thread().ident)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert sum(result['stacks'].values()) > 0
+    assert any(';busy (' in stack for stack in result['stacks'])
+
+
+def test_merge_sums_workers_and_prefixes_endpoints(tmpdir):
+    """Stacks written by several workers are summed per endpoint."""
+    write_stacks(str(tmpdir), 'films.films', {'a;b': 2})
+    tmpdir.join('films.films.1.folded').write('a;b 3\na;c 1\n')
+    tmpdir.join('actors.actors.1.folded').write('a;d 5\n')
+    assert merge(str(tmpdir)) == {'films.films;a;b': 5, 'films.films;a;c': 1, 'actors.actors;a;d': 5}
+    assert merge(str(tmpdir), ['actors.actors']) == {'actors.actors;a;d': 5}
+
+
+def test_off_registers_nothing(tmpdir):
+    """With profiling off, no request hooks are added."""
+    app, profiler = profiled_app(tmpdir)
+    assert 'profiler' not in app.extensions
+    assert not app.before_request_funcs
+    app.test_client().get('/slow')
+    assert not tmpdir.listdir()
+
+
+def test_sampled_request_written_per_endpoint(tmpdir):
+    """A sampled request's stacks land in its endpoint's file."""
+    app, profiler = profiled_app(tmpdir, sample_rate=1.0)
+    app.test_client().get('/slow')
+    stacks = merge(str(tmpdir))
+    assert stacks
+    assert all(stack.startswith('slow;') for stack in stacks)
+
+
+def test_token_header_forces_sampling(tmpdir):
+    """Only requests with the right token are sampled when the rate is zero."""
+    app, profiler = profiled_app(tmpdir, token='s3cret')
+    client = app.test_client()
+    client.get('/slow', headers={PROFILE_HEADER: 'wrong'})
+    assert not merge(str(tmpdir))
+    client.get('/slow', headers={PROFILE_HEADER: 's3cret'})
+    assert merge(str(tmpdir))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Query cache tests."""
+from sqlalchemy import text
+
+from blockflix.querycache import QueryCache, read_tables, written_table
+from blockflix.store.models import Film, FilmActor, Payment
+
+
+class TestWrittenTable:
+    """Recognising writes."""
+
+    def test_core_statements(self):
+        """Insert, update and delete constructs name their table."""
+        assert written_table(Film.__table__.insert()) == 'films'
+        assert written_table(Film.__table__.update().values(popularity=1)) == 'films'
+        assert written_table(Payment.__table__.delete()) == 'payments'
+
+    def test_raw_sql(self):
+        """Raw writes are matched by their leading keyword, with or without modifiers and quoting."""
+        assert written_table('INSERT IGNORE INTO payments_archive (id) SELECT id FROM payments') == 'payments_archive'
+        assert written_table(text('UPDATE `films` SET popularity = 0')) == 'films'
+        assert written_table('delete low_priority from rentals where id = 1') == 'rentals'
+        assert written_table('REPLACE INTO actors VALUES (1)') == 'actors'
+
+    def test_reads(self, app):
+        """Selects and DDL are not writes."""
+        assert written_table('SELECT * FROM films') is None
+        assert written_table(Film.query.statement) is None
+        assert written_table('ALTER TABLE rentals DROP PARTITION p201801') is None
+
+
+def test_read_tables_follows_joins(app):
+    """Every joined table counts as read."""
+    query = Film.query.join(FilmActor, FilmActor.film_id == Film.id).filter(FilmActor.actor_id == 1)
+    assert read_tables(query.statement) == {'films', 'films_actors'}
+
+
+class TestVersions:
+    """Table version tokens."""
+
+    def test_stable_until_invalidated(self, app):
+        """A table's version only changes when it is invalidated."""
+        query_cache = QueryCache()
+        versions = query_cache.versions(['films', 'actors'])
+        assert query_cache.versions(['films', 'actors']) == versions
+        query_cache.invalidate('films')
+        changed = query_cache.versions(['films', 'actors'])
+        assert changed['films'] != versions['films']
+        assert changed['actors'] == versions['actors']
+
+    def test_key_changes_with_versions(self, app):
+        """Invalidating a table a query reads gives it a new key."""
+        query_cache = QueryCache()
+        query = Film.query.filter(Film.popularity > 1)
+        key = query_cache.key(query, {'films'})
+        assert query_cache.key(query, {'films'}) == key
+        query_cache.invalidate('films')
+        assert query_cache.key(query, {'films'}) != key
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Rental checkout and return tests."""
+import datetime as dt
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from blockflix.database import is_retryable, retry_on_deadlock
+from blockflix.store import rentals, serializers
+from blockflix.store.models import Film, Rental, User
+
+
+class MySQLError(Exception):
+    """Stands in for a driver error carrying a MySQL error code."""
+
+
+def mysql_error(code):
+    """An OperationalError as SQLAlchemy raises it for a MySQL error code."""
+    return OperationalError('UPDATE users', {}, MySQLError(code, 'error {0}'.format(code)))
+
+
+class TestRetryOnDeadlock:
+    """Retrying deadlocked transactions."""
+
+    def test_retryable_errors(self):
+        """Deadlocks and lock wait timeouts are retried, other errors are not."""
+        assert is_retryable(mysql_error(1213))
+        assert is_retryable(mysql_error(1205))
+        assert not is_retryable(mysql_error(2006))
+
+    def test_retries_with_backoff(self, app):
+        """A deadlocked transaction is retried, waiting longer each time."""
+        calls, waits = [], []
+
+        def transaction():
+            calls.append(1)
+            if len(calls) < 3:
+                raise mysql_error(1213)
+            return 'committed'
+
+        assert retry_on_deadlock(transaction, backoff=0.1, sleep=waits.append) == 'committed'
+        assert len(calls) == 3
+        assert 0.05 <= waits[0] <= 0.15
+        assert 0.1 <= waits[1] <= 0.3
+
+    def test_gives_up(self, app):
+        """The error propagates once every attempt deadlocked."""
+        def transaction():
+            raise mysql_error(1213)
+
+        with pytest.raises(OperationalError):
+            retry_on_deadlock(transaction, attempts=3, sleep=lambda seconds: None)
+
+    def test_other_errors_are_not_retried(self, app):
+        """Errors other than deadlocks propagate at once."""
+        calls = []
+
+        def transaction():
+            calls.append(1)
+            raise rentals.RentalLimitReached()
+
+        with pytest.raises(rentals.RentalLimitReached):
+            retry_on_deadlock(transaction, sleep=lambda seconds: None)
+        assert len(calls) == 1
+
+
+def test_serialize_rental():
+    """A rental serializes with ISO datetimes, and no return date while open."""
+    rental = Rental(id=7, film_id=3, user_id=1, rental_date=dt.datetime(2017, 2, 1, 9, 30))
+    assert serializers.rental(rental) == {
+        'id': 7, 'film_id': 3, 'rental_date': '2017-02-01T09:30:00', 'return_date': None,
+    }
+
+
+@pytest.fixture
+def renter(db):
+    """A user and a film to rent, as ids."""
+    user = User.create(username='renter', email='renter@example.com', first_name='Ren', last_name='Ter',
+                       active=True)
+    film = Film.create(title='Rented', description='A film to rent')
+    return user.id, film.id
+
+
+def run_concurrently(app, db, func, threads=20):
+    """Call func from many threads at once, each with its own session; returns their outcomes."""
+    outcomes = []
+    start = threading.Barrier(threads)
+
+    def worker():
+        with app.app_context():
+            start.wait()
+            try:
+                outcomes.append(func())
+            except rentals.RentalLimitReached:
+                outcomes.append('limit')
+            except rentals.AlreadyReturned:
+                outcomes.append('returned already')
+            finally:
+                db.session.remove()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return outcomes
+
+
+class TestRentals:
+    """Checkout and return under concurrency."""
+
+    def test_concurrent_checkouts_rent_once(self, app, db, renter):
+        """Of many simultaneous checkouts by one user, exactly one succeeds."""
+        user_id, film_id = renter
+        outcomes = run_concurrently(app, db, lambda: rentals.checkout(user_id, film_id, limit=1) and 'rented')
+        assert outcomes.count('rented') == 1
+        assert outcomes.count('limit') == 19
+        assert Rental.query.filter(Rental.user_id == user_id, Rental.return_date.is_(None)).count() == 1
+
+    def test_concurrent_returns_return_once(self, app, db, renter):
+        """Of many simultaneous returns of one rental, exactly one succeeds."""
+        user_id, film_id = renter
+        rental_id = rentals.checkout(user_id, film_id, limit=1).id
+        outcomes = run_concurrently(app, db, lambda: rentals.return_film(user_id, rental_id) and 'returned')
+        assert outcomes.count('returned') == 1
+        assert outcomes.count('returned already') == 19
+
+    def test_rent_again_after_return(self, db, renter):
+        """Returning a film frees the user to rent another."""
+        user_id, film_id = renter
+        rental = rentals.checkout(user_id, film_id, limit=1)
+        with pytest.raises(rentals.RentalLimitReached):
+            rentals.checkout(user_id, film_id, limit=1)
+        rentals.return_film(user_id, rental.id)
+        assert rentals.checkout(user_id, film_id, limit=1).return_date is None
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Serve-stale and circuit breaker tests."""
+import time
+
+import pytest
+
+from blockflix.cache import LRUCache
+from blockflix.resilience import CircuitBreaker, CircuitOpenError, ServeStale
+
+
+class FakeClock(object):
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        """Create instance."""
+        self.now = 1000.0
+
+    def __call__(self):
+        """The current time."""
+        return self.now
+
+
+class SlowDatabase(object):
+    """Stands in for a query, taking ``delay`` seconds and failing while ``down``."""
+
+    def __init__(self, delay=0.0):
+        """Create instance."""
+        self.delay = delay
+        self.down = False
+        self.calls = 0
+
+    def __call__(self):
+        """Run the query."""
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise RuntimeError('Lost connection to MySQL server during query')
+        return ['film {0}'.format(self.calls)]
+
+
+def wait_for_refreshes(serve_stale):
+    """Let background refreshes finish."""
+    for thread in list(serve_stale._refreshing.values()):
+        thread.join()
+
+
+def age(serve_stale, key, seconds):
+    """Make a stored result ``seconds`` older."""
+    stored = serve_stale.backend.get(serve_stale.prefix + key)
+    serve_stale.backend.set(serve_stale.prefix + key, stored._replace(computed_at=stored.computed_at - seconds))
+
+
+class TestCircuitBreaker:
+    """Circuit breaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Failures in a row open the breaker; a success in between resets the count."""
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+        breaker.record(0.1, failed=True)
+        breaker.record(0.1)
+        breaker.record(0.1, failed=True)
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record(0.1, failed=True)
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: 1)
+
+    def test_slow_calls_count_as_failures(self):
+        """Calls slower than the latency threshold open the breaker too."""
+        breaker = CircuitBreaker(failure_threshold=1, latency_threshold=2.0, clock=FakeClock())
+        breaker.record(2.5)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_half_open_lets_one_trial_through(self):
+        """After the reset timeout a single call is tried, and its success closes the breaker."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record(0.1, failed=True)
+        clock.now += 30
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_reopens(self):
+        """A failed trial call opens the breaker for another reset timeout."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+        for _ in range(3):
+            breaker.record(0.1, failed=True)
+        clock.now += 30
+        assert breaker.allow()
+        breaker.record(0.1, failed=True)
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestServeStale:
+    """Serving stale results."""
+
+    def test_stale_result_served_without_waiting(self):
+        """Once a result is past its freshness, it is served at once while it is refreshed."""
+        database = SlowDatabase()
+        serve_stale = ServeStale(backend=LRUCache())
+        assert serve_stale.get('films', database) == ['film 1']
+        age(serve_stale, 'films', serve_stale.fresh_for)
+
+        database.delay = 0.5
+        start = time.time()
+        assert serve_stale.get('films', database) == ['film 1']
+        assert serve_stale.get('films', database) == ['film 1']
+        assert time.time() - start < 0.25
+        wait_for_refreshes(serve_stale)
+        assert database.calls == 2
+        assert serve_stale.get('films', database) == ['film 2']
+        assert serve_stale.stats()['stale_served'] == 2
+
+    def test_failed_refresh_keeps_last_good_result(self):
+        """A refresh that fails leaves the previous result in place."""
+        database = SlowDatabase()
+        serve_stale = ServeStale(backend=LRUCache())
+        serve_stale.get('films', database)
+        age(serve_stale, 'films', serve_stale.fresh_for)
+        database.down = True
+        assert serve_stale.get('films', database) == ['film 1']
+        wait_for_refreshes(serve_stale)
+        assert serve_stale.backend.get(serve_stale.prefix + 'films').value == ['film 1']
+        assert serve_stale.breaker.failures == 1
+
+    def test_open_breaker_serves_stale_without_querying(self):
+        """While the breaker is open, stale results are served and nothing is refreshed."""
+        database = SlowDatabase()
+        serve_stale = ServeStale(backend=LRUCache())
+        serve_stale.breaker = CircuitBreaker(failure_threshold=1)
+        serve_stale.get('films', database)
+        age(serve_stale, 'films', serve_stale.fresh_for)
+        serve_stale.breaker.record(0.1, failed=True)
+        assert serve_stale.get('films', database) == ['film 1']
+        wait_for_refreshes(serve_stale)
+        assert database.calls == 1
+
+    def test_open_breaker_rejects_when_nothing_to_serve(self):
+        """Without a result to serve, an open breaker turns requests away instead of querying."""
+        database = SlowDatabase()
+        serve_stale = ServeStale(backend=LRUCache())
+        serve_stale.breaker = CircuitBreaker(failure_threshold=1)
+        serve_stale.breaker.record(0.1, failed=True)
+        with pytest.raises(CircuitOpenError):
+            serve_stale.get('films', database)
+        assert database.calls == 0
+        assert serve_stale.stats()['rejected'] == 1
+
+    def test_too_old_result_waits_for_the_database(self):
+        """A result older than the maximum staleness is recomputed before answering."""
+        database = SlowDatabase()
+        serve_stale = ServeStale(backend=LRUCache())
+        serve_stale.get('films', database)
+        age(serve_stale, 'films', serve_stale.max_age)
+        assert serve_stale.get('films', database) == ['film 2']
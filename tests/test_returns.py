@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Batch return tests."""
+import datetime as dt
+
+import pytest
+
+from blockflix.store import returns
+from blockflix.store.models import Film, Rental, User
+
+RENTED = dt.datetime(2017, 1, 1)
+RETURNED = dt.datetime(2017, 2, 1)
+
+
+class TestParseScan:
+    """Reading scans from JSON or CSV records."""
+
+    def test_by_rental_id(self):
+        """A scan may name the rental, with its id as a string or a number."""
+        assert returns.parse_scan({'rental_id': '7', 'return_date': '2017-02-01T10:30:00'}) == \
+            returns.Scan(7, None, None, dt.datetime(2017, 2, 1, 10, 30))
+        assert returns.parse_scan({'rental_id': 7, 'return_date': '2017-02-01'}).rental_id == 7
+
+    def test_by_user_and_film(self):
+        """A scan may name the user and film instead; CSV leaves the rental id empty."""
+        scan = returns.parse_scan({'rental_id': '', 'user_id': '3', 'film_id': '5', 'return_date': ''},
+                                  now=RETURNED)
+        assert scan == returns.Scan(None, 3, 5, RETURNED)
+
+    def test_invalid(self):
+        """Scans naming no rental, or with a malformed date, are refused."""
+        with pytest.raises(ValueError):
+            returns.parse_scan({'user_id': '3'})
+        with pytest.raises(ValueError):
+            returns.parse_scan({'rental_id': 'x'})
+        with pytest.raises(ValueError):
+            returns.parse_scan({'rental_id': 1, 'return_date': '01/02/2017'})
+
+
+def test_chunked():
+    """Items are split into chunks of at most the given size."""
+    assert list(returns.chunked(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.fixture
+def rentals(db):
+    """Three users each renting a film; the third has returned it already."""
+    film = Film.create(title='Rented', description='A film to rent')
+    rentals = []
+    for index in range(3):
+        user = User.create(username='renter{0}'.format(index), email='renter{0}@example.com'.format(index),
+                           first_name='Ren', last_name='Ter', active=True)
+        rentals.append(Rental.create(user_id=user.id, film_id=film.id, rental_date=RENTED,
+                                     return_date=RETURNED if index == 2 else None))
+    return rentals
+
+
+def test_process(db, rentals):
+    """Open rentals are returned; repeated, returned and unknown ones are reported."""
+    first, second, returned = rentals
+    scans = [
+        returns.Scan(first.id, None, None, RETURNED),
+        returns.Scan(first.id, None, None, RETURNED),
+        returns.Scan(None, second.user_id, second.film_id, RETURNED),
+        returns.Scan(returned.id, None, None, RETURNED),
+        returns.Scan(None, returned.user_id, returned.film_id, RETURNED),
+        returns.Scan(returned.id + 1000, None, None, RETURNED),
+    ]
+    outcomes = list(returns.process(scans, chunk_size=4))
+    assert [outcome.status for outcome in outcomes] == [
+        returns.RETURNED, returns.ALREADY_RETURNED, returns.RETURNED,
+        returns.ALREADY_RETURNED, returns.ALREADY_RETURNED, returns.NOT_FOUND,
+    ]
+    assert outcomes[2].rental_id == second.id
+    db.session.expire_all()
+    assert Rental.query.filter(Rental.return_date.is_(None)).count() == 0
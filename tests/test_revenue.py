@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Monthly revenue rollup tests."""
+import datetime as dt
+
+import pytest
+
+from blockflix.store import revenue, serializers
+from blockflix.store.models import Payment, PaymentArchive, PaymentMonthly, User
+
+
+def test_month_of():
+    """Dates and datetimes roll up into the first of their month."""
+    assert revenue.month_of(dt.datetime(2017, 2, 28, 23, 59)) == dt.date(2017, 2, 1)
+    assert revenue.month_of(dt.date(2017, 12, 1)) == dt.date(2017, 12, 1)
+
+
+def test_serializer():
+    """Months are named by year and month, and amounts rounded to the cent."""
+    rows = [(dt.date(2017, 3, 1), 1000.004, 100, 80, 20, 60, 12.50049), (dt.date(2017, 4, 1), 0.0, 0, 0, 0, 0, None)]
+    march, april = serializers.revenue(rows)
+    assert (march['month'], march['amount'], march['arpu']) == ('2017-03', 1000.0, 12.5)
+    assert (march['new_payers'], march['returning_payers']) == (20, 60)
+    assert (april['month'], april['arpu']) == ('2017-04', None)
+
+
+def pay(user, month, amount=9.99):
+    """Record a user's payment on the first of a month."""
+    Payment.create(user_id=user.id, payment_date=dt.datetime(2017, month, 1), amount=amount)
+
+
+def rollup():
+    """Each month's (payments, payers, new payers), as read from the rollup."""
+    return [(row.month.month, row.payments, row.payers, row.new_payers) for row in revenue.months()]
+
+
+@pytest.fixture
+def subscribers(db):
+    """Three subscribers, one of them with an archived payment from before the first month."""
+    users = [User.create(username='payer{0}'.format(index), email='payer{0}@example.com'.format(index),
+                         first_name='Pay', last_name='Er', active=True) for index in range(3)]
+    db.session.add(PaymentArchive(id=1000000, user_id=users[2].id, amount=9.99,
+                                  payment_date=dt.datetime(2016, 12, 1), last_update=dt.datetime(2016, 12, 1)))
+    db.session.commit()
+    pay(users[0], 1)
+    pay(users[0], 2)
+    pay(users[1], 2)
+    pay(users[2], 2)
+    return users
+
+
+def test_refresh(db, subscribers):
+    """Payers are new in the month of their first payment, archived ones included."""
+    result = revenue.refresh()
+    assert (result.first_month, result.months) == (None, 3)
+    assert rollup() == [(12, 1, 1, 1), (1, 1, 1, 1), (2, 3, 3, 1)]
+    february = PaymentMonthly.query.get(dt.date(2017, 2, 1))
+    assert february.amount == pytest.approx(3 * 9.99)
+
+
+def test_refresh_is_incremental(db, subscribers):
+    """A refresh rolls up only the months from the earliest new payment's, and matches a rebuild."""
+    revenue.refresh()
+    pay(subscribers[1], 3)
+    result = revenue.refresh()
+    assert (result.first_month, result.months) == (dt.date(2017, 3, 1), 1)
+    assert revenue.refresh().months == 0
+
+    # A backdated first payment makes the subscriber a returning one in later months
+    pay(subscribers[1], 1)
+    result = revenue.refresh()
+    assert (result.first_month, result.months) == (dt.date(2017, 1, 1), 3)
+    incremental = rollup()
+    assert incremental == [(12, 1, 1, 1), (1, 2, 2, 2), (2, 3, 3, 0), (3, 1, 1, 0)]
+    revenue.refresh(rebuild=True)
+    assert rollup() == incremental
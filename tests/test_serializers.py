@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Serializer tests."""
+import datetime as dt
+import json
+
+import pytest
+
+from blockflix.serializers import BACKENDS, RowSerializer, dumps, format_dates, json_response
+from blockflix.store import serializers
+from blockflix.store.models import Film
+
+
+def test_format_dates():
+    """Dates and datetimes come out as ISO days, missing ones as empty strings."""
+    values = [dt.date(2017, 3, 1), None, dt.datetime(2017, 3, 1, 23, 59), dt.datetime(2018, 1, 2, 8, 0)]
+    assert format_dates(values) == ['2017-03-01', '', '2017-03-01', '2018-01-02']
+    assert format_dates(values, fmt='%d/%m/%Y %H:%M', missing=None) == [
+        '01/03/2017 00:00', None, '01/03/2017 23:59', '02/01/2018 08:00']
+
+
+class TestRowSerializer:
+    """Row serializers."""
+
+    def test_matches_to_dict(self):
+        """A film row serializes like Film.to_dict, plus its rental counters (none for a film never rented)."""
+        film = Film(title='Alien', description='In space', release_date=dt.date(1979, 5, 25), length=117,
+                    popularity=9.5)
+        row = tuple(getattr(film, column.key) if column.class_ is Film else None
+                    for column in serializers.films.columns)
+        assert serializers.films([row]) == [dict(film.to_dict(), active_rentals=0, last_rented='')]
+
+    def test_extra_keys_and_empty(self):
+        """Extra keys are added to every dict; no rows give an empty list."""
+        serializer = RowSerializer(('a', None), ('b', None, lambda values: [value * 2 for value in values]))
+        assert serializer([(1, 2), (3, 4)], user='Ann') == [{'a': 1, 'b': 4, 'user': 'Ann'},
+                                                            {'a': 3, 'b': 8, 'user': 'Ann'}]
+        assert serializer([]) == []
+
+
+class TestDumps:
+    """JSON encoding."""
+
+    @pytest.mark.parametrize('backend', [name for name, encoder in BACKENDS.items() if encoder is not None])
+    def test_backends_agree(self, backend):
+        """Every installed backend encodes to the same JSON."""
+        data = {'data': [{'title': u'Amélie', 'popularity': 7.5, 'length': 122, 'url': 'a/b'}]}
+        assert json.loads(dumps(data, backend).decode('utf-8')) == data
+
+    def test_unknown_backend(self):
+        """Asking for a backend that isn't installed is an error."""
+        with pytest.raises(ValueError):
+            dumps({}, 'simdjson')
+
+    def test_json_response(self, app):
+        """Responses are JSON, like jsonify's."""
+        response = json_response({'data': []})
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data(as_text=True)) == {'data': []}
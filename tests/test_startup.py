@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""App import time and memory budget tests."""
+import json
+import os
+import subprocess
+import sys
+
+#: Seconds importing the app and creating it may take; override with BLOCKFLIX_IMPORT_BUDGET
+IMPORT_BUDGET = float(os.environ.get('BLOCKFLIX_IMPORT_BUDGET', 1.5))
+
+#: Modules only the seed and analytics commands need, which workers must not import
+HEAVY_MODULES = ('pandas', 'numpy', 'scipy', 'sklearn', 'faker', 'tqdm', 'pyarrow')
+
+STARTUP = """
+import json, resource, sys, time
+start = time.time()
+from blockflix.app import create_app
+from blockflix.settings import TestConfig
+create_app(TestConfig)
+print(json.dumps({
+    'seconds': time.time() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': sorted(name for name in %r if name in sys.modules),
+}))
+""" % (HEAVY_MODULES,)
+
+
+def start_app():
+    """Import and create the app in a fresh interpreter, as a worker does."""
+    return json.loads(subprocess.check_output([sys.executable, '-c', STARTUP]).decode('utf-8'))
+
+
+def test_app_startup_within_budget():
+    """Workers boot without heavy imports and within the time budget."""
+    startup = start_app()
+    report = 'create_app took {seconds:.3f}s, max RSS {max_rss_kb} kB'.format(**startup)
+    assert startup['heavy'] == [], report
+    assert startup['seconds'] < IMPORT_BUDGET, report
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Cache warm-up tests."""
+import time
+from collections import OrderedDict
+
+import pytest
+
+from blockflix import warmup
+
+
+@pytest.fixture
+def warmers(monkeypatch):
+    """An empty registry of cached listings."""
+    registry = OrderedDict()
+    monkeypatch.setattr(warmup, 'WARMERS', registry)
+    return registry
+
+
+def slow(value, delay=0.2):
+    """A listing taking ``delay`` seconds to compute."""
+    def compute():
+        time.sleep(delay)
+        return value
+    return compute
+
+
+def test_warmed_serves_from_cache(app, warmers):
+    """A warmed listing is computed once, then served from the cache."""
+    calls = []
+    listing = warmup.warmed('test:listing')(lambda: calls.append(1) or ['film'])
+    assert listing.key in warmers
+    assert listing() == ['film']
+    assert listing() == ['film']
+    assert len(calls) == 1
+
+
+def test_warm_runs_in_parallel(app, warmers):
+    """Listings are warmed concurrently and reported with their timings."""
+    for key in ('a', 'b', 'c'):
+        warmup.warmed(key)(slow(key))
+    start = time.time()
+    results = list(warmup.warm(concurrency=3))
+    assert time.time() - start < 0.5
+    assert sorted(result.key for result in results) == ['a', 'b', 'c']
+    assert all(result.error is None and result.seconds >= 0.2 for result in results)
+    assert warmup.WARMERS['a']() == 'a'
+
+
+def test_warm_reports_failures(app, warmers):
+    """A listing failing to warm is reported, the others still warm."""
+    def broken():
+        raise RuntimeError('MySQL server has gone away')
+    warmup.warmed('broken')(broken)
+    warmup.warmed('fine')(slow('fine', 0))
+    results = dict((result.key, result) for result in warmup.warm())
+    assert isinstance(results['broken'].error, RuntimeError)
+    assert results['fine'].error is None
+
+
+def test_warm_unknown_key(app, warmers):
+    """Warming a key nobody registered is an error."""
+    with pytest.raises(KeyError):
+        list(warmup.warm(['nope']))
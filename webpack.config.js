@@ -4,6 +4,8 @@ const webpack = require('webpack');
 /*
  * Webpack Plugins
  */
+const BrotliPlugin = require('brotli-webpack-plugin');
+const CompressionPlugin = require('compression-webpack-plugin');
 const ExtractTextPlugin = require('extract-text-webpack-plugin');
 const ManifestRevisionPlugin = require('manifest-revision-webpack-plugin');
 
@@ -15,6 +17,9 @@ const publicHost = debug ? 'http://localhost:2992' : '';
 
 const rootAssetPath = path.join(__dirname, 'assets');
 
+// Built assets worth precompressing
+const compressible = /\.(js|css|map|svg|eot|ttf|html)$/;
+
 module.exports = {
   // configuration
   context: __dirname,
@@ -64,5 +69,8 @@ module.exports = {
         NODE_ENV: JSON.stringify('production'),
       }
     }),
+    // Precompressed siblings, served by blockflix.compression.FingerprintedStatic
+    new CompressionPlugin({ asset: '[path].gz[query]', algorithm: 'gzip', test: compressible, threshold: 1024 }),
+    new BrotliPlugin({ asset: '[path].br[query]', test: compressible, threshold: 1024 }),
   ]),
 };